@@ -76,9 +76,10 @@ gtpyhop.declare_actions(putv,getv)
 ###############################################################################
 # Running the examples
 
-print('-----------------------------------------------------------------------')
-print(f"Created the domain '{domain_name}'. To run the examples, type this:")
-print(f"{domain_name}.main()")
+if not gtpyhop.quiet:
+    print('-----------------------------------------------------------------------')
+    print(f"Created the domain '{domain_name}'. To run the examples, type this:")
+    print(f"{domain_name}.main()")
 
 def main(do_pauses=True):
     """
@@ -19,9 +19,10 @@ the_domain = gtpyhop.Domain(__package__)
 from .methods import *
 from .actions import *
 
-print('-----------------------------------------------------------------------')
-print(f"Created '{gtpyhop.current_domain}'. To run the examples, type this:")
-print(f'{the_domain.__name__}.main()')
+if not gtpyhop.quiet:
+    print('-----------------------------------------------------------------------')
+    print(f"Created '{gtpyhop.current_domain}'. To run the examples, type this:")
+    print(f'{the_domain.__name__}.main()')
 
 
 #############     beginning of tests     ################
@@ -4,7 +4,6 @@ The tester scipt for all the block world problems
 """
 
 import gtpyhop
-import time
 import os
 
 the_domain = gtpyhop.Domain(__package__)
@@ -12,13 +11,14 @@ the_domain = gtpyhop.Domain(__package__)
 from .methods import *
 from .actions import *
 
-def run_pddl(lines):
+def read_pddl(lines):
+    """
+    Read the lines of a BWD problem file, and return the initial state
+    and the goal.
+    """
     init = False
     goal = False
 
-    # Setting the first run flag in methods for this run.
-    setFirstRun()
-
     # Creating the gtpyhop initial and goal states.
     initial_state = gtpyhop.State('initial_state')
     goal_state = gtpyhop.Multigoal('goal_state')
@@ -73,24 +73,34 @@ def run_pddl(lines):
     # initial_state.display('The initial state')
     # goal_state.display('The Goal state')
 
+    return initial_state, goal_state
+
+def run_pddl(lines, method_stats=None):
+    """
+    Plan for the problem in the lines of a BWD problem file. If method_stats
+    (a gtpyhop.MethodStats) is given, use it to learn the method ordering.
+    """
+    initial_state, goal_state = read_pddl(lines)
+
     # Running the HTN planner.
     gtpyhop.verbose = 1
 
-    start_time = time.time()
-    plan = gtpyhop.find_plan(initial_state, [('achieve', goal_state)])
-    end_time = time.time()
-
-    node_count = getNodeCount()
+    result = gtpyhop.find_plan(initial_state, [('achieve', goal_state)], \
+                               return_result=True, method_stats=method_stats)
     
     # Resetting the states for the next run.
     del initial_state
     del goal_state
 
-    return plan, (end_time - start_time), node_count
+    return result.plan, result.elapsed, result.nodes_expanded
 
-def multi_test():
+def multi_test(workers=None, time_limit=None, method_stats=None):
     """
     Running all the test cases for the BWD.
+    If workers is given, plan for all of the problems at once, in that many
+    worker processes, with a time limit of time_limit seconds for each.
+    Otherwise plan for them one at a time; if method_stats is given, the
+    method ordering it learns from each problem is used for the next one.
     """
     print(f'\n---------------------------------------------------------')
     print(f'Running the {the_domain.__name__} domain')
@@ -120,6 +130,19 @@ def multi_test():
     problem_list = os.listdir(problems_path)
     problem_list.sort()
 
+    # Planning for all the problems in parallel, if asked to.
+    if workers:
+        names = [x for x in problem_list if 'problem' in x]
+        problems = []
+        for x in names:
+            with open(problems_path + '/' + x, 'r') as pddl_file:
+                initial_state, goal_state = read_pddl(pddl_file.readlines())
+            problems.append((initial_state, [('achieve', goal_state)]))
+        results = {}
+        for i, result in gtpyhop.find_plans(problems, workers=workers, \
+                                            domain=the_domain, time_limit=time_limit):
+            results[names[i]] = result.plan, result.elapsed, result.nodes_expanded
+
     for x in problem_list:
         if 'problem' in x:
 
@@ -135,7 +158,10 @@ def multi_test():
             lines = pddl_file.readlines()
 
             # Run the read pddl file.
-            plan, duration, node_count = run_pddl(lines)
+            if workers:
+                plan, duration, node_count = results[x]
+            else:
+                plan, duration, node_count = run_pddl(lines, method_stats=method_stats)
 
             # Printing to the report file.
             if plan:
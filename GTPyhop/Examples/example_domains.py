@@ -0,0 +1,25 @@
+"""
+Registers the example domains with gtpyhop.register_domain, without
+importing them, so that a program can get any of them by name and pay the
+cost of importing only the ones it uses. For example:
+    import example_domains
+    domain = gtpyhop.get_domain('satellite_htn')
+pyhop_simple_travel_example isn't registered, because importing it runs
+its examples.
+"""
+
+# kludge to make gtpyhop available regardless of whether the current directory
+# is the Examples directory or its parent (where gtpyhop.py is located)
+#
+import sys
+sys.path.append('../')
+import gtpyhop
+
+
+domain_names = ['simple_htn', 'simple_hgn', 'simple_htn_acting_error', \
+                'backtracking_htn', 'logistics_hgn', 'blocks_gtn', 'blocks_htn', \
+                'blocks_hgn', 'blocks_goal_splitting', 'satellite_htn']
+"""The names of the example domains, which are also the names of their modules."""
+
+for domain_name in domain_names:
+    gtpyhop.register_domain(domain_name, domain_name)
@@ -0,0 +1,141 @@
+"""
+A benchmark comparing the goal orderings that m_split_multigoal can use (see
+gtpyhop.goal_ordering) on the multigoals of the blocks_goal_splitting
+examples, and on some logistics_hgn multigoals. For each problem and
+ordering, it prints the number of search nodes and the length of the plan.
+
+logistics_hgn has no multigoal methods of its own, so the benchmark plans
+with a copy of it in which m_split_multigoal has been declared.
+
+To run it, go to the Examples directory, launch Python 3, and type:
+    import goal_ordering_benchmark
+    goal_ordering_benchmark.goal_ordering_benchmark()
+"""
+
+# kludge to make gtpyhop available regardless of whether the current directory
+# is the Examples directory or its parent (where gtpyhop.py is located)
+#
+import sys
+sys.path.append('../')
+import gtpyhop
+
+import blocks_goal_splitting
+import logistics_hgn
+
+
+def blocks_problems():
+    """Return a list of (name, state, multigoal) for blocks_goal_splitting."""
+    state1 = gtpyhop.State('state1')
+    state1.pos={'a':'b', 'b':'table', 'c':'table'}
+    state1.clear={'c':True, 'b':False,'a':True}
+    state1.holding={'hand':False}
+
+    goal1a = gtpyhop.Multigoal('goal1a')
+    goal1a.pos={'c':'b', 'b':'a', 'a':'table'}
+
+    sus_s0 = gtpyhop.State('sussman')
+    sus_s0.pos={'a':'table', 'b':'table', 'c':'a'}
+    sus_s0.clear={'a':False,'b':True, 'c':True}
+    sus_s0.holding={'hand':False}
+
+    sus_sg = gtpyhop.Multigoal('sussman_goal')
+    sus_sg.pos={'a':'b', 'b':'c'}
+
+    state2 = gtpyhop.State('state2')
+    state2.pos={'a':'c', 'b':'d', 'c':'table', 'd':'table'}
+    state2.clear={'a':True, 'c':False,'b':True, 'd':False}
+    state2.holding={'hand':False}
+
+    goal2a = gtpyhop.Multigoal('goal2a')
+    goal2a.pos={'b':'c', 'a':'d', 'c':'table', 'd':'table'}
+    goal2a.clear={'a':True, 'c':False,'b':True, 'd':False}
+    goal2a.holding={'hand':False}
+
+    state3 = gtpyhop.State('bw_large_d')
+    state3.pos = {1:12, 12:13, 13:'table', 11:10, 10:5, 5:4, 4:14, 14:15, 15:'table', 9:8, 8:7, 7:6, 6:'table', 19:18, 18:17, 17:16, 16:3, 3:2, 2:'table'}
+    state3.clear = {x:False for x in range(1,20)}
+    state3.clear.update({1:True, 11:True, 9:True, 19:True})
+    state3.holding={'hand':False}
+
+    goal3 = gtpyhop.Multigoal('goal3')
+    goal3.pos = {15:13, 13:8, 8:9, 9:4, 4:'table', 12:2, 2:3, 3:16, 16:11, 11:7, 7:6, 6:'table'}
+    goal3.clear = {17:True, 15:True, 12:True}
+
+    return [('goal1a', state1, goal1a), ('sussman', sus_s0, sus_sg),
+            ('goal2a', state2, goal2a), ('bw_large_d', state3, goal3)]
+
+
+def logistics_problems():
+    """Return a list of (name, state, multigoal) for logistics_hgn."""
+    state1 = gtpyhop.State('state1')
+    state1.packages = {'package1', 'package2', 'package3', 'package4'}
+    state1.trucks = {'truck1', 'truck6'}
+    state1.airplanes = {'plane2'}
+    state1.locations = {'location1', 'location2', 'location3', 'airport1', 'location10', 'airport2'}
+    state1.airports = {'airport1', 'airport2'}
+    state1.cities = {'city1', 'city2'}
+    state1.at = {'package1': 'location1',
+                 'package2': 'location2',
+                 'package3': 'location10',
+                 'package4': 'airport1'}
+    state1.truck_at = {'truck1': 'location3', 'truck6': 'location10'}
+    state1.plane_at = {'plane2': 'airport2'}
+    state1.in_city = {'location1': 'city1',
+                      'location2': 'city1',
+                      'location3': 'city1',
+                      'airport1': 'city1',
+                      'location10': 'city2',
+                      'airport2': 'city2'}
+
+    goal1 = gtpyhop.Multigoal('goal1')
+    goal1.at = {'package1': 'location2', 'package2': 'location3'}
+
+    goal2 = gtpyhop.Multigoal('goal2')
+    goal2.at = {'package1': 'location10', 'package3': 'location1'}
+
+    goal3 = gtpyhop.Multigoal('goal3')
+    goal3.at = {'package1': 'location10', 'package2': 'airport2',
+                'package3': 'location2', 'package4': 'location10'}
+
+    return [('goal1', state1, goal1), ('goal2', state1, goal2),
+            ('goal3', state1, goal3)]
+
+
+def _logistics_domain():
+    """Return a copy of logistics_hgn's domain that uses m_split_multigoal."""
+    old_domain = gtpyhop.current_domain
+    domain = logistics_hgn.the_domain.copy('logistics_split')
+    gtpyhop.current_domain = domain
+    gtpyhop.declare_multigoal_methods(gtpyhop.m_split_multigoal)
+    gtpyhop.current_domain = old_domain
+    return domain
+
+
+def goal_ordering_benchmark(max_nodes=100000):
+    """
+    Plan for each problem with each goal ordering, using the iterative
+    search engine and at most max_nodes nodes, and print a table of the
+    node counts and plan lengths.
+    """
+    orderings = [None] + list(gtpyhop.goal_orderings)
+    suites = [(blocks_goal_splitting.the_domain, blocks_problems()),
+              (_logistics_domain(), logistics_problems())]
+
+    results = []
+    for (domain, problems) in suites:
+        for (name, state, multigoal) in problems:
+            for ordering in orderings:
+                planner = gtpyhop.Planner(domain=domain, engine='iterative', \
+                                          max_nodes=max_nodes, verbose=0, \
+                                          goal_ordering=ordering)
+                result = planner.find_plan(state, [multigoal], return_result=True)
+                length = len(result.plan) if result else None
+                results.append((domain.__name__, name, ordering or 'multigoal order', \
+                                result.status, result.nodes_expanded, length))
+
+    print(f'\n{"Domain":<24}{"Problem":<12}{"Ordering":<20}{"Status":<12}' + \
+          f'{"Nodes":>8}{"Length":>8}')
+    for (domain_name, name, ordering, status, nodes, length) in results:
+        print(f'{domain_name:<24}{name:<12}{ordering:<20}{status:<12}' + \
+              f'{nodes:>8}{length if length != None else "-":>8}')
+    return results
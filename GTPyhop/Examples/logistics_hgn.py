@@ -163,9 +163,10 @@ gtpyhop.declare_unigoal_methods('at', move_within_city, move_between_airports, m
 ################################################################################
 # Examples
 
-print('-----------------------------------------------------------------------')
-print(f"Created the domain '{domain_name}'. To run the examples, type this:")
-print(f"{domain_name}.main()")
+if not gtpyhop.quiet:
+    print('-----------------------------------------------------------------------')
+    print(f"Created the domain '{domain_name}'. To run the examples, type this:")
+    print(f"{domain_name}.main()")
 
 def main(do_pauses=True):
     """
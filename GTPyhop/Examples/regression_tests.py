@@ -4,9 +4,707 @@ see whether they run without error and return correct answers. The
 2nd-to-last line imports simple_htn_acting_error but doesn't run it,
 because running it is *supposed* to cause an error.
 
+After the blocks_hgn examples, it also checks some of GTPyhop's features
+that the examples don't use, such as find_plan's search options (see the
+check_ functions below).
+
 -- Dana Nau <nau@umd.edu>, July 20, 2021
 """
 
+# kludge to make gtpyhop available regardless of whether the current directory
+# is the Examples directory or its parent (where gtpyhop.py is located)
+#
+import sys
+sys.path.append('../')
+import gtpyhop
+
+import test_harness as th   # code for use in paging and debugging
+
+
+################################################################################
+# Checks of features that the examples don't use. The checks of find_plan's
+# search options run both search engines. The checks use domains that the
+# examples below have already created.
+
+
+def search_with_both_engines(state, todo_list, **options):
+    """
+    Call find_plan with return_result=True and the given options, once with
+    each search engine. Check that the two searches give the same plan and
+    the same statistics, and return the recursive engine's PlanResult.
+    """
+    (r1, r2) = [gtpyhop.find_plan(state, todo_list, engine=engine, \
+                                  return_result=True, **options) \
+                for engine in ('recursive', 'iterative')]
+    th.check_result((r2.status, r2.plan, r2.partial_plan), \
+                    (r1.status, r1.plan, r1.partial_plan))
+    th.check_result(r2.stats.as_dict(), r1.stats.as_dict())
+    return r1
+
+
+def sussman_anomaly():
+    """Return the initial state and multigoal of the Sussman anomaly."""
+    state = gtpyhop.State('Sussman anomaly initial state')
+    state.pos = {'a':'table', 'b':'table', 'c':'a'}
+    state.clear = {'a':False, 'b':True, 'c':True}
+    state.holding = {'hand':False}
+    goal = gtpyhop.Multigoal('Sussman anomaly multigoal')
+    goal.pos = {'a':'b', 'b':'c'}
+    return (state, goal)
+
+
+def check_state_variable_assignment():
+    """
+    Check that assigning a dictionary to a state variable copies it, so that
+    modifying the dictionary afterward doesn't change the state or its hash.
+    """
+    print('\nCheck assigning dictionaries to state variables.\n')
+    pos = {'a':'table', 'b':'a'}
+    s1 = gtpyhop.State('s1', pos=pos)
+    s2 = gtpyhop.State('s2', pos=pos)
+    h = hash(s1)
+    pos['a'] = 'b'
+    th.check_result((s1.pos['a'], s2.pos['a'], hash(s1)), ('table', 'table', h))
+    # a state variable assigned from another state is shared until it's written
+    s2.pos = s1.pos
+    s2.pos['b'] = 'table'
+    th.check_result((s1.pos['b'], s2.pos['b'], hash(s1)), ('a', 'table', h))
+    th.check_result(s1 == gtpyhop.State('s3', pos={'a':'table', 'b':'a'}), True)
+
+
+def check_write_logs():
+    """
+    Modify a long sequence of copies of a state, and check that the write
+    logs of its dictionaries and the logs that a _MultigoalTracker remembers
+    stay bounded, and that the tracker still finds the unachieved goals.
+    """
+    print('\nCheck the bounds on write logs.\n')
+    state = gtpyhop.State('state', loc={i:0 for i in range(10)})
+    goal = gtpyhop.Multigoal('goal', loc={i:1 for i in range(0, 10, 2)})
+    tracker = gtpyhop._MultigoalTracker(goal)
+    tracker.max_known = 10
+    (longest, correct) = (0, True)
+    for step in range(1000):
+        state = state.copy()
+        state.loc[step % 7] = step % 3
+        longest = max(longest, state.loc._log[2])
+        correct = correct and tracker.not_achieved(state) == \
+                  gtpyhop._goals_not_achieved(state, goal)
+    th.check_result((longest, correct), (gtpyhop._max_log_length, True))
+    th.check_result(len(tracker.known['loc']), 10)
+
+
+def check_compact_state():
+    """
+    Check that CompactStates, including ones with state variables whose
+    values aren't dictionaries, give the same plans as States, and that
+    copying, hashing, and pickling them work.
+    """
+    import backtracking_htn, blocks_hgn, pickle
+    print('\nCheck CompactState.\n')
+    (state, goal) = sussman_anomaly()
+    compact = gtpyhop.compact_state(state)
+    for (s, todo_list, domain) in [
+            (state, [goal], blocks_hgn.the_domain),
+            (backtracking_htn.state0, [('put_it',), ('need1',)], backtracking_htn.the_domain)]:
+        r1 = search_with_both_engines(s, todo_list, domain=domain)
+        r2 = search_with_both_engines(gtpyhop.compact_state(s), todo_list, domain=domain)
+        th.check_result((r2.plan, r2.stats.nodes), (r1.plan, r1.stats.nodes))
+
+    # a copy shares the original's values until one of them is modified
+    copy1 = compact.copy()
+    copy1.pos['c'] = 'table'
+    copy1.holding = {'hand':'a'}
+    th.check_result((compact.pos['c'], copy1.pos['c'], dict(copy1.holding)), \
+                    ('a', 'table', {'hand':'a'}))
+    th.check_result((copy1 == compact, hash(copy1) == hash(compact)), (False, False))
+    copy1.pos['c'] = 'a'
+    copy1.holding['hand'] = False
+    th.check_result((copy1 == compact, hash(copy1) == hash(compact)), (True, True))
+
+    # non-dictionary values, which are copied if they're mutable
+    s = gtpyhop.State('s', pos={'a':'table'}, fuel=0.0, visited=['x'])
+    compact = gtpyhop.compact_state(s)
+    copy1 = compact.copy()
+    copy1.fuel += 1.5
+    copy1.visited.append('y')
+    th.check_result((compact.fuel, compact.visited, copy1.fuel, copy1.visited), \
+                    (0.0, ['x'], 1.5, ['x', 'y']))
+    th.check_result(str(compact._layout), "StateLayout(pos=['a'], fuel=None, visited=None)")
+    copy2 = pickle.loads(pickle.dumps(copy1))
+    th.check_result((type(copy2).__name__, copy2 == copy1, hash(copy2) == hash(copy1)), \
+                    ('CompactState', True, True))
+    # the layout doesn't declare 'clear' or pos['b']
+    th.check_result([exception_raised(lambda: setattr(copy1, 'clear', {})), \
+                     exception_raised(lambda: copy1.pos.__setitem__('b', 'a'))], \
+                    ['Exception', 'KeyError'])
+
+
+def exception_raised(function):
+    """Call function(), and return the name of the exception it raises, or None."""
+    try:
+        function()
+    except Exception as e:
+        return type(e).__name__
+    return None
+
+
+@gtpyhop.memoize_per_state
+def location(state, obj):
+    """A memoized function for check_memoize_per_state."""
+    location.calls += 1
+    return (state.pos[obj], state.flag)
+
+location.calls = 0
+
+
+def check_memoize_per_state():
+    """
+    Check that memoize_per_state reuses results for the same state and its
+    unmodified copies, and that writing to a state variable invalidates the
+    results for that state but not for its copies.
+    """
+    print('\nCheck memoize_per_state.\n')
+    state = gtpyhop.State('state', pos={'a':'table', 'b':'a'}, flag=0)
+    results = [location(state, 'a'), location(state, 'a'), location(state, 'b')]
+    th.check_result((results, location.hits, location.misses, location.calls), \
+                    ([('table', 0), ('table', 0), ('a', 0)], 1, 2, 2))
+    copy1 = state.copy()
+    state.pos['a'] = 'b'
+    results = [location(copy1, 'a'), location(state, 'a'), location(state, 'b')]
+    th.check_result((results, location.hits, location.misses), \
+                    ([('table', 0), ('b', 0), ('a', 0)], 2, 4))
+    state.flag = 1
+    th.check_result((location(state, 'a'), location.misses), (('b', 1), 5))
+    state.pos = {'a':'c'}
+    th.check_result((location(state, 'a'), location(copy1, 'a'), location.hits), \
+                    (('c', 1), ('table', 0), 3))
+    location.cache_clear()
+    th.check_result((location(copy1, 'a'), location.hits, location.misses), \
+                    (('table', 0), 0, 1))
+    th.check_result(location.calls, 7)
+
+
+def check_budgets():
+    """
+    Run blocks_hgn on the Sussman anomaly with various budgets, and check
+    how each search ends and the best partial plan it finds.
+    """
+    import blocks_hgn
+    print('\nCheck find_plan with node, depth, length, and time budgets.\n')
+    (state, goal) = sussman_anomaly()
+    expected = [('unstack', 'c', 'a'), ('putdown', 'c'), ('pickup', 'b'), \
+                ('stack', 'b', 'c'), ('pickup', 'a'), ('stack', 'a', 'b')]
+    for (budget, status, partial_plan) in [
+            ({}, 'success', expected),
+            ({'max_nodes': 1000}, 'success', expected),
+            ({'max_plan_length': 6}, 'success', expected),
+            ({'max_depth': 3}, 'depth_limit', expected[:1]),
+            ({'max_depth': 8}, 'depth_limit', expected[:2]),
+            ({'max_plan_length': 3}, 'depth_limit', expected[:3]),
+            ({'max_nodes': 5}, 'node_limit', expected[:1]),
+            ({'time_limit': 0}, 'time_limit', [])]:
+        r = search_with_both_engines(state, [goal], domain=blocks_hgn.the_domain, \
+                                     **budget)
+        plan = partial_plan if status == 'success' else False
+        th.check_result((r.status, r.plan, r.partial_plan), (status, plan, partial_plan))
+        th.check_result(bool(r), status == 'success')
+    # the last search ran out of time at the first node
+    th.check_result(r.nodes_expanded, 1)
+
+
+def check_iter_plans():
+    """
+    Check that iter_plans yields backtracking_htn's plans for two 'put_it'
+    tasks in backtracking order, starting with the one that the recursive
+    engine finds.
+    """
+    import backtracking_htn
+    print('\nCheck iter_plans.\n')
+    (state, domain) = (backtracking_htn.state0, backtracking_htn.the_domain)
+    todo_list = [('put_it',), ('put_it',), ('need01',)]
+    (plan0, plan1) = ([('putv', 0), ('getv', 0)], [('putv', 1), ('getv', 1)])
+    expected = [plan0 + plan0 + [('getv', 0)], plan0 + plan1 + [('getv', 1)], \
+                plan1 + plan0 + [('getv', 0)], plan1 + plan1 + [('getv', 1)]]
+
+    plans = list(gtpyhop.iter_plans(state, todo_list, domain=domain))
+    th.check_result(plans, expected)
+    th.check_result(plans[0], gtpyhop.find_plan(state, todo_list, domain=domain, \
+                                                engine='recursive'))
+    plans = list(gtpyhop.iter_plans(state, todo_list, limit=2, domain=domain))
+    th.check_result(plans, expected[:2])
+    # the budget is for the whole sequence of plans
+    plans = list(gtpyhop.iter_plans(state, todo_list, domain=domain, max_nodes=20))
+    th.check_result(plans, expected[:2])
+
+
+def flag0_costs_more(state, action, newstate):
+    """A cost function for backtracking_htn in which ('putv', 0) costs 5."""
+    return 5 if action == ('putv', 0) else 1
+
+
+def check_branch_and_bound():
+    """
+    Check that find_plan's branch-and-bound search finds the cheapest plan,
+    both when it's the first plan and when it isn't.
+    """
+    import backtracking_htn, blocks_hgn
+    print('\nCheck find_plan with a cost function.\n')
+    (state, domain) = (backtracking_htn.state0, backtracking_htn.the_domain)
+    todo_list = [('put_it',), ('need01',)]
+    r = search_with_both_engines(state, todo_list, domain=domain, cost=gtpyhop.unit_cost)
+    th.check_result((r.plan, r.cost), ([('putv', 0), ('getv', 0), ('getv', 0)], 3))
+    r = search_with_both_engines(state, todo_list, domain=domain, cost=flag0_costs_more)
+    th.check_result((r.plan, r.cost), ([('putv', 1), ('getv', 1), ('getv', 1)], 3))
+
+    domain = flag_domain('branch_and_bound_check', m_set0_in_two_steps, m_set0)
+    r = search_with_both_engines(state, [('set_flag',), ('need0',)], domain=domain, \
+                                 cost=gtpyhop.unit_cost)
+    th.check_result((r.status, r.plan, r.cost), ('success', [('putv', 0), ('getv', 0)], 2))
+
+    (state, goal) = sussman_anomaly()
+    r = search_with_both_engines(state, [goal], domain=blocks_hgn.the_domain, \
+                                 cost=gtpyhop.unit_cost)
+    th.check_result((r.status, r.cost), ('success', 6))
+    th.check_result(r.plan, gtpyhop.find_plan(state, [goal], domain=blocks_hgn.the_domain))
+
+
+def flag_domain(domain_name, *set_flag_methods):
+    """
+    Create a domain that has backtracking_htn's actions and its methods for
+    'need0' and 'need1', and in which the methods for 'set_flag' are
+    set_flag_methods.
+    """
+    import backtracking_htn
+    domain = gtpyhop.Domain(domain_name)
+    gtpyhop.declare_actions(backtracking_htn.putv, backtracking_htn.getv)
+    gtpyhop.declare_task_methods('set_flag', *set_flag_methods)
+    gtpyhop.declare_task_methods('need0', backtracking_htn.m_need0)
+    gtpyhop.declare_task_methods('need1', backtracking_htn.m_need1)
+    return domain
+
+
+def m_set0(state):
+    return [('putv', 0)]
+
+def m_set0_in_two_steps(state):
+    return [('putv', 1), ('putv', 0)]
+
+def m_set1(state):
+    return [('putv', 1)]
+
+def m_set0_slowly(state):
+    return [('putv', 1), ('putv', 1), ('putv', 1), ('putv', 0)]
+
+
+def check_transposition_table():
+    """
+    In the domain below, the first two methods for 'set_flag' reach the same
+    state with the same to-do list, which fails. With a TranspositionTable,
+    the search finds the same plan, but it prunes the second failure instead
+    of searching it again.
+    """
+    import backtracking_htn
+    print('\nCheck find_plan with a TranspositionTable.\n')
+    domain = flag_domain('transposition_check', m_set0, m_set0_in_two_steps, m_set1)
+    todo_list = [('set_flag',), ('need1',)]
+
+    r1 = search_with_both_engines(backtracking_htn.state0, todo_list, domain=domain)
+    for engine in ('recursive', 'iterative'):
+        table = gtpyhop.TranspositionTable()
+        r2 = gtpyhop.find_plan(backtracking_htn.state0, todo_list, engine=engine, \
+                               domain=domain, transposition_table=table, \
+                               return_result=True)
+        th.check_result(r2.plan, [('putv', 1), ('getv', 1)])
+        th.check_result(r2.plan, r1.plan)
+        th.check_result((r1.stats.nodes, r2.stats.nodes, table.hits), (12, 11, 1))
+        # each action's state is copied once; the keys' copies don't count
+        th.check_result(r2.stats.state_copies, \
+                        r2.stats.actions_applied + r2.stats.actions_failed)
+
+    # In the domain below, both methods for 'go' lead to a node in which x is
+    # at b and the to-do list is [verify ('loc','x','b'), ('fail',)], but the
+    # first one reaches it at depth 1 and the second one at depth 2. The
+    # TranspositionTable should treat the two nodes as the same.
+    domain = gtpyhop.Domain('transposition_depth_check')
+    gtpyhop.declare_actions(move)
+    gtpyhop.declare_task_methods('go', m_go_directly, m_go_indirectly)
+    gtpyhop.declare_task_methods('fail', m_fail)
+    gtpyhop.declare_unigoal_methods('loc', m_move)
+    state = gtpyhop.State('state', loc={'x':'a'})
+    for engine in ('recursive', 'iterative'):
+        table = gtpyhop.TranspositionTable()
+        r = gtpyhop.find_plan(state, [('go',), ('fail',)], engine=engine, \
+                              domain=domain, transposition_table=table, \
+                              return_result=True)
+        th.check_result((r.status, r.stats.nodes, table.hits, len(table)), \
+                        ('failure', 9, 1, 8))
+        th.check_result(r.stats.state_copies, \
+                        r.stats.actions_applied + r.stats.actions_failed)
+
+
+def move(state, obj, dest):
+    state.loc[obj] = dest
+    return state
+
+def m_go_directly(state):
+    return [('loc', 'x', 'b')]
+
+def m_go_indirectly(state):
+    return [('move', 'x', 'c'), ('loc', 'x', 'b')]
+
+def m_fail(state):
+    return False
+
+def m_move(state, obj, dest):
+    return [('move', obj, dest)]
+
+
+def check_iterative_deepening():
+    """
+    In the domain below, the first plan that find_plan finds for
+    [('set_flag',), ('need0',)] isn't the shortest one. With iterative
+    deepening on either the depth or the plan's length, it is.
+    """
+    import backtracking_htn
+    print('\nCheck find_plan with iterative deepening.\n')
+    domain = flag_domain('deepening_check', m_set0_in_two_steps, m_set0)
+    todo_list = [('set_flag',), ('need0',)]
+
+    r = search_with_both_engines(backtracking_htn.state0, todo_list, domain=domain)
+    th.check_result(r.plan, [('putv', 1), ('putv', 0), ('getv', 0)])
+    for mode in ('depth', 'length'):
+        r = search_with_both_engines(backtracking_htn.state0, todo_list, \
+                                     domain=domain, iterative_deepening=mode)
+        th.check_result((r.status, r.plan), ('success', [('putv', 0), ('getv', 0)]))
+
+    # there's no plan with at most one action
+    r = search_with_both_engines(backtracking_htn.state0, todo_list, domain=domain, \
+                                 iterative_deepening='length', max_plan_length=1)
+    th.check_result((r.status, r.plan, r.partial_plan), \
+                    ('depth_limit', False, [('putv', 0)]))
+
+
+def check_parallel_search():
+    """
+    Check that a Planner's parallel searches find the sequential search's
+    plans and reuse the same worker processes, and that a parallel search
+    doesn't return a plan to the right of a subtree that ran out of budget.
+    """
+    import backtracking_htn
+    print('\nCheck find_plan with several workers.\n')
+    (state, domain) = (backtracking_htn.state0, backtracking_htn.the_domain)
+    with gtpyhop.Planner(domain, workers=2) as planner:
+        for todo_list in ([('put_it',), ('need0',)], [('put_it',), ('need1',)]):
+            plan = planner.find_plan(state, todo_list)
+            th.check_result(plan, gtpyhop.find_plan(state, todo_list, domain=domain))
+            if todo_list[1] == ('need0',):
+                pool = planner._pool
+        th.check_result(planner._pool is pool, True)
+    th.check_result(planner._pool, None)
+
+    # each worker may expand 5 nodes, which is enough for the subtree below
+    # m_set1 but not for the one below m_set0_slowly
+    domain = flag_domain('parallel_check', m_set0_slowly, m_set1)
+    todo_list = [('set_flag',), ('need1',)]
+    for workers in (None, 2):
+        r = gtpyhop.find_plan(state, todo_list, domain=domain, workers=workers, \
+                              max_nodes=5, return_result=True)
+        th.check_result((r.status, r.plan), ('node_limit', False))
+    th.check_result(gtpyhop.find_plan(state, todo_list, domain=domain, workers=2), \
+                    [('putv', 1), ('getv', 1)])
+
+
+def check_find_plans():
+    """
+    Check that find_plans, with and without worker processes, gives the
+    same results as calling find_plan on each problem.
+    """
+    import backtracking_htn
+    print('\nCheck find_plans.\n')
+    (state, domain) = (backtracking_htn.state0, backtracking_htn.the_domain)
+    problems = [(state, [('put_it',), x]) for x in \
+                [('need0',), ('need1',), ('need01',), ('need10',), ('put_it',)]]
+    problems.append((state, [('need0',)]))
+    expected = [gtpyhop.find_plan(state, todo_list, domain=domain, \
+                                  return_result=True) \
+                for (state, todo_list) in problems]
+    for workers in (1, 2):
+        results = sorted(gtpyhop.find_plans(iter(problems), workers=workers, \
+                                            domain=domain))
+        th.check_result([i for (i, r) in results], list(range(len(problems))))
+        th.check_result([(r.status, r.plan, r.stats.nodes) for (i, r) in results], \
+                        [(r.status, r.plan, r.stats.nodes) for r in expected])
+
+
+def check_method_stats():
+    """
+    Check MethodStats' counts for backtracking_htn's methods after a search
+    with each engine, that the next search uses them to skip m0, and that
+    the counts survive being saved and loaded.
+    """
+    import backtracking_htn, os, tempfile
+    print('\nCheck find_plan with MethodStats.\n')
+    (state, domain) = (backtracking_htn.state0, backtracking_htn.the_domain)
+    todo_list = [('put_it',), ('need1',)]
+    expected = {'backtracking_htn.m_err': [0, 1, 2], 'backtracking_htn.m0': [0, 1, 4],
+                'backtracking_htn.m1': [1, 0, 5], 'backtracking_htn.m_need1': [1, 1, 3]}
+    for engine in ('recursive', 'iterative'):
+        stats = gtpyhop.MethodStats()
+        r = gtpyhop.find_plan(state, todo_list, domain=domain, engine=engine, \
+                              method_stats=stats, return_result=True)
+        th.check_result((r.plan, r.stats.nodes), \
+                        ([('putv', 1), ('getv', 1), ('getv', 1)], 12))
+        th.check_result(stats.counts, expected)
+    # m1 now looks as good as m_err and better than m0, so m0 isn't tried
+    r = gtpyhop.find_plan(state, todo_list, domain=domain, method_stats=stats, \
+                          return_result=True)
+    th.check_result((r.plan, r.stats.nodes), ([('putv', 1), ('getv', 1), ('getv', 1)], 8))
+    th.check_result((stats.counts['backtracking_htn.m0'], \
+                     stats.counts['backtracking_htn.m1']), ([0, 1, 4], [2, 0, 10]))
+
+    (fd, filename) = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        stats.save(filename)
+        loaded = gtpyhop.MethodStats()
+        loaded.load(filename)
+        loaded.load(filename)
+    finally:
+        os.remove(filename)
+    th.check_result(loaded.counts, {name: [2*x for x in counts] \
+                                    for (name, counts) in stats.counts.items()})
+
+
+def c_getv(state, flag_val):
+    """A command for check_plan_repair that fails c_getv.failures times."""
+    if c_getv.failures > 0:
+        c_getv.failures -= 1
+        return False
+    if state.flag == flag_val:
+        return state
+
+
+def check_plan_repair():
+    """
+    Check run_lazy_lookahead's repair mode with a command, c_getv, that fails
+    a given number of times before it works. A failure after ('putv', 0)
+    is repaired at the node below it, but if the repaired plan's c_getv
+    fails again, run_lazy_lookahead plans from scratch instead.
+    """
+    import backtracking_htn
+    print('\nCheck run_lazy_lookahead with repair=True.\n')
+    domain = flag_domain('repair_check', m_set0)
+    gtpyhop.declare_commands(c_getv)
+    todo_list = [('set_flag',), ('need0',)]
+    # each item of the log is (mode, depth, plan_length); the repair at depth
+    # 4 finds that nothing remains to be done
+    for (failures, expected) in [
+            (0, [('plan', None, 2), ('repair', 4, 0)]),
+            (1, [('plan', None, 2), ('repair', 3, 1), ('repair', 1, 0)]),
+            (2, [('plan', None, 2), ('repair', 3, 1), ('replan', None, 2), \
+                 ('repair', 4, 0)]),
+            (3, [('plan', None, 2), ('repair', 3, 1), ('replan', None, 2), \
+                 ('repair', 3, 1), ('repair', 1, 0)])]:
+        c_getv.failures = failures
+        log = []
+        state = gtpyhop.run_lazy_lookahead(backtracking_htn.state0, todo_list, \
+                                           repair=True, replan_log=log)
+        th.check_result((state.flag, c_getv.failures), (0, 0))
+        th.check_result([(x['mode'], x['depth'], x['plan_length']) for x in log], \
+                        expected)
+
+
+def check_speculation():
+    """
+    Run run_lazy_lookahead_async on the Sussman anomaly with a
+    SimulatedExecutor whose commands sometimes fail. With the seed below,
+    the third command fails, so the plan that was found while the second
+    command ran is used; then the first command of that plan fails, so
+    there's no such plan and it replans; and then the plan succeeds, so the
+    plan found while its last command ran (the empty plan) is used.
+    """
+    import asyncio, blocks_hgn
+    print('\nCheck run_lazy_lookahead_async with speculation.\n')
+    (state, goal) = sussman_anomaly()
+    expected = {'a':'b', 'b':'c', 'c':'table'}
+    for (speculate, modes) in [(True, ['plan', 'speculation', 'plan', 'speculation']),
+                               (False, ['plan', 'plan', 'plan', 'plan'])]:
+        executor = gtpyhop.SimulatedExecutor(blocks_hgn.the_domain, \
+                                             failure_rate=0.3, seed=2)
+        log = []
+        final_state = asyncio.run(gtpyhop.run_lazy_lookahead_async(state, [goal], \
+            execute=executor, speculate=speculate, domain=blocks_hgn.the_domain, \
+            replan_log=log))
+        th.check_result((dict(final_state.pos), executor.executed, executor.failed), \
+                        (expected, 6, 2))
+        th.check_result([(x['mode'], x['plan_length']) for x in log], \
+                        list(zip(modes, [6, 4, 4, 0])))
+
+
+def check_trace_recorder():
+    """
+    Record backtracking_htn's search with each engine, and check that saving
+    and loading the trace gives back the same events, and that replay_trace
+    and collapsed_stacks reconstruct the search tree and the path to the plan.
+    """
+    import backtracking_htn, os, tempfile
+    print('\nCheck TraceRecorder and replay_trace.\n')
+    (state, domain) = (backtracking_htn.state0, backtracking_htn.the_domain)
+    for engine in ('recursive', 'iterative'):
+        recorder = gtpyhop.TraceRecorder()
+        r = gtpyhop.find_plan(state, [('put_it',), ('need1',)], domain=domain, \
+                              engine=engine, tracer=recorder, return_result=True)
+        th.check_result(len([e for e in recorder.events() if e[0] == 'node']), \
+                        r.stats.nodes)
+        (fd, filename) = tempfile.mkstemp(suffix='.trace')
+        os.close(fd)
+        try:
+            recorder.save(filename)
+            loaded = gtpyhop.load_trace(filename)
+            tree = gtpyhop.replay_trace(filename)
+        finally:
+            os.remove(filename)
+        th.check_result((list(loaded.events()), loaded.strings), \
+                        (list(recorder.events()), recorder.strings))
+        th.check_result((len(tree.children), tree.size()), (1, r.stats.nodes))
+        (path, node) = ([], tree)
+        while node.children:
+            node = [child for child in node.children if child.on_plan][0]
+            path.append((node.via, node.item))
+        th.check_result((path, node.status), \
+            ([('find_plan', 'put_it'), ('m1', 'putv'), ('putv', 'getv'), \
+              ('getv', 'need1'), ('m_need1', 'getv'), ('getv', None)], 'solved'))
+        stacks = gtpyhop.collapsed_stacks(loaded, weight='nodes')
+        th.check_result((len(stacks), sum(stacks.values()), \
+                         stacks['find_plan;m0;putv;getv;m_need1']), (12, 12, 1))
+
+
+def check_profiling():
+    """
+    Profile backtracking_htn's actions and methods during a search with each
+    engine, and check the numbers of calls and failures that profile_data,
+    print_profile, and save_profile report, and that searches made after
+    stop_profiling don't change them.
+    """
+    import backtracking_htn, io, json, os, tempfile
+    print('\nCheck profiling a domain.\n')
+    (state, domain) = (backtracking_htn.state0, backtracking_htn.the_domain)
+    todo_list = [('put_it',), ('need1',)]
+    domain.clear_profile()
+    domain.start_profiling()
+    for engine in ('recursive', 'iterative'):
+        gtpyhop.find_plan(state, todo_list, domain=domain, engine=engine)
+    domain.stop_profiling()
+    gtpyhop.find_plan(state, todo_list, domain=domain)
+    entries = domain.profile_data(sort='calls')
+    th.check_result([(e['name'], e['kind'], e['calls'], e['failures']) \
+                     for e in entries if e['calls'] > 0],
+                    [('State.copy', 'copy', 16, 0),
+                     ('backtracking_htn.getv', 'action', 10, 4),
+                     ('backtracking_htn.putv', 'action', 6, 0),
+                     ('backtracking_htn.m_need1', 'method', 4, 0),
+                     ('backtracking_htn.m0', 'method', 2, 0),
+                     ('backtracking_htn.m1', 'method', 2, 0),
+                     ('backtracking_htn.m_err', 'method', 2, 0)])
+    th.check_result(all([0 <= e['self_time'] <= e['total_time'] for e in entries]), True)
+
+    gtpyhop.output = io.StringIO()
+    try:
+        domain.print_profile(sort='calls', limit=2)
+        lines = gtpyhop.output.getvalue().splitlines()
+    finally:
+        gtpyhop.output = None
+    th.check_result([line.split()[:4] for line in lines[1:]],
+                    [['Profile', 'of', 'backtracking_htn:'],
+                     ['Name', 'Kind', 'Calls', 'Fails'],
+                     ['State.copy', 'copy', '16', '0'],
+                     ['backtracking_htn.getv', 'action', '10', '4']])
+
+    (fd, filename) = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        domain.save_profile(filename, sort='calls')
+        with open(filename) as f:
+            saved = json.load(f)
+    finally:
+        os.remove(filename)
+    th.check_result(saved, {'domain': 'backtracking_htn', 'profile': entries})
+    domain.clear_profile()
+    th.check_result(domain.profile_data(), [])
+
+
+def check_quiet_and_output():
+    """
+    Check that importing GTPyhop and an example domain prints nothing when
+    the environment variable GTPYHOP_QUIET is set, and that GTPyhop's
+    messages (including find_plan's verbose output) go to 'output' rather
+    than to sys.stdout.
+    """
+    import backtracking_htn, contextlib, io, os, subprocess
+    print('\nCheck GTPYHOP_QUIET and gtpyhop.output.\n')
+    command = [sys.executable, '-c', 'import gtpyhop, backtracking_htn']
+    path = os.pathsep.join([os.path.abspath('..'), os.path.abspath('.')])
+    outputs = []
+    for quiet in ('1', '0'):
+        env = dict(os.environ, GTPYHOP_QUIET=quiet, PYTHONPATH=path)
+        outputs.append(subprocess.run(command, env=env, capture_output=True, \
+                                      text=True, check=True).stdout)
+    th.check_result((outputs[0], 'Imported GTPyhop version' in outputs[1], \
+                     "Created the domain 'backtracking_htn'" in outputs[1]), \
+                    ('', True, True))
+
+    (stdout, output) = (io.StringIO(), io.StringIO())
+    (gtpyhop.output, gtpyhop.verbose) = (output, 3)
+    try:
+        with contextlib.redirect_stdout(stdout):
+            gtpyhop.print_state(backtracking_htn.state0)
+            plan = gtpyhop.find_plan(backtracking_htn.state0, [('put_it',), ('need1',)], \
+                                     domain=backtracking_htn.the_domain)
+    finally:
+        (gtpyhop.output, gtpyhop.verbose) = (None, 0)
+    text = output.getvalue()
+    th.check_result((stdout.getvalue(), text.startswith('State state0:'), \
+                     f'FP> result = {plan}' in text, 'depth 3 todo_list' in text), \
+                    ('', True, True, True))
+
+
+def check_domain_snapshots():
+    """
+    Check that pickling a DomainSnapshot gives a snapshot that finds the
+    same plan, and that unpickling it again reuses that snapshot. Then check
+    that get_domain finds a registered domain that nothing else refers to,
+    but not an unregistered one.
+    """
+    import blocks_hgn, gc, pickle
+    print('\nCheck DomainSnapshot pickling and get_domain.\n')
+    (state, goal) = sussman_anomaly()
+    snapshot = blocks_hgn.the_domain.snapshot()
+    copy1 = pickle.loads(pickle.dumps(snapshot))
+    copy2 = pickle.loads(pickle.dumps(copy1))
+    th.check_result((type(copy1).__name__, copy1.__name__, copy2 is copy1), \
+                    ('DomainSnapshot', 'blocks_hgn', True))
+    th.check_result(gtpyhop.find_plan(state, [goal], domain=copy1), \
+                    gtpyhop.find_plan(state, [goal], domain=snapshot))
+
+    old_domain = gtpyhop.current_domain
+    try:
+        gtpyhop.register_domain('registered_domain', 'no_such_module')
+        gtpyhop.Domain('registered_domain')
+        gtpyhop.Domain('unregistered_domain')
+        gtpyhop.Domain('another_domain')
+    finally:
+        gtpyhop.current_domain = old_domain
+    gc.collect()
+    th.check_result(gtpyhop.get_domain('registered_domain').__name__, 'registered_domain')
+    th.check_result(exception_raised(lambda: gtpyhop.get_domain('unregistered_domain')), \
+                    'Exception')
+
+
+################################################################################
+# Running the examples and checks
+
+
 # The argument False tells the test harness not to stop for user input
 import simple_htn; simple_htn.main(False)
 import simple_hgn; simple_hgn.main(False)
@@ -15,6 +713,25 @@ import logistics_hgn; logistics_hgn.main(False)
 import blocks_gtn; blocks_gtn.main(False)
 import blocks_goal_splitting; blocks_goal_splitting.main(False)
 import blocks_hgn; blocks_hgn.main(False)
+gtpyhop.verbose = 0
+check_state_variable_assignment()
+check_write_logs()
+check_memoize_per_state()
+check_compact_state()
+check_budgets()
+check_transposition_table()
+check_iter_plans()
+check_branch_and_bound()
+check_iterative_deepening()
+check_parallel_search()
+check_find_plans()
+check_method_stats()
+check_plan_repair()
+check_speculation()
+check_trace_recorder()
+check_profiling()
+check_quiet_and_output()
+check_domain_snapshots()
 import blocks_htn; blocks_htn.main(False)
 import pyhop_simple_travel_example
 import simple_htn_acting_error
@@ -0,0 +1,93 @@
+"""
+A benchmark for gtpyhop.run_lazy_lookahead_async on the Satellite problems.
+Each actor gets a problem, and acts in a gtpyhop.SimulatedExecutor, in
+which turning a satellite (a slew) takes much longer than the other actions.
+The benchmark runs the actors one at a time and
+then all at once, and prints the wall-clock time and the number of commands
+executed per second for each.
+
+To run it, go to the Examples directory, launch Python 3, and type:
+    import satellite_htn.acting
+    satellite_htn.acting.acting_benchmark()
+"""
+
+import gtpyhop
+import asyncio
+import time
+import os
+
+from .tester import read_pddl, the_domain
+
+
+def _problems(count):
+    """
+    Return a list of 'count' triples (name, state, todo_list), taken from the
+    solvable problems in Domains/Satellite_Domain/problem, in turn. If there
+    are fewer problems than that, some actors get copies of the same one.
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    home_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+    problems_path = os.path.join(home_dir, 'Domains/Satellite_Domain/problem')
+
+    solvable = []
+    for x in sorted(os.listdir(problems_path)):
+        if 'problem' not in x:
+            continue
+        with open(os.path.join(problems_path, x)) as pddl_file:
+            initial_state, goal_state = read_pddl(pddl_file.readlines())
+        todo_list = [('achieve_goal', goal_state)]
+        if gtpyhop.Planner(the_domain, verbose=0).find_plan(initial_state, todo_list):
+            solvable.append((x.split('.')[0], initial_state, todo_list))
+    if not solvable:
+        raise Exception("acting_benchmark: none of the problems is solvable")
+    return [solvable[i % len(solvable)] for i in range(count)]
+
+
+async def _act(problems, executor, concurrent, speculate):
+    """Run an actor for each problem, one at a time or all at once."""
+    actors = [gtpyhop.run_lazy_lookahead_async(state, todo_list, max_tries=50, \
+                                               execute=executor, speculate=speculate, \
+                                               domain=the_domain) \
+              for (_, state, todo_list) in problems]
+    if concurrent:
+        return await asyncio.gather(*actors)
+    return [await actor for actor in actors]
+
+
+def acting_benchmark(count=10, slew_latency=0.02, latency=0.002, failure_rate=0, \
+                     seed=0):
+    """
+    Run 'count' actors on the Satellite problems (see _problems). In the simulated
+    executor, turnTo takes slew_latency seconds, the other actions take
+    'latency' seconds, and each action fails with probability failure_rate.
+    Note that after some failures, the Satellite methods don't find a plan
+    for the state that the actor is in, so with failure_rate > 0, an actor
+    may give up or raise an exception.
+    """
+    old_verbose = gtpyhop.verbose
+    gtpyhop.verbose = 0
+    problems = _problems(count)
+    latencies = {name: latency for name in the_domain._action_dict}
+    latencies['turnTo'] = slew_latency
+
+    results = []
+    try:
+        for (concurrent, speculate) in [(False, False), (False, True), (True, True)]:
+            executor = gtpyhop.SimulatedExecutor(the_domain, latencies, \
+                                                 failure_rate, seed)
+            start_time = time.perf_counter()
+            asyncio.run(_act(problems, executor, concurrent, speculate))
+            elapsed = time.perf_counter() - start_time
+            commands = executor.executed + executor.failed
+            results.append(('all at once' if concurrent else 'one at a time', \
+                            speculate, commands, executor.busy_time, elapsed))
+    finally:
+        gtpyhop.verbose = old_verbose
+
+    print(f'\n{len(problems)} actors')
+    print(f'{"Actors":<16}{"Speculate":<12}{"Commands":>10}{"Latency":>10}' + \
+          f'{"Elapsed":>10}{"Commands/s":>12}')
+    for (mode, speculate, commands, busy_time, elapsed) in results:
+        print(f'{mode:<16}{str(speculate):<12}{commands:>10}{busy_time:>9.2f}s' + \
+              f'{elapsed:>9.2f}s{commands/elapsed:>12.1f}')
+    return results
@@ -4,7 +4,6 @@ The tester file to read all the problems and produces results in a file.
 """
 
 import gtpyhop
-import time
 import os
 
 the_domain = gtpyhop.Domain(__package__)
@@ -12,13 +11,14 @@ the_domain = gtpyhop.Domain(__package__)
 from .actions import *
 from .methods_updated import *
 
-def run_pddl(lines):
+def read_pddl(lines):
+    """
+    Read the lines of a Satellite problem file, and return the initial state
+    and the goal.
+    """
     init = False
     goal = False
 
-    # Setting the first run flag in methods for this run
-    setFirstRun()
-
     # Creating the gtpyhop initial and goal states.
     initial_state = gtpyhop.State('initial_state')
     goal_state = gtpyhop.Multigoal('goal_state')
@@ -123,26 +123,63 @@ def run_pddl(lines):
             # Lines we are not interested in.
             continue
 
+    # Initializing attributes that might not be given in the init state.
+    initial_state.power_on = {}
+    initial_state.calibrated = {}
+    initial_state.have_image = {}
+
+    return initial_state, goal_state
+
+def fuel_cost(state, action, newstate):
+    """
+    A cost function for gtpyhop.find_plan: the fuel that the action uses.
+    """
+    return newstate.fuel_used - state.fuel_used
+
+def run_pddl(lines, cost=None, method_stats=None, trace_file=None):
+    """
+    Plan for the problem in the lines of a Satellite problem file. If cost is
+    given (e.g., fuel_cost), look for the cheapest plan. If method_stats (a
+    gtpyhop.MethodStats) is given, use it to learn the method ordering. If
+    trace_file is given, record the search in it (see gtpyhop.TraceRecorder).
+    """
+    initial_state, goal_state = read_pddl(lines)
+
     # Running the HTN planner.
     gtpyhop.verbose = 1
 
-    start_time = time.time()
-    plan = gtpyhop.find_plan(initial_state, [('achieve_goal', goal_state)])
-    end_time = time.time()
-
-    node_count = getNodeCount()
+    recorder = gtpyhop.TraceRecorder() if trace_file else None
+    result = gtpyhop.find_plan(initial_state, [('achieve_goal', goal_state)], \
+                               return_result=True, cost=cost, method_stats=method_stats, \
+                               tracer=recorder)
+    if recorder:
+        recorder.save(trace_file)
     
     # Resetting the states for the next run.
     del initial_state
     del goal_state
 
-    return plan, (end_time - start_time), node_count
+    return result.plan, result.elapsed, result.nodes_expanded
     
 
 
-def multi_test():
+def multi_test(workers=None, time_limit=None, method_stats=None, trace_dir=None, \
+               profile=False):
     """
     Running all the test cases related to the Satellite domain.
+    If workers is given, plan for all of the problems at once, in that many
+    worker processes, with a time limit of time_limit seconds for each.
+    Otherwise plan for them one at a time; if method_stats is given, the
+    method ordering it learns from each problem is used for the next one,
+    and if trace_dir is given, the search for each problem is recorded in
+    a file in that directory. For example, to see where the time went in
+    a problem:
+        root = gtpyhop.replay_trace(trace_dir + '/21_1_satellite_problem.trace')
+        root.display(max_depth=5)
+        gtpyhop.collapsed_stacks(root, '21_1_satellite_problem.folded')
+    If profile is True, profile the domain's actions and methods while
+    planning, and print the results at the end (see
+    gtpyhop.Domain.start_profiling).
     """
     print(f'\n---------------------------------------------------------')
     print(f'Running the {the_domain.__name__} domain')
@@ -151,6 +188,10 @@ def multi_test():
 
     gtpyhop.print_domain()
 
+    if profile:
+        the_domain.clear_profile()
+        the_domain.start_profiling()
+
     # Getting the current file path.
     current_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -172,6 +213,19 @@ def multi_test():
     problem_list = os.listdir(problems_path)
     problem_list.sort()
 
+    # Planning for all the problems in parallel, if asked to.
+    if workers:
+        names = [x for x in problem_list if 'problem' in x]
+        problems = []
+        for x in names:
+            with open(problems_path + '/' + x, 'r') as pddl_file:
+                initial_state, goal_state = read_pddl(pddl_file.readlines())
+            problems.append((initial_state, [('achieve_goal', goal_state)]))
+        results = {}
+        for i, result in gtpyhop.find_plans(problems, workers=workers, \
+                                            domain=the_domain, time_limit=time_limit):
+            results[names[i]] = result.plan, result.elapsed, result.nodes_expanded
+
     for x in problem_list:
         if 'problem' in x:
 
@@ -187,7 +241,12 @@ def multi_test():
             lines = pddl_file.readlines()
 
             # Run the read pddl file.
-            plan, duration, node_count = run_pddl(lines)
+            if workers:
+                plan, duration, node_count = results[x]
+            else:
+                trace_file = trace_dir and os.path.join(trace_dir, problem_file_name + '.trace')
+                plan, duration, node_count = run_pddl(lines, method_stats=method_stats, \
+                                                      trace_file=trace_file)
 
             # Printing to the report file.
             if plan:
@@ -201,6 +260,9 @@ def multi_test():
             pddl_file.close()
     
     report_file.close()
+    if profile:
+        the_domain.stop_profiling()
+        gtpyhop.print_profile(the_domain)
     print(f'\n---------------------------')
     print(f'\nTested {file_count} problems')
     print(f'\n{failed_count} plans failed out of {file_count}')
\ No newline at end of file
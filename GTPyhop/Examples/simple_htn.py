@@ -183,9 +183,10 @@ gtpyhop.declare_task_methods('travel',do_nothing,travel_by_foot,travel_by_taxi)
 ###############################################################################
 # Running the examples
 
-print('-----------------------------------------------------------------------')
-print(f"Created the domain '{domain_name}'. To run the examples, type this:")
-print(f"{domain_name}.main()")
+if not gtpyhop.quiet:
+    print('-----------------------------------------------------------------------')
+    print(f"Created the domain '{domain_name}'. To run the examples, type this:")
+    print(f"{domain_name}.main()")
 
 def main(do_pauses=True):
     """
@@ -0,0 +1,73 @@
+"""
+A benchmark of the time it takes to start a pool of worker processes that
+are ready to plan in one of the example domains. It compares workers that
+import all of the example domains with workers that use
+gtpyhop.get_domain to import only the one they need (see example_domains).
+The workers are started with the 'spawn' method, so each of them imports
+everything itself, as on Windows and macOS.
+
+To run it, go to the Examples directory, launch Python 3, and type:
+    import startup_benchmark
+    startup_benchmark.startup_benchmark()
+"""
+
+# kludge to make gtpyhop available regardless of whether the current directory
+# is the Examples directory or its parent (where gtpyhop.py is located)
+#
+import sys
+sys.path.append('../')
+import gtpyhop
+
+import example_domains
+import importlib
+import multiprocessing
+import time
+
+
+def _import_all(domain_name):
+    """Worker initializer that imports every example domain."""
+    for name in example_domains.domain_names:
+        importlib.import_module(name)
+    gtpyhop.current_domain = gtpyhop.get_domain(domain_name)
+
+
+def _import_one(domain_name):
+    """Worker initializer that imports only the domain it needs."""
+    gtpyhop.current_domain = gtpyhop.get_domain(domain_name)
+
+
+def _ready(i):
+    """Return the name of the worker's domain, to show that it's ready."""
+    return gtpyhop.current_domain.__name__
+
+
+def _start_pool(initializer, domain_name, workers):
+    """Return the time it takes to start 'workers' workers and get replies."""
+    context = multiprocessing.get_context('spawn')
+    start_time = time.perf_counter()
+    with context.Pool(workers, initializer, (domain_name,)) as pool:
+        # chunksize=1 and one call per worker make every worker answer
+        names = pool.map(_ready, range(workers), chunksize=1)
+        elapsed = time.perf_counter() - start_time
+    if set(names) != {domain_name}:
+        raise Exception(f"startup_benchmark: the workers have domains {set(names)}")
+    return elapsed
+
+
+def startup_benchmark(worker_counts=(1, 2, 4, 8), domain_name='satellite_htn', repeat=3):
+    """
+    For each number of workers in worker_counts, start a pool of that many
+    workers for the domain called domain_name, once with workers that import
+    all of the example domains and once with workers that import only that
+    one, and print the best of 'repeat' times for each.
+    """
+    results = []
+    for workers in worker_counts:
+        eager = min([_start_pool(_import_all, domain_name, workers) for _ in range(repeat)])
+        lazy = min([_start_pool(_import_one, domain_name, workers) for _ in range(repeat)])
+        results.append((workers, eager, lazy))
+
+    print(f'\n{"Workers":>8}{"Import all":>14}{"Import one":>14}{"Ratio":>8}')
+    for (workers, eager, lazy) in results:
+        print(f'{workers:>8}{eager*1000:>12.1f}ms{lazy*1000:>12.1f}ms{eager/lazy:>8.2f}')
+    return results
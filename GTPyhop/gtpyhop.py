@@ -17,7 +17,8 @@ of the modules in the Examples directory.
 # from IPython import embed
 # from IPython.terminal.debugger import set_trace
 
-import copy, sys, pprint, re
+import copy, sys, os, pprint, re, collections.abc, types, time, contextvars, json, array, \
+       functools, importlib, weakref, threading
 
 ################################################################################
 # How much information to print while the program is running
@@ -32,12 +33,214 @@ much debugging information GTPyhop will print:
  - verbose = 3: also print some info about intermediate computations
 """
 
+
+output = None
+"""
+output is the file-like object to which GTPyhop prints its messages. Its
+initial value is None, which means sys.stdout (the value that sys.stdout has
+when the message is printed, so contextlib.redirect_stdout works too).
+"""
+
+
+def _print(*args, **kwargs):
+    """
+    GTPyhop prints its messages with this function instead of Python's print
+    function. They're the same, except that if the 'file' argument isn't
+    given, this one prints to 'output'.
+    """
+    if kwargs.get('file') == None:
+        kwargs['file'] = _output_file()
+    print(*args, **kwargs)
+
+
+def _output_file():
+    """Return the file-like object that 'output' stands for."""
+    return sys.stdout if output == None else output
+
+
+def _in_worker_process():
+    """Return True if this is a process that multiprocessing started."""
+    multiprocessing = sys.modules.get('multiprocessing')
+    if multiprocessing == None:
+        return False
+    # while a spawned process is unpickling what its parent sent, which may
+    # import GTPyhop, it's _inheriting, and it doesn't have a parent_process yet
+    return multiprocessing.parent_process() != None or \
+           getattr(multiprocessing.current_process(), '_inheriting', False)
+
+
+quiet = os.environ.get('GTPYHOP_QUIET', '') not in ('', '0') or _in_worker_process()
+"""
+quiet is a global value that says whether to leave out the messages that
+GTPyhop and the example domains print when they're imported. Since it needs
+a value before GTPyhop is imported, its initial value is True if the
+environment variable GTPYHOP_QUIET is set to something other than '' or '0',
+or if GTPyhop is being imported in a worker process (e.g., one started by
+find_plans), and False otherwise. For example, in a Unix shell:
+    GTPYHOP_QUIET=1 python3 my_batch_run.py
+"""
+
 ################################################################################
 # States and goals
 
 # Sequence number to use when making copies of states.
 _next_state_number = 0
 
+class _CopyOnWriteDict(collections.abc.MutableMapping):
+    """
+    _CopyOnWriteDict is the representation that states and multigoals use
+    for the values of state variables that are dictionaries. It behaves like
+    a dictionary, but several states may share the same underlying
+    dictionary; the first time one of them modifies it, e.g. by doing
+        s.loc['c'] = 'room3'
+    that state gets its own (shallow) copy of the dictionary. Thus copying a
+    state doesn't copy the dictionaries that the actions never modify.
+
+    Since the copies are shallow, actions shouldn't modify mutable objects
+    that are stored *inside* a state variable's dictionary (for example, by
+    appending to a list); they should assign a new value instead.
+
+    A _CopyOnWriteDict also keeps a Zobrist-style hash of its contents: the
+    exclusive-or of the hashes of its (key, value) pairs. It's computed the
+    first time it's needed, and after that each assignment updates it in
+    constant time. State.__hash__ uses it.
+
+    Finally, a _CopyOnWriteDict keeps a write log: a linked list
+    (key, earlier_log, n) of the keys that have been assigned or deleted,
+    most recent first, ending in a cell whose key is _log_start, where n is
+    the number of cells before that one. A copy shares the log of the
+    original, and each one adds to its own end of it, so two dictionaries
+    that have the same log (the same object, not just equal) have the same
+    contents. _MultigoalTracker uses the logs to find what has changed since
+    it last looked at a state. So that the logs don't grow without limit, a
+    log with _max_log_length cells is replaced by a new one (see _add_to_log).
+    """
+
+    __slots__ = ('_data', '_owned', '_h', '_log')
+
+    def __init__(self, data, owned=False, h=None, log=None):
+        """
+        'data' is the underlying dictionary. 'owned' tells whether this
+        object is the only one that uses it. 'h' is the hash of data's
+        contents, or None if it hasn't been computed. 'log' is the write log
+        to share, or None to start a new one.
+        """
+        self._data = data
+        self._owned = owned
+        self._h = h
+        self._log = (_log_start, None, 0) if log is None else log
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        data = self._data
+        if not self._owned:
+            data = self._data = dict(data)
+            self._owned = True
+        if self._h is not None:
+            if key in data:
+                self._h ^= _binding_hash(key, data[key])
+            self._h ^= _binding_hash(key, value)
+        data[key] = value
+        log = self._log
+        if log[2] < _max_log_length:
+            self._log = (key, log, log[2] + 1)
+        else:
+            self._log = _add_to_log(log, key)
+
+    def __delitem__(self, key):
+        data = self._data
+        if not self._owned:
+            data = self._data = dict(data)
+            self._owned = True
+        if self._h is not None and key in data:
+            self._h ^= _binding_hash(key, data[key])
+        del data[key]
+        self._log = _add_to_log(self._log, key)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if type(other) is _CopyOnWriteDict:
+            other = other._data
+        return self._data == other
+
+    def __repr__(self):
+        return repr(self._data)
+
+    def __deepcopy__(self, memo):
+        return _CopyOnWriteDict(copy.deepcopy(self._data, memo), True, self._h)
+
+    def __reduce__(self):
+        # the hash isn't pickled, since string hashes differ between processes
+        return (_CopyOnWriteDict, (self._data, True))
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def keys(self):
+        return self._data.keys()
+
+    def items(self):
+        return self._data.items()
+
+    def values(self):
+        return self._data.values()
+
+    def copy(self):
+        """Return an ordinary dictionary containing the same items."""
+        return dict(self._data)
+
+    def _share(self):
+        """
+        Return a new _CopyOnWriteDict that shares self's dictionary. After
+        this, neither of them may modify the dictionary without copying it.
+        """
+        self._owned = False
+        return _CopyOnWriteDict(self._data, False, self._h, self._log)
+
+    def _hash(self):
+        """Return the hash of the dictionary's contents."""
+        if self._h is None:
+            h = 0
+            for (key, value) in self._data.items():
+                h ^= _binding_hash(key, value)
+            self._h = h
+        return self._h
+
+
+# The key in the first cell of every _CopyOnWriteDict's write log.
+_log_start = object()
+
+# The maximum number of writes in a write log. Going back further than this
+# wouldn't help _MultigoalTracker unless a multigoal had more goals than
+# this for a single state variable.
+_max_log_length = 256
+
+
+def _add_to_log(log, key):
+    """
+    Return the write log 'log' with a cell for 'key' added to it, or if log
+    already has _max_log_length cells, a new log that has only that cell.
+    """
+    n = log[2]
+    if n < _max_log_length:
+        return (key, log, n + 1)
+    return (key, (_log_start, None, 0), 1)
+
+
+# Types of state-variable values that State.copy can share without copying.
+_immutable_types = {str, int, float, bool, complex, bytes, tuple, frozenset,
+                    type(None)}
+
 class State():
     """
     s = State(state_name, **kwargs) creates an object that contains the
@@ -68,7 +271,8 @@ class State():
         args are the names and initial values of state variables.
         """
         self.__name__ = state_name
-        vars(self).update(kwargs)
+        for (varname, val) in kwargs.items():
+            setattr(self, varname, val)
             
     def __str__(self):
         return f"<State {self.__name__}>"
@@ -76,18 +280,62 @@ class State():
     def __repr__(self):
         return _make_repr(self, 'State')
 
+    def __setattr__(self, varname, val):
+        _set_state_var(self, varname, val)
+
+    def __eq__(self, other):
+        """
+        Two states are equal if they have the same state-variable bindings,
+        regardless of their names.
+        """
+        return _bindings_equal(self, other)
+
+    def __hash__(self):
+        """
+        The hash is computed from the state-variable bindings, and is updated
+        incrementally when they change. Don't modify a state while it's being
+        used as a dictionary key.
+        """
+        return _bindings_hash(self)
+
     def copy(self,new_name=None):
         """
         Make a copy of the state. For its name, use new_name if it is given.
         Otherwise use the old name, with a suffix '_copy#' where # is an integer.
+
+        The copy shares each state variable's dictionary with the original
+        state until one of them modifies it (see _CopyOnWriteDict). Values
+        that aren't dictionaries or immutable objects are deep-copied.
         """
         global _next_state_number
-        the_copy = copy.deepcopy(self)
         if new_name:
-            the_copy.__name__ = new_name
+            the_copy = self._copy(new_name)
         else:
-            the_copy.__name__ = _name_for_copy(the_copy.__name__, _next_state_number)
+            the_copy = self._copy(_name_for_copy(self.__name__, _next_state_number))
             _next_state_number += 1
+        planner = _current_planner.get()
+        if planner is not None:
+            planner.stats.state_copies += 1
+        return the_copy
+
+    def _copy(self, name):
+        """
+        copy's work: return a copy of the state whose name is 'name'. It
+        isn't counted in the search statistics.
+        """
+        the_copy = object.__new__(type(self))
+        copy_vars = vars(the_copy)
+        for (varname, val) in vars(self).items():
+            if type(val) is _CopyOnWriteDict or type(val) is _CompactVariable:
+                copy_vars[varname] = val._share()
+            elif type(val) is dict:
+                # an ordinary dictionary that the user assigned; copy it once
+                copy_vars[varname] = _CopyOnWriteDict(dict(val), True)
+            elif type(val) in _immutable_types:
+                copy_vars[varname] = val
+            else:
+                copy_vars[varname] = copy.deepcopy(val)
+        the_copy.__name__ = name
         return the_copy
 
     def display(self, heading=None):
@@ -134,7 +382,8 @@ class Multigoal():
         args are the names and desired values of state variables.
         """
         self.__name__ = multigoal_name
-        vars(self).update(kwargs)
+        for (varname, val) in kwargs.items():
+            setattr(self, varname, val)
             
     def __str__(self):
         return f"<Multigoal {self.__name__}>"
@@ -142,6 +391,23 @@ class Multigoal():
     def __repr__(self):
         return _make_repr(self, 'Multigoal')
 
+    def __setattr__(self, varname, val):
+        _set_state_var(self, varname, val)
+
+    def __eq__(self, other):
+        """
+        Two multigoals are equal if they have the same state-variable
+        bindings, regardless of their names.
+        """
+        return _bindings_equal(self, other)
+
+    def __hash__(self):
+        """
+        The hash is computed from the state-variable bindings. Don't modify a
+        multigoal while it's being used as a dictionary key.
+        """
+        return _bindings_hash(self)
+
     def copy(self,new_name=None):
         """
         Make a copy of the multigoal. For its name, use new_name if it is given.
@@ -180,6 +446,77 @@ def _make_repr(object, class_name):
     return x
     
 
+def _set_state_var(object, varname, val):
+    """
+    Bind the state variable 'varname' to 'val' in 'object', which may be
+    either a state or a multigoal. A dictionary is copied into a
+    _CopyOnWriteDict, so that the object's hash, write logs, etc., can be
+    kept up to date when the dictionary is modified. Copying it means that
+    if the caller modifies the dictionary afterward, or assigns it to
+    another object too, the object doesn't change behind GTPyhop's back.
+    Another object's _CopyOnWriteDict is shared in the usual way.
+    """
+    if type(val) is dict:
+        val = _CopyOnWriteDict(dict(val), True)
+    elif type(val) is _CopyOnWriteDict:
+        val = val._share()
+    elif type(val) is _CompactVariable:
+        val = _CopyOnWriteDict(val.copy(), True)
+    vars(object)[varname] = val
+
+
+def _binding_hash(key, val):
+    """Return the hash of a single binding key = val."""
+    try:
+        return hash((key, val))
+    except TypeError:
+        # e.g., val is a list
+        return hash((key, _freeze(val)))
+
+
+def _bindings_hash(object):
+    """
+    Return a hash of the state-variable bindings in 'object', which may be
+    either a state or a multigoal. It takes time proportional to the number
+    of state variables, since each _CopyOnWriteDict (or _CompactVariable)
+    keeps its own hash.
+    """
+    h = 0
+    for (varname, val) in vars(object).items():
+        if varname != '__name__':
+            if type(val) is _CopyOnWriteDict or type(val) is _CompactVariable:
+                h ^= hash((varname, val._hash()))
+            else:
+                h ^= _binding_hash(varname, val)
+    return h
+
+
+def _bindings_equal(object1, object2):
+    """
+    Return True if object1 and object2 are of the same type and have the
+    same state-variable bindings, and NotImplemented if they're of
+    different types. Dictionaries that are shared by the two objects are
+    known to be equal without comparing them.
+    """
+    if type(object1) is not type(object2):
+        return NotImplemented
+    vars1 = vars(object1)
+    vars2 = vars(object2)
+    if len(vars1) != len(vars2):
+        return False
+    for (varname, val1) in vars1.items():
+        if varname != '__name__':
+            if varname not in vars2:
+                return False
+            val2 = vars2[varname]
+            if val1 is val2 or (type(val1) in _shared_types and \
+                    type(val2) is type(val1) and val1._data is val2._data):
+                continue
+            if val1 != val2:
+                return False
+    return True
+
+
 def _name_for_copy(old_name,next_integer):
     """
     Create a name to use for a copy of an object.
@@ -206,14 +543,14 @@ def _print_object(object, heading=None):
     if object != False:
         title = f"{heading} {object.__name__}:"
         dashes = '-'*len(title)
-        print(title)
-        print(dashes)
+        _print(title)
+        _print(dashes)
         for (varname,val) in vars(object).items():
             if varname != '__name__':
-                print(f"  - {varname} = {val}")
-        print('')
+                _print(f"  - {varname} = {val}")
+        _print('')
     else: 
-        print('{heading} = False','\n')
+        _print('{heading} = False','\n')
 
 
 # print_state and print_multigoal are identical except for their names.
@@ -225,6 +562,410 @@ def get_type(object):
     return type(object).__name__
 
 
+################################################################################
+# Compact states
+
+
+class StateLayout():
+    """
+    layout = StateLayout(**kwargs) declares the state variables of the
+    CompactStates that use it. Each keyword arg is the name of a state
+    variable, and its value is a list of the keys (e.g., object names) that
+    the state variable may have, or None if the state variable's value
+    isn't a dictionary. For example:
+        layout = StateLayout(pos=['a', 'b', 'c'], clear=['a', 'b', 'c'],
+                             holding=['hand'], fuel_used=None)
+    Each key of a state variable gets an integer index into the list in
+    which a CompactState stores that state variable's values.
+    """
+
+    def __init__(self, **kwargs):
+        # maps each state-variable name to a dictionary that maps each of its
+        # keys to the key's index, or to None if its value isn't a dictionary
+        self.variables = {}
+        for (varname, keys) in kwargs.items():
+            if keys is None:
+                self.variables[varname] = None
+            else:
+                self.variables[varname] = {key: i for (i, key) in enumerate(keys)}
+
+    def __repr__(self):
+        return 'StateLayout(' + ', '.join([f'{v}={None if index is None else list(index)}' \
+                                           for (v, index) in self.variables.items()]) + ')'
+
+    def __eq__(self, other):
+        if type(other) is not StateLayout:
+            return NotImplemented
+        return self is other or self.variables == other.variables
+
+    def __hash__(self):
+        return hash(tuple(self.variables))
+
+
+class _UnsetType():
+    """The type of _unset, which marks keys that have no value."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return '_unset'
+
+    def __reduce__(self):
+        return '_unset'
+
+_unset = _UnsetType()
+
+
+class CompactState(State):
+    """
+    s = CompactState(state_name, layout, **kwargs) creates a state whose
+    state variables are the ones declared in 'layout', a StateLayout. It
+    stores the values of each state variable whose values are dictionaries
+    in a list rather than a dictionary, so it takes much less memory than a
+    State, and copying a state variable when a copy of the state modifies
+    it copies a list rather than a dictionary. The keyword args are the
+    names and values of state variables, as in State. For example:
+        s = CompactState('s', layout, pos={'a':'b', 'b':'table', 'c':'table'},
+                         clear={'a':True, 'b':False, 'c':True},
+                         holding={'hand':False}, fuel_used=0)
+
+    s.pos['a'] and the other ways of using a State's state variables work in
+    the usual way (s.pos is a _CompactVariable), except that a state
+    variable can have only the keys that the layout declares for it, and a
+    CompactState can't have state variables that the layout doesn't
+    declare. Assigning a dictionary to a state variable, e.g. s.pos = {...},
+    replaces all of its values. Otherwise a CompactState works like a State.
+
+    compact_state(state) converts a State to a CompactState.
+    """
+
+    __slots__ = ('_layout',)
+
+    def __init__(self, state_name, layout, **kwargs):
+        """
+        state_name is the name to use for the state, and layout is its
+        StateLayout. The keyword args are the names and initial values of
+        state variables. The state variables whose values are dictionaries
+        start out with no keys.
+        """
+        _set_layout(self, layout)
+        self.__name__ = state_name
+        for (varname, index) in layout.variables.items():
+            if index is not None:
+                vars(self)[varname] = _CompactVariable(index, [_unset] * len(index), True)
+        for (varname, val) in kwargs.items():
+            setattr(self, varname, val)
+
+    def __str__(self):
+        return f"<CompactState {self.__name__}>"
+
+    def __repr__(self):
+        return _make_repr(self, 'CompactState')
+
+    def __setattr__(self, varname, val):
+        if varname == '__name__':
+            vars(self)['__name__'] = val
+            return
+        variables = self._layout.variables
+        if varname not in variables:
+            raise Exception(f"{self}: state variable {varname!r} " + \
+                            "isn't declared in its StateLayout")
+        index = variables[varname]
+        if index is None:
+            _set_state_var(self, varname, val)
+        elif type(val) is _CompactVariable and val._index is index:
+            vars(self)[varname] = val._share()
+        elif isinstance(val, collections.abc.Mapping):
+            data = [_unset] * len(index)
+            for (key, x) in val.items():
+                if key not in index:
+                    raise KeyError(f"{self}: key {key!r} isn't declared for {varname}")
+                data[index[key]] = x
+            vars(self)[varname] = _CompactVariable(index, data, True)
+        else:
+            raise Exception(f"{self}: the value of {varname} must be a dictionary")
+
+    def __reduce__(self):
+        state_vars = {v: val.copy() if type(val) is _CompactVariable else val \
+                      for (v, val) in vars(self).items() if v != '__name__'}
+        return (_make_compact_state, (self.__name__, self._layout, state_vars))
+
+    def _copy(self, name):
+        """
+        copy's work: return a copy of the state whose name is 'name'. It
+        isn't counted in the search statistics.
+        """
+        the_copy = State._copy(self, name)
+        _set_layout(the_copy, self._layout)
+        return the_copy
+
+
+# sets a CompactState's layout, bypassing CompactState.__setattr__
+_set_layout = CompactState._layout.__set__
+
+
+def _make_compact_state(state_name, layout, state_vars):
+    """Make a CompactState (for pickle)."""
+    return CompactState(state_name, layout, **state_vars)
+
+
+def compact_state(state, new_name=None, layout=None):
+    """
+    Return a CompactState that has the same state variables and values as
+    'state', a State. For its name, use new_name if it is given, otherwise
+    state's name. If layout isn't given, it's a StateLayout that declares
+    the keys that the state variables have in 'state', and declares the
+    state variables whose values aren't dictionaries with None.
+    """
+    state_vars = {v: vars(state)[v] for v in vars(state) if v != '__name__'}
+    if layout is None:
+        layout = StateLayout(**{v: list(val) if isinstance(val, collections.abc.Mapping) \
+                                else None for (v, val) in state_vars.items()})
+    return CompactState(new_name or state.__name__, layout, **state_vars)
+
+
+class _CompactVariable(collections.abc.MutableMapping):
+    """
+    The value of a CompactState's state variable whose values are
+    dictionaries. It works like a dictionary, so that s.pos['a'],
+    s.pos['a'] = 'b', s.pos.items(), etc., work as usual, but it stores the
+    values in a list, in the order of the indices that the StateLayout
+    gives the keys. Keys that have no value hold _unset.
+
+    Otherwise it works like a _CopyOnWriteDict: copies of the state share
+    the list until one of them modifies it, and it keeps a Zobrist-style
+    hash of its contents and a write log.
+    """
+
+    __slots__ = ('_index', '_data', '_owned', '_h', '_log')
+
+    def __init__(self, index, data, owned=False, h=None, log=None):
+        """
+        'index' maps each key to its index in 'data', the list of values. The
+        other arguments are as in _CopyOnWriteDict.
+        """
+        self._index = index
+        self._data = data
+        self._owned = owned
+        self._h = h
+        self._log = (_log_start, None, 0) if log is None else log
+
+    def __getitem__(self, key):
+        val = self._data[self._index[key]]
+        if val is _unset:
+            raise KeyError(key)
+        return val
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        if i is None:
+            return default
+        val = self._data[i]
+        return default if val is _unset else val
+
+    def __setitem__(self, key, value):
+        i = self._index.get(key)
+        if i is None:
+            raise KeyError(f"key {key!r} isn't declared in the StateLayout")
+        data = self._data
+        if not self._owned:
+            data = self._data = list(data)
+            self._owned = True
+        if self._h is not None:
+            if data[i] is not _unset:
+                self._h ^= _binding_hash(key, data[i])
+            self._h ^= _binding_hash(key, value)
+        data[i] = value
+        log = self._log
+        if log[2] < _max_log_length:
+            self._log = (key, log, log[2] + 1)
+        else:
+            self._log = _add_to_log(log, key)
+
+    def __delitem__(self, key):
+        if self.get(key, _unset) is _unset:
+            raise KeyError(key)
+        data = self._data
+        if not self._owned:
+            data = self._data = list(data)
+            self._owned = True
+        i = self._index[key]
+        if self._h is not None:
+            self._h ^= _binding_hash(key, data[i])
+        data[i] = _unset
+        self._log = _add_to_log(self._log, key)
+
+    def __contains__(self, key):
+        return self.get(key, _unset) is not _unset
+
+    def __iter__(self):
+        data = self._data
+        return iter([key for (key, i) in self._index.items() if data[i] is not _unset])
+
+    def __len__(self):
+        data = self._data
+        return sum(1 for i in self._index.values() if data[i] is not _unset)
+
+    def __eq__(self, other):
+        if type(other) is _CompactVariable and other._index is self._index:
+            return self._data == other._data
+        return collections.abc.Mapping.__eq__(self, other)
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def __deepcopy__(self, memo):
+        return _CompactVariable(self._index, copy.deepcopy(self._data, memo), True, self._h)
+
+    def __reduce__(self):
+        # the hash isn't pickled, since string hashes differ between processes
+        return (_CompactVariable, (self._index, list(self._data), True))
+
+    # The following are faster than MutableMapping's versions. They return
+    # lists rather than views.
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        data = self._data
+        return [(key, data[i]) for (key, i) in self._index.items() if data[i] is not _unset]
+
+    def values(self):
+        data = self._data
+        return [data[i] for i in self._index.values() if data[i] is not _unset]
+
+    def copy(self):
+        """Return an ordinary dictionary containing the same items."""
+        return dict(self.items())
+
+    def _share(self):
+        """
+        Return a new _CompactVariable that shares self's list. After this,
+        neither of them may modify the list without copying it.
+        """
+        self._owned = False
+        return _CompactVariable(self._index, self._data, False, self._h, self._log)
+
+    def _hash(self):
+        """Return the hash of the contents, computed as _CopyOnWriteDict does."""
+        if self._h is None:
+            h = 0
+            for (key, val) in self.items():
+                h ^= _binding_hash(key, val)
+            self._h = h
+        return self._h
+
+
+# The types of state-variable values that copies of a state share until one of
+# them modifies the value. Each of them has the attributes _data and _log and
+# the methods _share and _hash.
+_shared_types = (_CopyOnWriteDict, _CompactVariable)
+
+
+################################################################################
+# Memoizing functions of states
+
+
+def memoize_per_state(function=None, maxsize=10000):
+    """
+    memoize_per_state is a decorator for helper functions that compute
+    things from a state, such as the preconditions of methods, when they are
+    called repeatedly on the same state with the same arguments. Example:
+        @gtpyhop.memoize_per_state
+        def status(b1, state, mgoal):
+            ...
+    or, to remember at most 1000 results instead of the default 10000:
+        @gtpyhop.memoize_per_state(maxsize=1000)
+        def status(b1, state, mgoal):
+            ...
+
+    The state is the first argument that is a State or CompactState. A
+    result is reused only if the function is called with equal arguments on
+    a state that has the same version of every state variable: the same
+    dictionaries, as shown by their write logs (see _CopyOnWriteDict), and
+    the same values of the other state variables. So assigning to a state
+    variable, e.g.
+        s.pos['a'] = 'table'   or   s.pos = {...},
+    invalidates the results for s but not the ones for its copies. The
+    function must depend only on its arguments, and it must not modify a
+    state variable's value in place unless the value is a dictionary.
+    Arguments that aren't hashable are compared by value (see _freeze).
+    Calls with keyword arguments aren't memoized.
+
+    Results are shared, so the caller mustn't modify them. The decorated
+    function has a cache_clear() method, and attributes 'hits' and 'misses'.
+    """
+    if function is None:
+        return lambda function: memoize_per_state(function, maxsize)
+    cache = collections.OrderedDict()
+
+    def memoized(*args, **kwargs):
+        if kwargs:
+            return function(*args, **kwargs)
+        for (i, x) in enumerate(args):
+            if isinstance(x, State):
+                (state_key, versions) = _state_version(x)
+                break
+        else:
+            return function(*args)
+        key = (state_key, i) + tuple([_memo_arg(y) for y in args if y is not x])
+        entry = cache.get(key)
+        if entry is not None:
+            cache.move_to_end(key)
+            memoized.hits += 1
+            return entry[1]
+        memoized.misses += 1
+        result = function(*args)
+        # keeping the versions keeps their ids, which are in key, from being reused
+        cache[key] = (versions, result)
+        if len(cache) > maxsize:
+            cache.popitem(last=False)
+        return result
+
+    def cache_clear():
+        """Forget all of the memoized results."""
+        cache.clear()
+        (memoized.hits, memoized.misses) = (0, 0)
+
+    memoized.cache_clear = cache_clear
+    (memoized.hits, memoized.misses) = (0, 0)
+    memoized.__name__ = function.__name__
+    memoized.__qualname__ = function.__qualname__
+    memoized.__module__ = function.__module__
+    memoized.__doc__ = function.__doc__
+    memoized.__wrapped__ = function
+    return memoized
+
+
+def _state_version(state):
+    """
+    Return a pair (key, versions) for memoize_per_state. versions is a list
+    of the objects that identify the current version of each of the state's
+    state variables: its write log if its type is one of _shared_types, or
+    else the value. key is a hashable tuple that contains the names of the
+    state variables and the ids of the versions; it's valid only while
+    versions is kept.
+    """
+    key = []
+    versions = []
+    for (name, val) in vars(state).items():
+        if name != '__name__':
+            version = val._log if type(val) in _shared_types else val
+            key.append(name)
+            key.append(id(version))
+            versions.append(version)
+    return (tuple(key), versions)
+
+
+def _memo_arg(x):
+    """Return a hashable version of an argument, for memoize_per_state."""
+    try:
+        hash(x)
+        return x
+    except TypeError:
+        return _freeze(x)
+
+
 ################################################################################
 # A class for holding planning-and-acting domains.
 
@@ -243,7 +984,12 @@ class Domain():
         
         self.__name__ = domain_name
 
-        _domains.append(self)
+        # forget the domains that no longer exist, so _domains doesn't grow forever
+        _domains[:] = [ref for ref in _domains if ref() is not None]
+        _domains.append(weakref.ref(self))
+        if domain_name in _domain_modules:
+            # keep the domain even if its module doesn't (see register_domain)
+            _registered_domains[domain_name] = self
         current_domain = self
         
         # dictionary that maps each action name to the corresponding function
@@ -263,6 +1009,19 @@ class Domain():
         # list of all methods for multigoals
         self._multigoal_method_list = []
 
+        # read-only table that seek_plan uses to classify to-do list items.
+        # It's None until it's needed, and the declare_* functions reset it
+        # to None; see _dispatch_table below.
+        self._dispatch = None
+
+        # the domain's DomainSnapshot, if there's a current one; see snapshot below
+        self._snapshot = None
+
+        # whether to profile the actions and methods, and what the profiling
+        # has found so far; see start_profiling below
+        self._profiling = False
+        self._profile = {}
+
     def __str__(self):
         return f"<Domain {self.__name__}>"
         
@@ -273,9 +1032,21 @@ class Domain():
         """
         Make a copy of the domain. For its name, use new_name if it is given.
         Otherwise use the old name, with a suffix '_copy#' where # is an integer.
+        The copy has its own tables of actions, commands, and methods, so
+        declaring more of them in one domain doesn't affect the other, but
+        the functions themselves aren't copied. The copy isn't profiled.
         """
         global _next_domain_number
-        the_copy = copy.deepcopy(self)
+        the_copy = copy.copy(self)
+        the_copy._action_dict = self._action_dict.copy()
+        the_copy._command_dict = self._command_dict.copy()
+        the_copy._task_method_dict = \
+            {name: list(methods) for (name, methods) in self._task_method_dict.items()}
+        the_copy._unigoal_method_dict = \
+            {name: list(methods) for (name, methods) in self._unigoal_method_dict.items()}
+        the_copy._multigoal_method_list = list(self._multigoal_method_list)
+        (the_copy._dispatch, the_copy._snapshot) = (None, None)
+        (the_copy._profiling, the_copy._profile) = (False, {})
         if new_name:
             the_copy.__name__ = new_name
         else:
@@ -286,12 +1057,318 @@ class Domain():
     def display(self):
         """Print the domain's actions, commands, and methods."""
         print_domain(self)
-        
+
+    def __getstate__(self):
+        # copy.deepcopy and pickle can't copy the dispatch table, and there's
+        # no need to, because _dispatch_table will rebuild it. Likewise for
+        # the snapshot.
+        domain_vars = vars(self).copy()
+        domain_vars['_dispatch'] = None
+        domain_vars['_snapshot'] = None
+        return domain_vars
+
+    def snapshot(self):
+        """
+        Return a DomainSnapshot of the domain's current contents. Until
+        something more is declared in the domain, it returns the same one.
+        """
+        if self._snapshot == None:
+            self._snapshot = DomainSnapshot(self.__name__, self._action_dict, \
+                self._command_dict, self._task_method_dict, \
+                self._unigoal_method_dict, self._multigoal_method_list)
+        return self._snapshot
+
+    def _changed(self):
+        """Forget the things that depend on the domain's contents."""
+        self._dispatch = None
+        self._snapshot = None
+
+    def start_profiling(self):
+        """
+        Start profiling the domain's actions and methods. While profiling is
+        on, the search engines call each of them through a wrapper that
+        adds up its number of calls, the number of times it failed (i.e.,
+        returned False or None), its total time, and its self time, which
+        leaves out the time spent in other actions and methods that it calls.
+        The time spent copying states for the actions is recorded as
+        'State.copy'. Helper functions that the actions and methods call
+        count toward the caller's self time. When profiling is off, the
+        search engines call the functions directly, so it costs nothing.
+
+        The results accumulate until clear_profile is called; print_profile
+        prints them, and profile_data and save_profile return and save them.
+        Planners that use the domain at the same time in different threads
+        add to the same results, and their self times are unreliable. The
+        worker processes of a parallel search and of find_plans use
+        snapshots of the domain (see snapshot), which aren't profiled.
+        """
+        self._profiling = True
+        self._profile_stack = []
+        self._dispatch = None
+
+    def stop_profiling(self):
+        """Stop profiling, but keep the results."""
+        self._profiling = False
+        self._dispatch = None
+
+    def clear_profile(self):
+        """Forget the profiling results."""
+        self._profile.clear()
+
+    def profile_data(self, sort='self_time'):
+        """
+        Return the profiling results as a list of dictionaries, one for each
+        action, method, and 'State.copy', in decreasing order of 'sort',
+        which is 'self_time', 'total_time', 'calls', or 'failures'. Each
+        dictionary's keys are 'name', 'kind' ('action', 'method', or
+        'copy'), 'calls', 'failures', 'total_time', and 'self_time'; the
+        times are in seconds.
+        """
+        if sort not in _profile_fields[2:]:
+            raise Exception(f"profile_data: can't sort by {sort!r}")
+        entries = [dict(zip(_profile_fields, [name] + counts)) \
+                   for (name, counts) in self._profile.items()]
+        entries.sort(key=lambda entry: (-entry[sort], entry['name']))
+        return entries
+
+    def print_profile(self, sort='self_time', limit=None):
+        """
+        Print the profiling results in decreasing order of 'sort' (see
+        profile_data). If limit isn't None, print only the first 'limit'.
+        """
+        entries = self.profile_data(sort)
+        total = sum([entry['self_time'] for entry in entries]) or 1
+        width = max([len(entry['name']) for entry in entries] + [20]) + 2
+        _print(f'\nProfile of {self.__name__}:')
+        _print(f'{"Name":<{width}}{"Kind":<8}{"Calls":>9}{"Fails":>9}' + \
+              f'{"Total ms":>11}{"Self ms":>11}{"Self %":>8}{"us/call":>9}')
+        for entry in entries[:limit]:
+            _print(f'{entry["name"]:<{width}}{entry["kind"]:<8}{entry["calls"]:>9}' + \
+                  f'{entry["failures"]:>9}{entry["total_time"]*1000:>11.2f}' + \
+                  f'{entry["self_time"]*1000:>11.2f}' + \
+                  f'{100*entry["self_time"]/total:>8.1f}' + \
+                  f'{1e6*entry["self_time"]/max(entry["calls"], 1):>9.1f}')
+
+    def save_profile(self, filename, sort='self_time'):
+        """Write the profiling results to a JSON file (see profile_data)."""
+        with open(filename, 'w') as f:
+            json.dump({'domain': self.__name__, 'profile': self.profile_data(sort)}, \
+                      f, indent=1)
+
+    def _profiled(self, function, kind):
+        """
+        Return a wrapper for 'function' (an action or method) that records
+        its calls in the profile, under the same name that MethodStats uses.
+        """
+        counts = self._profile.setdefault(_method_name(function), [kind, 0, 0, 0.0, 0.0])
+        stack = self._profile_stack
+        def wrapper(*args):
+            start_time = time.perf_counter()
+            stack.append(0.0)       # the time spent in profiled calls it makes
+            try:
+                result = function(*args)
+            finally:
+                elapsed = time.perf_counter() - start_time
+                inner = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                counts[1] += 1
+                counts[3] += elapsed
+                counts[4] += elapsed - inner
+            if result is False or result is None:
+                counts[2] += 1
+            return result
+        functools.update_wrapper(wrapper, function)
+        return wrapper
+
+    def _dispatch_table(self):
+        """
+        Return the domain's dispatch table, building it first if necessary.
+        The table maps each action, task, and unigoal name to a pair
+        (handler, x), where handler is the generator that the search engines
+        use for to-do list items having that name, and x is the action or
+        the tuple of relevant methods. It also maps the Multigoal class to
+        the multigoal handler and methods. Like seek_plan used to do, it
+        gives actions precedence over tasks, and tasks over unigoals. If the
+        domain is being profiled, the actions and methods in the table are
+        the profiling wrappers.
+        """
+        if self._dispatch == None:
+            self._dispatch = _make_dispatch_table(self, \
+                self._profiled if self._profiling else None)
+        return self._dispatch
+
+
+def _make_dispatch_table(domain, profiled=None):
+    """
+    Build the dispatch table (see Domain._dispatch_table) for a Domain or a
+    DomainSnapshot. If profiled isn't None, it's Domain._profiled, and the
+    table contains the profiling wrappers.
+    """
+    if profiled != None:
+        apply_action = _apply_profiled_action
+    else:
+        (apply_action, profiled) = (_apply_action, lambda f, kind: f)
+    table = {}
+    for (name, methods) in domain._unigoal_method_dict.items():
+        table[name] = (_refine_unigoal, \
+                       tuple([profiled(m, 'method') for m in methods]))
+    for (name, methods) in domain._task_method_dict.items():
+        table[name] = (_refine_task, \
+                       tuple([profiled(m, 'method') for m in methods]))
+    for (name, action) in domain._action_dict.items():
+        table[name] = (apply_action, profiled(action, 'action'))
+    table[Multigoal] = (_refine_multigoal, \
+        tuple([profiled(m, 'method') for m in domain._multigoal_method_list]))
+    return types.MappingProxyType(table)
+
+
+class DomainSnapshot():
+    """
+    d.snapshot() returns a DomainSnapshot: an immutable copy of the actions,
+    commands, and methods of the Domain d. It can be used wherever d can,
+    e.g., as find_plan's or Planner's 'domain' argument or as current_domain,
+    except that nothing can be declared in it, and it can't be profiled.
+    Making it costs little, since it shares the functions with d, and it
+    builds its dispatch table once, so any number of planners, in any
+    number of threads, can share it.
+
+    Pickling a DomainSnapshot (e.g., to send it to a worker process) stores
+    just the module and qualified name of each function, so every function
+    must be reachable that way (e.g., not a lambda). When a process unpickles
+    one, it imports the modules and looks up the functions the first time,
+    and reuses the result after that. The parallel search engine and
+    find_plans send snapshots to their worker processes.
+    """
+
+    __slots__ = ('__name__', '_action_dict', '_command_dict', '_task_method_dict', \
+                 '_unigoal_method_dict', '_multigoal_method_list', '_dispatch', \
+                 '_reference')
+
+    def __init__(self, domain_name, actions, commands, task_methods, \
+                 unigoal_methods, multigoal_methods):
+        """
+        The arguments are the domain's name and the contents of its tables:
+        see Domain.__init__.
+        """
+        set_var = super().__setattr__
+        set_var('__name__', domain_name)
+        set_var('_action_dict', types.MappingProxyType(dict(actions)))
+        set_var('_command_dict', types.MappingProxyType(dict(commands)))
+        set_var('_task_method_dict', types.MappingProxyType( \
+            {name: tuple(methods) for (name, methods) in task_methods.items()}))
+        set_var('_unigoal_method_dict', types.MappingProxyType( \
+            {name: tuple(methods) for (name, methods) in unigoal_methods.items()}))
+        set_var('_multigoal_method_list', tuple(multigoal_methods))
+        set_var('_dispatch', _make_dispatch_table(self))
+        set_var('_reference', None)
+
+    def __setattr__(self, name, value):
+        raise Exception(f"{self} is a snapshot, so it can't be changed")
+
+    def __delattr__(self, name):
+        raise Exception(f"{self} is a snapshot, so it can't be changed")
+
+    def __str__(self):
+        return f"<DomainSnapshot {self.__name__}>"
+
+    def __repr__(self):
+        return str(self)
+
+    def __reduce__(self):
+        if self._reference == None:
+            super().__setattr__('_reference', self._make_reference())
+        return (_load_snapshot, (self._reference,))
+
+    def _make_reference(self):
+        """
+        Return a hashable tuple of the snapshot's name and tables, with each
+        function replaced by its module and qualified name.
+        """
+        def refs(functions):
+            return tuple([_function_reference(f) for f in functions])
+        return (self.__name__, \
+                tuple(self._action_dict), refs(self._action_dict.values()), \
+                tuple(self._command_dict), refs(self._command_dict.values()), \
+                tuple([(name, refs(methods)) for (name, methods) \
+                       in self._task_method_dict.items()]), \
+                tuple([(name, refs(methods)) for (name, methods) \
+                       in self._unigoal_method_dict.items()]), \
+                refs(self._multigoal_method_list))
+
+    def snapshot(self):
+        """Return the snapshot itself, since it can't change."""
+        return self
+
+    def display(self):
+        """Print the snapshot's actions, commands, and methods."""
+        print_domain(self)
+
+    def _dispatch_table(self):
+        return self._dispatch
+
+
+def _function_reference(function):
+    """
+    Return (module name, qualified name) for function, after making sure
+    that they lead back to function.
+    """
+    reference = (function.__module__, function.__qualname__)
+    try:
+        found = _function_from_reference(reference)
+    except (ImportError, AttributeError):
+        found = None
+    if found is not function:
+        raise Exception(f"DomainSnapshot: can't refer to {function} by its name")
+    return reference
+
+
+def _function_from_reference(reference):
+    """Return the function that (module name, qualified name) refers to."""
+    (module_name, qualified_name) = reference
+    x = sys.modules.get(module_name) or importlib.import_module(module_name)
+    for name in qualified_name.split('.'):
+        x = getattr(x, name)
+    return x
+
+
+# The DomainSnapshots that this process has unpickled, indexed by their
+# references; see DomainSnapshot._make_reference and _load_snapshot
+_loaded_snapshots = {}
+
+
+def _load_snapshot(reference):
+    """
+    Return the DomainSnapshot whose _make_reference is reference, making it
+    if this process hasn't already done so.
+    """
+    snapshot = _loaded_snapshots.get(reference)
+    if snapshot == None:
+        (domain_name, action_names, actions, command_names, commands, \
+         task_methods, unigoal_methods, multigoal_methods) = reference
+        def functions(refs):
+            return [_function_from_reference(r) for r in refs]
+        snapshot = DomainSnapshot(domain_name, \
+            dict(zip(action_names, functions(actions))), \
+            dict(zip(command_names, functions(commands))), \
+            {name: functions(refs) for (name, refs) in task_methods}, \
+            {name: functions(refs) for (name, refs) in unigoal_methods}, \
+            functions(multigoal_methods))
+        super(DomainSnapshot, snapshot).__setattr__('_reference', reference)
+        _loaded_snapshots[reference] = snapshot
+    return snapshot
+
+
+
+_profile_fields = ('name', 'kind', 'calls', 'failures', 'total_time', 'self_time')
+
 
 # Sequence number to use when making copies of domains.
 _next_domain_number = 0
 
-# A list of all domains that have been created
+# Weak references to the domains that have been created, oldest first. A
+# domain whose name is registered is also in _registered_domains, which keeps
+# it alive; any other domain disappears once nothing else refers to it.
 _domains = []
 
 
@@ -300,6 +1377,66 @@ current_domain = None
 The Domain object that find_plan, run_lazy_lookahead, etc., will use.
 """
 
+
+# Maps the names of domains to the modules that create them; see register_domain
+_domain_modules = {}
+
+# Maps the names of registered domains to the most recently created domain
+# having each name
+_registered_domains = {}
+
+
+def register_domain(domain_name, module_name):
+    """
+    Say that the module (or package) called module_name creates the domain
+    called domain_name, without importing the module yet. get_domain will
+    import it the first time the domain is needed. Thus a program, e.g., a
+    worker process in a batch run, can register many domains and pay the
+    cost of importing only the ones it uses.
+
+    GTPyhop keeps the most recently created domain called domain_name even
+    if nothing else refers to it. It doesn't keep other domains: get_domain
+    can't find one that has been garbage-collected.
+    """
+    _domain_modules[domain_name] = module_name
+    domain = _find_domain(domain_name)
+    if domain != None:
+        _registered_domains[domain_name] = domain
+
+
+def _find_domain(domain_name):
+    """Return the most recently created domain called domain_name, or None."""
+    for ref in reversed(_domains):
+        domain = ref()
+        if domain != None and domain.__name__ == domain_name:
+            return domain
+    return None
+
+
+def get_domain(domain_name):
+    """
+    Return the most recently created domain called domain_name. If there's
+    no such domain, but domain_name has been registered with register_domain,
+    import its module first. Importing the module doesn't change
+    current_domain.
+    """
+    global current_domain
+    domain = _find_domain(domain_name)
+    if domain != None:
+        return domain
+    module_name = _domain_modules.get(domain_name)
+    if module_name == None:
+        raise Exception(f"get_domain: there's no domain called {domain_name!r}")
+    old_domain = current_domain
+    try:
+        importlib.import_module(module_name)
+    finally:
+        current_domain = old_domain
+    domain = _find_domain(domain_name)
+    if domain != None:
+        return domain
+    raise Exception(f"get_domain: importing {module_name} didn't create {domain_name!r}")
+
 ################################################################################
 # Functions to print information about a domain
 
@@ -311,23 +1448,34 @@ def print_domain(domain=None):
     """
     if domain == None:
         domain = current_domain
-    print(f'\nDomain name: {domain.__name__}')
+    _print(f'\nDomain name: {domain.__name__}')
     print_actions(domain)
     print_commands(domain)
     print_methods(domain)
 
+def print_profile(domain=None, sort='self_time', limit=None):
+    """
+    Print the profiling results for the domain (see Domain.start_profiling).
+    If domain isn't given, it defaults to current_domain. 'sort' and
+    'limit' are as in Domain.print_profile.
+    """
+    if domain == None:
+        domain = current_domain
+    domain.print_profile(sort, limit)
+
+
 def print_actions(domain=None):
     """Print the names of all the actions"""
     if domain == None:
         domain = current_domain
     if domain._action_dict:
-        print('-- Actions:', ', '.join(domain._action_dict))
+        _print('-- Actions:', ', '.join(domain._action_dict))
     else:
-        print('-- There are no actions --')
+        _print('-- There are no actions --')
 
 def print_operators():
     if verbose > 0:
-        print("""
+        _print("""
         >> print_operators exists to provide backward compatibility
         >> with Pyhop. In the future, please use print_actions instead.""")
     return print_actions()
@@ -337,42 +1485,42 @@ def print_commands(domain=None):
     if domain == None:
         domain = current_domain
     if domain._command_dict:
-        print('-- Commands:', ', '.join(domain._command_dict))
+        _print('-- Commands:', ', '.join(domain._command_dict))
     else:
-        print('-- There are no commands --')
+        _print('-- There are no commands --')
 
 def _print_task_methods(domain):
     """Print a table of the task_methods for each task"""
     if domain._task_method_dict:
-        print('')
-        print('Task name:         Relevant task methods:')
-        print('---------------    ----------------------')
+        _print('')
+        _print('Task name:         Relevant task methods:')
+        _print('---------------    ----------------------')
         for task in domain._task_method_dict:
-            print(f'{task:<19}' + ', '.join(    \
+            _print(f'{task:<19}' + ', '.join(    \
                 [f.__name__ for f in domain._task_method_dict[task]]))
-        print('')
+        _print('')
     else:
-        print('-- There are no task methods --')
+        _print('-- There are no task methods --')
 
 def _print_unigoal_methods(domain):
     """Print a table of the unigoal_methods for each state_variable_name"""
     if domain._unigoal_method_dict:
-        print('State var name:    Relevant unigoal methods:')
-        print('---------------    -------------------------')
+        _print('State var name:    Relevant unigoal methods:')
+        _print('---------------    -------------------------')
         for var in domain._unigoal_method_dict:
-            print(f'{var:<19}' + ', '.join( \
+            _print(f'{var:<19}' + ', '.join( \
                 [f.__name__ for f in domain._unigoal_method_dict[var]]))
-        print('')
+        _print('')
     else:
-        print('-- There are no unigoal methods --')
+        _print('-- There are no unigoal methods --')
 
 def _print_multigoal_methods(domain):
     """Print the names of all the multigoal_methods"""
     if domain._multigoal_method_list:
-        print('-- Multigoal methods:', ', '.join(  \
+        _print('-- Multigoal methods:', ', '.join(  \
                 [f.__name__ for f in domain._multigoal_method_list]))
     else:
-        print('-- There are no multigoal methods --')
+        _print('-- There are no multigoal methods --')
     
 def print_methods(domain=None):
     """Print tables showing what all the methods are"""
@@ -387,6 +1535,15 @@ def print_methods(domain=None):
 # Functions to declare actions, commands, tasks, unigoals, multigoals
 
 
+def _check_declarable(what):
+    """
+    Raise an exception if current_domain is a DomainSnapshot, in which
+    'what' (e.g., 'actions') can't be declared.
+    """
+    if isinstance(current_domain, DomainSnapshot):
+        raise Exception(f"cannot declare {what} in {current_domain}, which is a snapshot.")
+
+
 def declare_actions(*actions):
     """
     declare_actions adds each member of 'actions' to the current domain's list
@@ -400,14 +1557,16 @@ def declare_actions(*actions):
     """
     if current_domain == None:
         raise Exception(f"cannot declare actions until a domain has been created.")
+    _check_declarable('actions')
     current_domain._action_dict.update({act.__name__:act for act in actions})
+    current_domain._changed()
     return current_domain._action_dict
 
 
 
 def declare_operators(*actions):
     if verbose > 0:
-        print("""
+        _print("""
         >> declare_operators exists to provide backward compatibility
         >> with Pyhop. In the future, please use declare_actions instead.""")
     return declare_actions(*actions)
@@ -429,7 +1588,9 @@ def declare_commands(*commands):
     """
     if current_domain == None:
         raise Exception(f"cannot declare commands until a domain has been created.")
+    _check_declarable('commands')
     current_domain._command_dict.update({cmd.__name__:cmd for cmd in commands})
+    current_domain._changed()
     return current_domain._command_dict
 
 
@@ -454,6 +1615,7 @@ def declare_task_methods(task_name, *methods):
     """
     if current_domain == None:
         raise Exception(f"cannot declare methods until a domain has been created.")
+    _check_declarable('methods')
     if task_name in current_domain._task_method_dict:
         old_methods = current_domain._task_method_dict[task_name]
         # even though current_domain._task_method_dict[task_name] is a list,
@@ -462,12 +1624,13 @@ def declare_task_methods(task_name, *methods):
         current_domain._task_method_dict[task_name].extend(new_methods)
     else:
         current_domain._task_method_dict.update({task_name:list(methods)})
+    current_domain._changed()
     return current_domain._task_method_dict
 
 
 def declare_methods(task, *methods):
     if verbose > 0:
-        print("""
+        _print("""
         >> declare_methods exists to provide backward compatibility with
         >> Pyhop. In the future, please use declare_task_methods instead.""")
     return declare_task_methods(task, *methods)
@@ -496,12 +1659,14 @@ def declare_unigoal_methods(state_var_name, *methods):
     """
     if current_domain == None:
         raise Exception(f"cannot declare methods until a domain has been created.")
+    _check_declarable('methods')
     if state_var_name not in current_domain._unigoal_method_dict:
         current_domain._unigoal_method_dict.update({state_var_name:list(methods)})
     else:
         old_methods = current_domain._unigoal_method_dict[state_var_name]
         new_methods = [m for m in methods if m not in old_methods]
         current_domain._unigoal_method_dict[state_var_name].extend(new_methods)
+    current_domain._changed()
     return current_domain._unigoal_method_dict    
 
 
@@ -525,9 +1690,11 @@ def declare_multigoal_methods(*methods):
     if current_domain == None:
         raise Exception(    \
                 f"cannot declare methods until a domain has been created.")
+    _check_declarable('methods')
     new_mg_methods = [m for m in methods if m not in \
                       current_domain._multigoal_method_list]
     current_domain._multigoal_method_list.extend(new_mg_methods)
+    current_domain._changed()
     return current_domain._multigoal_method_list    
 
     
@@ -558,9 +1725,10 @@ def m_split_multigoal(state,multigoal):
 
     The main problem with m_split_multigoal is that it isn't smart about
     choosing the order in which to achieve g_1, ..., g_n. Some orderings may
-    work much better than others. Thus, rather than using the method as it's
-    defined below, one might want to modify it to choose a good order, e.g.,
-    by using domain-specific information or a heuristic function.
+    work much better than others. By default it uses the order in which the
+    goals appear in multigoal, but the goal_ordering variable below (or the
+    Planner's 'goal_ordering' argument) can tell it to use a heuristic
+    function instead, or one of the built-in heuristics in goal_orderings.
     """
     goal_dict = _goals_not_achieved(state,multigoal)
     goal_list = []
@@ -568,12 +1736,118 @@ def m_split_multigoal(state,multigoal):
         for arg in goal_dict[state_var_name]:
             val = goal_dict[state_var_name][arg]
             goal_list.append((state_var_name,arg,val))
+    planner = _current_planner.get()
+    ordering = goal_ordering if planner is None else planner.goal_ordering
+    if ordering != None and len(goal_list) > 1:
+        if type(ordering) is str:
+            ordering = goal_orderings[ordering]
+        goal_list = ordering(state, multigoal, goal_list)
     if goal_list:
         # achieve goals, then check whether they're all simultaneously true
         return goal_list + [multigoal]
     return goal_list
 
 
+goal_ordering = None
+"""
+goal_ordering tells m_split_multigoal in what order to achieve the goals
+that it splits a multigoal into. If it's None, m_split_multigoal uses the
+order in which they appear in the multigoal. Otherwise it's either the name
+of one of the heuristics in goal_orderings, or a function
+    ordering(state, multigoal, goal_list)
+that returns a reordered copy of goal_list, a list of the unachieved goals
+(state_var_name, arg, desired_val). A Planner's 'goal_ordering' argument
+overrides it for that Planner.
+"""
+
+
+def order_by_regression(state, multigoal, goal_list):
+    """
+    A goal-ordering heuristic for m_split_multigoal (see goal_ordering).
+    It reasons backward from the goals: if the desired value of one goal
+    is the arg of another goal, as in pos[a] = b and pos[b] = c, then
+    achieving the first goal will probably make the second one harder to
+    achieve (e.g., b can't be moved with a on top of it), so the second goal
+    should be achieved first. order_by_regression puts the goals into an
+    order that is consistent with these dependencies, keeping the original
+    order as much as possible. If the dependencies are cyclic, it breaks the
+    cycle at the earliest goal.
+    """
+    args = {_object_key(arg) for (_, arg, _) in goal_list}
+    # number of goals that must precede each goal
+    waiting = [0] * len(goal_list)
+    # goals that are waiting for the goal whose arg is each arg
+    waiters = {}
+    for (i, (_, _, val)) in enumerate(goal_list):
+        key = _object_key(val)
+        if key in args:
+            for (_, arg, _) in goal_list:
+                if _object_key(arg) == key:
+                    waiting[i] += 1
+            waiters.setdefault(key, []).append(i)
+    ordered = []
+    done = [False] * len(goal_list)
+    while len(ordered) < len(goal_list):
+        ready = [i for i in range(len(goal_list)) if not done[i] and waiting[i] == 0]
+        if not ready:
+            # a cycle; break it at the earliest goal
+            ready = [next(i for i in range(len(goal_list)) if not done[i])]
+        for i in ready:
+            done[i] = True
+            ordered.append(goal_list[i])
+            for j in waiters.get(_object_key(goal_list[i][1]), ()):
+                waiting[j] -= 1
+    return ordered
+
+
+def order_least_interfering(state, multigoal, goal_list):
+    """
+    A goal-ordering heuristic for m_split_multigoal (see goal_ordering).
+    It estimates how much achieving each goal (state_var_name, arg, val)
+    will interfere with the others by counting the other goals that mention
+    arg or val, plus the state-variable bindings state_var_name[x] = arg in
+    the current state (e.g., blocks on top of arg that must be moved to
+    achieve the goal). It puts the goals in increasing order of that count,
+    keeping the original order for goals whose counts are equal.
+    """
+    mentions = {}
+    for (_, arg, val) in goal_list:
+        for key in {_object_key(arg), _object_key(val)}:
+            mentions[key] = mentions.get(key, 0) + 1
+    def interference(goal):
+        (state_var_name, arg, val) = goal
+        (arg_key, val_key) = (_object_key(arg), _object_key(val))
+        count = mentions[arg_key] - 1
+        if val_key != arg_key:
+            count += mentions[val_key] - 1
+        values = vars(state).get(state_var_name)
+        if isinstance(values, collections.abc.Mapping):
+            count += sum(1 for x in values.values() if _object_key(x) == arg_key)
+        return count
+    return sorted(goal_list, key=interference)
+
+
+goal_orderings = {'regression': order_by_regression,
+                  'least_interfering': order_least_interfering}
+"""
+goal_orderings maps the names that goal_ordering may use to the built-in
+goal-ordering heuristics.
+"""
+
+
+def _object_key(x):
+    """
+    Return a dictionary key that identifies x for the goal-ordering
+    heuristics. It includes x's type, so that (for example) True isn't
+    mistaken for the block 1.
+    """
+    try:
+        hash(x)
+        return (type(x), x)
+    except TypeError:
+        return (type(x), id(x))
+
+
 # helper function for m_split_multigoal above:
 
 def _goals_not_achieved(state,multigoal):
@@ -586,7 +1860,14 @@ def _goals_not_achieved(state,multigoal):
         s.loc['c2'] = 'room2', g.loc['c2'] = 'room4'.
     Then _goals_not_achieved(s, g) will return
         {'loc': {'c1': 'room3', 'c2': 'room4'}}    
+
+    During a search, it asks the planner's _MultigoalTracker for g, which
+    takes time proportional to what has changed since the tracker last
+    looked at an ancestor of s, rather than to the number of goals in g.
     """
+    planner = _current_planner.get()
+    if planner is not None:
+        return planner._multigoal_tracker(multigoal).not_achieved(state)
     unachieved = {}
     for name in vars(multigoal):
         if name != '__name__':
@@ -600,6 +1881,100 @@ def _goals_not_achieved(state,multigoal):
     return unachieved
 
 
+class _MultigoalTracker():
+    """
+    t = _MultigoalTracker(multigoal) keeps track of which of multigoal's
+    goals are true in the states that the search reaches, so that
+    _goals_not_achieved doesn't need to check every goal every time.
+
+    For each state variable in the multigoal, t remembers the sets of
+    unachieved goals that it has computed, indexed by the write log (see
+    _CopyOnWriteDict) of the state's dictionary for that state variable.
+    Given a new state, t follows the dictionary's log back to a log that it
+    has seen before, which is usually that of the state where it was last
+    used on the current search path, and then rechecks only the goals whose
+    args were written since then. If there's no such log within as many
+    writes as the multigoal has goals for the state variable, t checks all
+    of them instead. For each state variable, t remembers only the
+    max_known logs that it has used most recently.
+
+    The multigoal shouldn't be modified while t is in use.
+    """
+
+    max_known = 1024
+
+    def __init__(self, multigoal):
+        self.multigoal = multigoal
+        # for each state variable, a dictionary that maps each arg in the
+        # multigoal to (position, desired value)
+        self.goals = {}
+        for name in vars(multigoal):
+            if name != '__name__':
+                goal = vars(multigoal)[name]
+                self.goals[name] = {arg: (i, goal[arg]) \
+                                    for (i, arg) in enumerate(goal)}
+        # for each state variable, an OrderedDict that maps id(log) to a pair
+        # (log, unachieved args), least recently used first; keeping log
+        # keeps its id from being reused
+        self.known = {name: collections.OrderedDict() for name in self.goals}
+
+    def not_achieved(self, state):
+        """
+        Return a dictionary of the goals that aren't true in state, in the
+        same form and order as _goals_not_achieved does.
+        """
+        unachieved = {}
+        for (name, goal) in self.goals.items():
+            args = self._unachieved_args(name, goal, vars(state).get(name))
+            if args:
+                unachieved[name] = {arg: goal[arg][1] \
+                                    for arg in sorted(args, key=lambda a: goal[a][0])}
+        return unachieved
+
+    def _unachieved_args(self, name, goal, values):
+        """
+        Return a frozenset of the args for which the state variable 'name'
+        doesn't have the desired value, where 'values' is the state's
+        dictionary for that state variable.
+        """
+        if type(values) not in _shared_types:
+            return frozenset(arg for (arg, (_, val)) in goal.items() \
+                             if val != values.get(arg))
+        known = self.known[name]
+        head = values._log
+        log = head
+        changed = []
+        for _ in range(len(goal) + 1):
+            entry = known.get(id(log))
+            if entry is not None:
+                known.move_to_end(id(log))
+                args = entry[1]
+                break
+            (key, log, _) = log
+            if key is _log_start:
+                break
+            changed.append(key)
+        else:
+            entry = None
+        if entry is None:
+            args = frozenset(arg for (arg, (_, val)) in goal.items() \
+                             if val != values.get(arg))
+        elif changed:
+            args = set(args)
+            for key in changed:
+                if key in goal:
+                    if goal[key][1] != values.get(key):
+                        args.add(key)
+                    else:
+                        args.discard(key)
+            args = frozenset(args)
+        if entry is None or changed:
+            known[id(head)] = (head, args)
+            if len(known) > self.max_known:
+                known.popitem(last=False)
+        return args
+
+
 ################################################################################
 # Functions to verify whether unigoal_methods achieve the goals they are
 # supposed to achieve.
@@ -627,9 +2002,9 @@ def _m_verify_g(state, method, state_var, arg, desired_val, depth):
     if vars(state)[state_var][arg] != desired_val:
         raise Exception(f"depth {depth}: method {method} didn't achieve",
                 f"goal {state_var}[{arg}] = {desired_val}")
-    if verbose >= 3:
-        print(f"depth {depth}: method {method} achieved",
-                f"goal {state_var}[{arg}] = {desired_val}")
+    planner = _current_planner.get()
+    if planner is not None and planner.trace:
+        planner.trace('verified', depth, method, f"goal {state_var}[{arg}] = {desired_val}")
     return []       # i.e., don't create any subtasks or subgoals
 
 
@@ -642,179 +2017,1545 @@ def _m_verify_mg(state, method, multigoal, depth):
     if goal_dict:
         raise Exception(f"depth {depth}: method {method} " + \
                         f"didn't achieve {multigoal}]")
-    if verbose >= 3:
-        print(f"depth {depth}: method {method} achieved {multigoal}")
+    planner = _current_planner.get()
+    if planner is not None and planner.trace:
+        planner.trace('verified', depth, method, multigoal)
     return []
 
 
+################################################################################
+# Tracing the search
+
+
+tracer = None
+"""
+tracer is an optional function that the search engines call at each step of
+the search, as tracer(event, depth, *args). Its initial value is None, which
+means that the search engines don't trace anything unless verbose >= 2, in
+which case they use print_trace. find_plan's 'tracer' argument overrides it
+for a single call. The events and their args are:
+ - 'node', todo: the search has reached a node whose to-do list is todo
+   (a linked list; see _from_linked)
+ - 'solved': the node's to-do list is empty, so its plan is a solution
+ - 'refine', kind, item, x: the search is about to refine 'item', whose
+   kind is 'action', 'task', 'unigoal', or 'multigoal'; x is the action's
+   function or the tuple of relevant methods
+ - 'achieved', item: the unigoal 'item' is already true
+ - 'try', kind, method: the search is calling 'method'
+ - 'applicable', kind, method, items: 'method' returned the to-do list items
+ - 'applied', item, state: the action 'item' produced 'state'
+ - 'not_applicable', kind, f: the method or action f returned False or None
+ - 'failed', kind, item: no more ways to refine 'item'; backtrack
+ - 'pruned': the node is a known failure (see TranspositionTable); backtrack
+ - 'deepen', kind, bound: iterative deepening is starting a search whose
+   max_depth or max_plan_length (depending on kind) is bound
+ - 'bounded', bound, best: the node's cost plus lower bound, bound, is no
+   less than the cost of the best plan found so far, best; backtrack
+ - 'verified', method, goal: a verification task succeeded
+To record the events for examining later, use a TraceRecorder.
+"""
+
+def print_trace(event, depth, *args):
+    """
+    A tracer that prints information about the search events, in the same
+    format that GTPyhop has always used. It prints the 'node' events if
+    verbose >= 2, and the other events if verbose >= 3.
+    """
+    _print_trace(verbose, event, depth, args)
+
+
+def _print_trace(level, event, depth, args):
+    """print_trace's work, for the verbosity level 'level'."""
+    if event == 'node':
+        if level >= 2:
+            _print_todo(args[0], depth)
+        return
+    if level < 3:
+        return
+    # print directly rather than with _print, since this may be at the
+    # deepest point of a recursive search
+    out = _output_file()
+    if event == 'solved':
+        print(f'depth {depth} no more tasks or goals, return plan', file=out)
+    elif event == 'refine':
+        (kind, item, x) = args
+        if kind == 'action':
+            print(f'depth {depth} action {item}: ', end='', file=out)
+        elif kind == 'task':
+            print(f'depth {depth} task {item} methods {[m.__name__ for m in x]}', file=out)
+        elif kind == 'unigoal':
+            print(f'depth {depth} goal {item}: methods {[m.__name__ for m in x]}', file=out)
+        else:
+            print(f'depth {depth} multigoal {item}: methods {[m.__name__ for m in x]}', file=out)
+    elif event == 'achieved':
+        print(f'depth {depth} goal {args[0]}: already achieved', file=out)
+    elif event == 'try':
+        (kind, method) = args
+        if kind == 'task':
+            print(f'depth {depth} trying {method.__name__}: ', end='', file=out)
+        else:
+            print(f'depth {depth} trying method {method.__name__}: ', end='', file=out)
+    elif event == 'applicable':
+        (kind, method, items) = args
+        print('applicable', file=out)
+        if kind == 'task':
+            print(f'depth {depth} subtasks: {items}', file=out)
+        else:
+            print(f'depth {depth} subgoals: {items}', file=out)
+    elif event == 'applied':
+        print('applied', file=out)
+        args[1].display()
+    elif event == 'not_applicable':
+        print('not applicable', file=out)
+    elif event == 'failed':
+        (kind, item) = args
+        if kind == 'task':
+            print(f'depth {depth} could not accomplish task {item}', file=out)
+        elif kind == 'unigoal':
+            print(f'depth {depth} could not achieve goal {item}', file=out)
+        elif kind == 'multigoal':
+            print(f'depth {depth} could not achieve multigoal {item}', file=out)
+    elif event == 'verified':
+        (method, goal) = args
+        print(f"depth {depth}: method {method} achieved {goal}", file=out)
+    elif event == 'pruned':
+        print(f'depth {depth} this state and to-do list are known to fail', file=out)
+    elif event == 'deepen':
+        (kind, bound) = args
+        print(f'depth {depth} iterative deepening: {kind} bound {bound}', file=out)
+    elif event == 'bounded':
+        (bound, best) = args
+        print(f'depth {depth} cost bound {bound} is no better than {best}', file=out)
+
+
+def _print_todo(todo, depth):
+    """Print the to-do list of a search node, for verbose >= 2."""
+    todo_string = '[' + ', '.join([_item_to_string(x) for x in _from_linked(todo)]) + ']'
+    print(f'depth {depth} todo_list ' + todo_string, file=_output_file())
+
+
+################################################################################
+# Recording and replaying traces
+
+
+class TraceRecorder():
+    """
+    r = TraceRecorder(detail=False, forward=None) creates a tracer (see the
+    'tracer' variable) that records the search events in a compact form, so
+    that they can be saved to a file and examined after the search is over:
+        r = TraceRecorder()
+        plan = find_plan(state, todo_list, tracer=r)
+        r.save('problem.trace')
+    For each event, r records the event's name, the depth, the time (in
+    nanoseconds since r was created), and two strings: for events with a
+    'kind' argument, the kind, and the name of the method, action, or item
+    that the event is about. Unless detail is True, an item's name is just
+    its first element (e.g., a task name), which is enough to see where the
+    time went; with detail=True, it's the whole item, and r also records
+    the first item of each node's to-do list. The costs in 'bounded' events
+    aren't recorded. The strings are stored once each, and the events are
+    stored in arrays of integers, so a trace takes about 24 bytes per event.
+
+    If 'forward' is a tracer, r passes each event on to it as well.
+
+    replay_trace(r) reconstructs the search tree from r, and
+    collapsed_stacks(r) converts it to a form that flame-graph tools read.
+    """
+
+    def __init__(self, detail=False, forward=None):
+        self.detail = detail
+        self.forward = forward
+        self.strings = [None]       # the strings; 0 stands for no string
+        self._string_ids = {None: 0}
+        self._events = array.array('I')
+        self._depths = array.array('I')
+        self._times = array.array('Q')
+        self._kinds = array.array('I')
+        self._names = array.array('I')
+        self._start = time.perf_counter_ns()
+
+    def __repr__(self):
+        return f"<TraceRecorder {len(self)} events>"
+
+    def __len__(self):
+        return len(self._events)
+
+    def __bool__(self):
+        # the search engines test 'if trace:', which must be true when r is empty
+        return True
+
+    def __call__(self, event, depth, *args):
+        (kind, name) = (None, None)
+        if args:
+            if event in _traced_kinds:
+                kind = args[0]
+                if len(args) > 1:
+                    name = self._name(args[1])
+            elif event == 'bounded':
+                # not the costs, since each one would add a new string
+                pass
+            elif event != 'node':
+                name = self._name(args[0])
+            elif self.detail and args[0] is not None:
+                name = self._name(args[0][0])
+        string_ids = self._string_ids
+        self._events.append(string_ids.get(event) or self._string_id(event))
+        self._depths.append(depth)
+        self._times.append(time.perf_counter_ns() - self._start)
+        self._kinds.append(string_ids.get(kind) or self._string_id(kind))
+        self._names.append(string_ids.get(name) or self._string_id(name))
+        if self.forward:
+            self.forward(event, depth, *args)
+
+    def _name(self, x):
+        """Return the string to record for an event's item or function."""
+        if (type(x) is tuple or type(x) is list) and x:
+            return _item_to_string(x) if self.detail else str(x[0])
+        elif hasattr(x, '__name__'):
+            return x.__name__
+        return str(x)
+
+    def _string_id(self, s):
+        """Return the number that stands for the string s, adding it if need be."""
+        if s not in self._string_ids:
+            self._string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return self._string_ids[s]
+
+    def events(self):
+        """
+        A generator for the recorded events, as tuples
+        (event, depth, time, kind, name), where time is in nanoseconds and
+        kind and name are None if they weren't recorded.
+        """
+        strings = self.strings
+        for (e, d, t, k, n) in zip(self._events, self._depths, self._times, \
+                                   self._kinds, self._names):
+            yield (strings[e], d, t, strings[k], strings[n])
+
+    def clear(self):
+        """Forget the recorded events."""
+        self.__init__(self.detail, self.forward)
+
+    def save(self, filename):
+        """
+        Write the trace to a binary file: a short JSON header containing the
+        strings, followed by the arrays of event data.
+        """
+        header = json.dumps({'version': 1, 'byteorder': sys.byteorder, \
+                             'events': len(self), 'detail': self.detail, \
+                             'strings': self.strings}).encode()
+        with open(filename, 'wb') as f:
+            f.write(_trace_magic)
+            f.write(len(header).to_bytes(4, 'little'))
+            f.write(header)
+            for a in self._arrays():
+                a.tofile(f)
+
+    def _arrays(self):
+        return (self._events, self._depths, self._times, self._kinds, self._names)
+
+
+_traced_kinds = {'refine', 'try', 'applicable', 'not_applicable', 'failed', 'deepen'}
+"""The events whose first argument is a kind (see the 'tracer' variable)."""
+
+_trace_magic = b'GTPTRACE'
+
+
+def load_trace(filename):
+    """Read a trace that TraceRecorder.save wrote, and return a TraceRecorder."""
+    with open(filename, 'rb') as f:
+        if f.read(len(_trace_magic)) != _trace_magic:
+            raise Exception(f"load_trace: {filename} isn't a GTPyhop trace file")
+        header = json.loads(f.read(int.from_bytes(f.read(4), 'little')))
+        recorder = TraceRecorder(header['detail'])
+        recorder.strings = header['strings']
+        recorder._string_ids = {s: i for (i, s) in enumerate(recorder.strings)}
+        for a in recorder._arrays():
+            a.fromfile(f, header['events'])
+            if header['byteorder'] != sys.byteorder:
+                a.byteswap()
+    return recorder
+
+
+class TraceNode():
+    """
+    A node of the search tree that replay_trace reconstructs from a trace.
+    Its attributes are:
+     - depth: the depth of the search node (the root that replay_trace
+       returns has depth -1; its children are the roots of the searches);
+     - via: the name of the method or action whose refinement produced the
+       node, or 'find_plan' for the root of a search;
+     - item: the name of the item that the search refined at the node, if
+       any (as recorded, so it's the whole item only if the recorder had
+       detail=True);
+     - status: 'solved', 'failed', 'pruned', or 'bounded' if the search
+       reached that conclusion at the node, and otherwise None (e.g., if
+       the node was cut off, or the search found a plan below it);
+     - on_plan: True if the node is on the path to a plan;
+     - tries: the number of methods that the search tried at the node;
+     - start and end: the times (in nanoseconds) of the node's first event
+       and of the first event after its subtree;
+     - children: the list of the node's children.
+    """
+
+    __slots__ = ('depth', 'via', 'item', 'status', 'on_plan', 'tries', \
+                 'start', 'end', 'children')
+
+    def __init__(self, depth, via, start):
+        self.depth = depth
+        self.via = via
+        self.item = None
+        self.status = None
+        self.on_plan = False
+        self.tries = 0
+        self.start = start
+        self.end = start
+        self.children = []
+
+    def __repr__(self):
+        return f"<TraceNode depth={self.depth} via={self.via!r} item={self.item!r}>"
+
+    def time(self):
+        """Return the time spent in the node's subtree, in seconds."""
+        return (self.end - self.start) / 1e9
+
+    def self_time(self):
+        """Return the time spent in the node but not its children, in seconds."""
+        return self.time() - sum([child.time() for child in self.children])
+
+    def size(self):
+        """Return the number of search nodes in the node's subtree."""
+        (count, nodes) = (0, [self])
+        while nodes:
+            node = nodes.pop()
+            count += 1
+            nodes.extend(node.children)
+        return count - (self.depth < 0)
+
+    def display(self, max_depth=None, plan_only=False):
+        """
+        Print the subtree, one node per line, indented by depth. If max_depth
+        isn't None, leave out the nodes below that depth. If plan_only is
+        True, leave out the nodes that aren't on the path to a plan.
+        """
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            if node.depth >= 0:
+                outcome = ' ' + node.status if node.status else ''
+                outcome += ' *' if node.on_plan else ''
+                _print(f'{"  " * node.depth}{node.via} -> {node.item}: ' + \
+                      f'{node.size()} nodes, {node.time()*1000:.3f} ms{outcome}')
+            if max_depth == None or node.depth < max_depth:
+                nodes.extend([child for child in reversed(node.children) \
+                              if child.on_plan or not plan_only])
+
+
+def replay_trace(trace):
+    """
+    Reconstruct the search tree from a trace, which is either a TraceRecorder
+    or the name of a file that TraceRecorder.save wrote. Return a TraceNode
+    whose children are the roots of the searches in the trace (there's more
+    than one if, e.g., the trace was recorded by run_lazy_lookahead or by an
+    iterative-deepening search).
+    """
+    if not isinstance(trace, TraceRecorder):
+        trace = load_trace(trace)
+    root = TraceNode(-1, None, 0)
+    path = [root]       # path[d+1] is the current node at depth d
+    via = {}            # via[d] is the via for the next node at depth d+1
+    time_now = 0
+    for (event, depth, time_now, kind, name) in trace.events():
+        if event == 'node':
+            if depth >= len(path):
+                continue        # the trace doesn't have the node's parent
+            for node in path[depth+1:]:
+                node.end = time_now
+            del path[depth+1:]
+            node = TraceNode(depth, via.pop(depth-1, 'find_plan'), time_now)
+            path[depth].children.append(node)
+            path.append(node)
+            continue
+        if event == 'deepen':
+            via[depth-1] = f'find_plan {kind} {name}'
+            continue
+        if depth+1 >= len(path):
+            continue
+        node = path[depth+1]
+        if event == 'refine':
+            node.item = name
+            if kind == 'action':
+                via[depth] = name
+        elif event == 'try':
+            node.tries += 1
+            via[depth] = name
+        elif event == 'achieved':
+            node.item = name
+            via[depth] = 'achieved'
+        elif event in ('solved', 'failed', 'pruned', 'bounded'):
+            node.status = event
+            if event == 'solved':
+                for n in path:
+                    n.on_plan = True
+    for node in path:
+        node.end = time_now
+    root.end = time_now
+    return root
+
+
+def collapsed_stacks(trace, filename=None, weight='time'):
+    """
+    Convert a trace (a TraceRecorder, the name of a trace file, or a
+    TraceNode returned by replay_trace) to the collapsed-stack format that
+    flame-graph tools such as flamegraph.pl and speedscope read. Each line
+    is a stack of the names of the methods and actions that lead to a
+    search node (the whole actions, if the trace was recorded with
+    detail=True), separated by semicolons, followed by a number:
+        find_plan;m_achieveGoal;m_storeImage;take_image 1234
+    If weight is 'time', the number is the time spent in the nodes that
+    have that stack, not counting their children, in microseconds; if it's
+    'nodes', it's the number of such nodes. Return a dictionary that maps
+    each stack to its number. If filename isn't None, also write the lines
+    to that file.
+    """
+    if weight not in ('time', 'nodes'):
+        raise Exception(f"collapsed_stacks: unknown weight {weight!r}")
+    root = trace if isinstance(trace, TraceNode) else replay_trace(trace)
+    totals = {}
+    nodes = [(child, child.via) for child in root.children]
+    while nodes:
+        (node, stack) = nodes.pop()
+        if weight == 'time':
+            totals[stack] = totals.get(stack, 0) + node.self_time() * 1e6
+        else:
+            totals[stack] = totals.get(stack, 0) + 1
+        nodes.extend([(child, f'{stack};{child.via}') for child in node.children])
+    stacks = {stack: round(n) for (stack, n) in sorted(totals.items())}
+    if filename != None:
+        with open(filename, 'w') as f:
+            for (stack, n) in stacks.items():
+                f.write(f'{stack} {n}\n')
+    return stacks
+
+
+################################################################################
+# Remembering failures
+
+
+class TranspositionTable():
+    """
+    t = TranspositionTable(max_size) creates a table for recording the
+    search nodes that are known to fail, i.e., (state, to-do list) pairs for
+    which the planner has already tried every alternative without finding a
+    plan. If find_plan is given the table, then whenever it reaches a node
+    whose state and to-do list are the same as those of a recorded failure,
+    it backtracks immediately instead of searching the node's subtree again.
+    For example:
+        t = TranspositionTable(10000)
+        plan = find_plan(state, todo_list, transposition_table=t)
+
+    Whether a node fails doesn't depend on its partial plan, so the partial
+    plan isn't part of the key. The table holds at most max_size failures;
+    when it is full, it forgets the least recently used one. A table may be
+    reused by several calls to find_plan that use the same domain.
+
+    The table refers to the states that the search reached rather than to
+    copies of them, so, as with any dictionary key (see State.__hash__),
+    they mustn't be modified while the table is in use.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.hits = 0           # number of nodes pruned
+        self._nogoods = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._nogoods)
+
+    def __str__(self):
+        return f"<TranspositionTable {len(self)}/{self.max_size} nogoods, {self.hits} hits>"
+
+    def clear(self):
+        """Forget all of the recorded failures."""
+        self._nogoods.clear()
+        self.hits = 0
+
+    def _key(self, state, todo):
+        """
+        Return a canonical, hashable key for a search node with the given
+        state and (linked) to-do list (see _NodeKey). In the key, each
+        verification task is reduced to the goal it verifies, since its
+        method and depth make no difference to whether it succeeds.
+        """
+        return _NodeKey(state, tuple([_todo_key_item(x) for x in _from_linked(todo)]))
+
+    def _known_failure(self, key):
+        """Return True if 'key' is a recorded failure, and mark it as used."""
+        if key in self._nogoods:
+            self._nogoods.move_to_end(key)
+            self.hits += 1
+            return True
+        return False
+
+    def _record_failure(self, key):
+        """Record 'key' as a failure, forgetting the oldest one if necessary."""
+        self._nogoods[key] = None
+        if len(self._nogoods) > self.max_size:
+            self._nogoods.popitem(last=False)
+
+
+class _NodeKey():
+    """
+    A TranspositionTable key for a search node: the node's state, and a
+    tuple made from its to-do list. Its hash combines the state's hash,
+    which is kept up to date as the state is modified (see _CopyOnWriteDict),
+    with the tuple's hash, and keys are compared by comparing their states
+    and tuples. So making a key doesn't copy the state.
+    """
+
+    __slots__ = ('state', 'todo', '_hash')
+
+    def __init__(self, state, todo):
+        self.state = state
+        self.todo = todo
+        self._hash = hash((hash(state), todo))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return self.todo == other.todo and \
+               (self.state is other.state or self.state == other.state)
+
+
+def _todo_key_item(item):
+    """
+    Return the hashable version of a to-do list item for a TranspositionTable
+    key. A verification task becomes ('_verify_g', state_var, arg, value) or
+    ('_verify_mg', multigoal), leaving out the method and depth. A multigoal
+    is used as it is, since it's hashable.
+    """
+    if type(item) is tuple and item:
+        if item[0] == '_verify_g':
+            return ('_verify_g',) + _freeze(item[2:5])
+        if item[0] == '_verify_mg':
+            return ('_verify_mg', item[2])
+    elif type(item) is Multigoal:
+        return item
+    return _freeze(item)
+
+
+def _freeze(x):
+    """
+    Return a hashable version of x that is the same for all objects that the
+    planner would treat the same way: dictionaries become frozensets of
+    their items, lists become tuples, and states and multigoals become
+    their class names paired with their state-variable bindings.
+    """
+    xtype = type(x)
+    if xtype is tuple or xtype is list:
+        return tuple([_freeze(y) for y in x])
+    elif xtype in _immutable_types:
+        return x
+    elif isinstance(x, collections.abc.Mapping):
+        return frozenset([(k, _freeze(v)) for (k, v) in x.items()])
+    elif isinstance(x, (set, frozenset)):
+        return frozenset([_freeze(y) for y in x])
+    elif isinstance(x, (State, Multigoal)):
+        return (xtype.__name__, _state_key(x))
+    else:
+        return x
+
+
+def _state_key(state):
+    """Return a hashable version of the state-variable bindings in 'state'."""
+    return frozenset([(name, _freeze(val)) for (name, val) in vars(state).items() \
+                      if name != '__name__'])
+
+
+################################################################################
+# Learning the order in which to try methods
+
+
+class MethodStats():
+    """
+    m = MethodStats() creates an object for recording how well each method
+    has worked in previous searches, and for using that to choose the order
+    in which to try the relevant methods for a task or goal. For example:
+        m = MethodStats()
+        for (state, todo_list) in problems:
+            plan = find_plan(state, todo_list, method_stats=m)
+        m.save('method_stats.json')
+
+    For each method, m counts the refinements it produced that led to a plan
+    (successes) and the ones whose subtrees failed (failures), and the total
+    number of search nodes in their subtrees. A refinement whose subtree was
+    cut off by max_depth or max_plan_length, or abandoned because the search
+    ran out of budget, isn't counted. Methods that aren't applicable aren't
+    counted either, since trying them costs little.
+
+    The search tries the relevant methods in increasing order of estimated
+    cost: the average subtree size divided by the estimated probability of
+    success, where both estimates are smoothed so that a method that hasn't
+    been tried looks like one that succeeds half of the time with a subtree
+    of one node. Methods whose estimates are equal are tried in the order
+    in which they were declared. Thus the plans that find_plan returns may
+    change as m learns.
+
+    Methods are identified by their module and qualified names, so m can be
+    saved to a file and loaded by a later program that declares the same
+    methods.
+    """
+
+    def __init__(self):
+        # maps each method name to [successes, failures, nodes]
+        self.counts = {}
+
+    def __str__(self):
+        return f"<MethodStats {len(self.counts)} methods>"
+
+    def display(self):
+        """Print each method's counts and estimated cost."""
+        _print(f'{"Method":<48}{"Succ":>8}{"Fail":>8}{"Nodes":>10}{"Cost":>10}')
+        for name in sorted(self.counts):
+            (successes, failures, nodes) = self.counts[name]
+            _print(f'{name:<48}{successes:>8}{failures:>8}{nodes:>10}' + \
+                  f'{self._cost(name):>10.1f}')
+
+    def clear(self):
+        """Forget everything that has been recorded."""
+        self.counts.clear()
+
+    def save(self, filename):
+        """Write the counts to a JSON file."""
+        with open(filename, 'w') as f:
+            json.dump(self.counts, f, indent=1, sort_keys=True)
+
+    def load(self, filename):
+        """Add the counts in a file written by save to the current ones."""
+        with open(filename) as f:
+            for (name, counts) in json.load(f).items():
+                old = self.counts.setdefault(name, [0, 0, 0])
+                for i in range(3):
+                    old[i] += counts[i]
+
+    def _cost(self, name):
+        """Return the estimated cost of trying the method called 'name'."""
+        (successes, failures, nodes) = self.counts.get(name, (0, 0, 0))
+        tries = successes + failures
+        return ((nodes + 1) / (tries + 1)) / ((successes + 1) / (tries + 2))
+
+    def _order(self, methods):
+        """Return the tuple of methods in the order in which to try them."""
+        if len(methods) < 2:
+            return methods
+        return tuple(sorted(methods, key=lambda m: self._cost(_method_name(m))))
+
+    def _try(self, planner, method, node):
+        """
+        A generator that yields the search node that method's refinement
+        produced, and records the outcome of searching below it: it's a
+        success if the search found a plan before it came back (or before it
+        stopped), and a failure if it came back without one, unless there
+        were cutoffs.
+        """
+        stats = planner.stats
+        (nodes, solutions, cutoffs) = (stats.nodes, planner.solutions, planner.cutoffs)
+        try:
+            yield node
+        except GeneratorExit:
+            # the search stopped while searching below the node
+            if planner.solutions > solutions:
+                self._record(method, 0, stats.nodes - nodes)
+            raise
+        if planner.solutions > solutions:
+            self._record(method, 0, stats.nodes - nodes)
+        elif planner.cutoffs == cutoffs:
+            self._record(method, 1, stats.nodes - nodes)
+
+    def _record(self, method, i, nodes):
+        """Count a success (i = 0) or failure (i = 1) with 'nodes' nodes."""
+        counts = self.counts.setdefault(_method_name(method), [0, 0, 0])
+        counts[i] += 1
+        counts[2] += nodes
+
+
+def _method_name(method):
+    """Return the name that MethodStats uses for 'method'."""
+    return f'{method.__module__}.{method.__qualname__}'
+
+
+################################################################################
+# Search budgets and results
+
+
+class PlanResult():
+    """
+    find_plan(..., return_result=True) returns a PlanResult r instead of a
+    plan or False. Its attributes are:
+     - r.status is one of the following:
+        'success': the search found a plan;
+        'failure': the search space contains no plan;
+        'depth_limit': there's no plan within the max_depth or
+            max_plan_length budget, but there might be a longer one;
+        'node_limit', 'time_limit', 'cpu_time_limit': the search stopped
+            because it ran out of nodes, wall-clock time, or CPU time;
+        'cancelled': the search was stopped (see Planner).
+     - r.plan is the plan if status is 'success', and False otherwise. The
+       exception is a search with a cost function (see find_plan's 'cost'
+       argument) that runs out of budget after finding a plan: then r.plan
+       is the cheapest plan it found, which might not be the cheapest plan.
+     - r.partial_plan is the best the search could do: the plan if there is
+       one, and otherwise the partial plan of the deepest node that the
+       search reached (not counting nodes whose partial plans are longer
+       than max_plan_length).
+     - r.cost is the plan's cost if the search had a cost function, and
+       None otherwise.
+     - r.nodes_expanded is the number of search nodes the search visited.
+     - r.elapsed and r.cpu_time are the wall-clock and CPU time, in seconds.
+     - r.stats is a SearchStats object that tells what else the search did.
+    bool(r) is True if and only if r.plan isn't False.
+    """
+
+    def __init__(self, status, plan, partial_plan, stats, elapsed, cpu_time, \
+                 cost=None):
+        self.status = status
+        self.plan = plan
+        self.partial_plan = partial_plan
+        self.cost = cost
+        self.stats = stats
+        self.nodes_expanded = stats.nodes
+        self.elapsed = elapsed
+        self.cpu_time = cpu_time
+
+    def __bool__(self):
+        return self.plan != False
+
+    def __repr__(self):
+        return f"<PlanResult {self.status}, {len(self.partial_plan)} actions, " + \
+               f"{self.nodes_expanded} nodes, {self.elapsed:.3f} s>"
+
+
+class SearchStats():
+    """
+    A SearchStats object counts what happened during a single call to
+    find_plan. find_plan's PlanResult (see find_plan's 'return_result'
+    argument) includes one. Its attributes are:
+     - nodes: the number of search nodes the search visited;
+     - max_depth: the greatest search depth it reached;
+     - method_calls: the number of calls to task, unigoal, and multigoal
+       methods, including the ones that verify goals;
+     - refinements: the number of method calls that returned a to-do list;
+     - failed_refinements: the number of method calls that returned False
+       or None;
+     - actions_applied: the number of actions that were applicable;
+     - actions_failed: the number of actions that returned False or None;
+     - backtracks: the number of times a search node failed and the search
+       went back to try another alternative;
+     - state_copies: the number of states that were copied.
+    """
+
+    _fields = ('nodes', 'max_depth', 'method_calls', 'refinements', \
+               'failed_refinements', 'actions_applied', 'actions_failed', \
+               'backtracks', 'state_copies')
+
+    def __init__(self):
+        for name in self._fields:
+            setattr(self, name, 0)
+
+    def __repr__(self):
+        return '<SearchStats ' + ', '.join([f'{name}={getattr(self, name)}' \
+                                            for name in self._fields]) + '>'
+
+    def as_dict(self):
+        """Return the statistics as a dictionary."""
+        return {name: getattr(self, name) for name in self._fields}
+
+    def _add(self, other):
+        """Add the counts in the SearchStats 'other' to self's counts."""
+        for name in self._fields:
+            if name == 'max_depth':
+                self.max_depth = max(self.max_depth, other.max_depth)
+            else:
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+class _BudgetExceeded(Exception):
+    """Raised by Planner._visit to stop the search; status says why."""
+    def __init__(self, status):
+        self.status = status
+
+
+
+
 ################################################################################
 # Applying actions, commands, and methods
 
 
-def _apply_action_and_continue(state, task1, todo_list, plan, depth):
+# Inside the search engines, to-do lists and partial plans are persistent
+# linked lists, so that each step of the search takes constant time rather
+# than time proportional to the lengths of the lists:
+#  - A to-do list is either None (empty) or a pair (item, rest), where rest
+#    is the rest of the to-do list.
+#  - A partial plan is either None (empty) or a triple (action, earlier, n),
+#    where earlier is the partial plan that precedes the last action, and n
+#    is the number of actions in the partial plan.
+# Nodes that share a tail share its storage; the search engines convert a
+# plan into an ordinary list only when they return it.
+
+def _to_linked(items, rest=None):
+    """Return the linked list consisting of 'items' followed by 'rest'."""
+    for item in reversed(items):
+        rest = (item, rest)
+    return rest
+
+
+def _from_linked(linked):
+    """Return an ordinary list of the items in the linked list 'linked'."""
+    items = []
+    while linked is not None:
+        items.append(linked[0])
+        linked = linked[1]
+    return items
+
+
+def _linked_plan(actions):
+    """Return the partial plan consisting of the list of actions 'actions'."""
+    plan = None
+    for (n, action) in enumerate(actions, 1):
+        plan = (action, plan, n)
+    return plan
+
+
+def _plan_to_list(plan):
+    """Return an ordinary list of the actions in the partial plan 'plan'."""
+    actions = _from_linked(plan)
+    actions.reverse()
+    return actions
+
+
+def _apply_action(planner, state, task1, todo, plan, depth, action):
     """
-    _apply_action_and_continue is called only when task1's name matches an
-    action name. It applies the action by retrieving the action's function
-    definition and calling it on the arguments, then calls seek_plan
-    recursively on todo_list.
+    _apply_action is called only when task1's name matches an action name.
+    It applies the action by calling its function definition, 'action', on
+    the arguments. If the action is applicable, it generates the search node
+    (state, todo, plan, depth) that comes next.
     """
-    if verbose >= 3:
-        print(f'depth {depth} action {task1}: ', end='')
-    action = current_domain._action_dict[task1[0]]
+    (trace, stats) = (planner.trace, planner.stats)
+    if trace:
+        trace('refine', depth, 'action', task1, action)
     newstate = action(state.copy(),*task1[1:])
     if newstate:
-        if verbose >= 3:
-            print('applied')
-            newstate.display()
-        return seek_plan(newstate, todo_list, plan+[task1], depth+1)
-    if verbose >= 3:
-        print('not applicable')
-    return False
+        stats.actions_applied += 1
+        if trace:
+            trace('applied', depth, task1, newstate)
+        yield (newstate, todo, \
+               (task1, plan, 1 if plan is None else plan[2] + 1), depth+1)
+    else:
+        stats.actions_failed += 1
+        if trace:
+            trace('not_applicable', depth, 'action', action)
 
 
-def _refine_task_and_continue(state, task1, todo_list, plan, depth):
+def _apply_profiled_action(planner, state, task1, todo, plan, depth, action):
     """
-    If task1 is in the task-method dictionary, then iterate through the list
-    of relevant methods to find one that's applicable, apply it to get
-    additional todo_list items, and call seek_plan recursively on
-            [the additional items] + todo_list.
+    _apply_action for a domain that's being profiled (see
+    Domain.start_profiling): it does the same thing, but also records the
+    time spent copying the state.
+    """
+    return _apply_action(planner, _TimedCopy(state, planner.domain), \
+                         task1, todo, plan, depth, action)
 
-    If the call to seek_plan fails, go on to the next method in the list.
+
+class _TimedCopy():
     """
-    relevant = current_domain._task_method_dict[task1[0]]
-    if verbose >= 3:
-        print(f'depth {depth} task {task1} methods {[m.__name__ for m in relevant]}')
+    A stand-in for a state, whose copy method copies the state and records
+    the time it takes in a domain's profile, under 'State.copy'.
+    """
+
+    __slots__ = ('state', 'domain')
+
+    def __init__(self, state, domain):
+        self.state = state
+        self.domain = domain
+
+    def copy(self):
+        start_time = time.perf_counter()
+        the_copy = self.state.copy()
+        elapsed = time.perf_counter() - start_time
+        counts = self.domain._profile.setdefault('State.copy', ['copy', 0, 0, 0.0, 0.0])
+        counts[1] += 1
+        counts[3] += elapsed
+        counts[4] += elapsed
+        stack = self.domain._profile_stack
+        if stack:
+            stack[-1] += elapsed
+        return the_copy
+
+
+def _refine_task(planner, state, task1, todo, plan, depth, relevant):
+    """
+    If task1 is in the task-method dictionary, then iterate through the list
+    of relevant methods, and for each one that's applicable, generate the
+    search node whose to-do list is
+            [the additional items] + todo.
+    """
+    (trace, stats, learner) = (planner.trace, planner.stats, planner.method_stats)
+    if learner is not None:
+        relevant = learner._order(relevant)
+    if trace:
+        trace('refine', depth, 'task', task1, relevant)
     for method in relevant:
-        if verbose >= 3: 
-            print(f'depth {depth} trying {method.__name__}: ', end='')
+        if trace:
+            trace('try', depth, 'task', method)
         subtasks = method(state, *task1[1:])
+        stats.method_calls += 1
         # Can't just say "if subtasks:", because that's wrong if subtasks == []
         if subtasks != False and subtasks != None:
-            if verbose >= 3:
-                print('applicable')
-                print(f'depth {depth} subtasks: {subtasks}')
-            result = seek_plan(state, subtasks+todo_list, plan, depth+1)
-            if result != False and result != None:
-                return result
+            stats.refinements += 1
+            if trace:
+                trace('applicable', depth, 'task', method, subtasks)
+            node = (state, _to_linked(subtasks, todo), plan, depth+1)
+            if learner is None:
+                yield node
+            else:
+                yield from learner._try(planner, method, node)
         else:
-            if verbose >= 3:
-                print(f'not applicable')
-    if verbose >= 3:
-        print(f'depth {depth} could not accomplish task {task1}')        
-    return False
+            stats.failed_refinements += 1
+            if trace:
+                trace('not_applicable', depth, 'task', method)
+    if trace:
+        trace('failed', depth, 'task', task1)
 
 
-def _refine_unigoal_and_continue(state, goal1, todo_list, plan, depth):
+def _refine_unigoal(planner, state, goal1, todo, plan, depth, relevant):
     """
     If goal1 is in the unigoal-method dictionary, then iterate through the
-    list of relevant methods to find one that's applicable, apply it to get
-    additional todo_list items, and call seek_plan recursively on
-          [the additional items] + [verify_g] + todo_list,
+    list of relevant methods, and for each one that's applicable, generate
+    the search node whose to-do list is
+          [the additional items] + [verify_g] + todo,
 
     where [verify_g] verifies whether the method actually achieved goal1.
-    If the call to seek_plan fails, go on to the next method in the list.
     """
-    if verbose >= 3:
-        print(f'depth {depth} goal {goal1}: ', end='')
+    (trace, stats, learner) = (planner.trace, planner.stats, planner.method_stats)
     (state_var_name, arg, val) = goal1
     if vars(state).get(state_var_name).get(arg) == val:
-        if verbose >= 3:
-            print(f'already achieved')
-        return seek_plan(state, todo_list, plan, depth+1)
-    relevant = current_domain._unigoal_method_dict[state_var_name]
-    if verbose >= 3:
-        print(f'methods {[m.__name__ for m in relevant]}')
+        if trace:
+            trace('achieved', depth, goal1)
+        yield (state, todo, plan, depth+1)
+        return
+    if learner is not None:
+        relevant = learner._order(relevant)
+    if trace:
+        trace('refine', depth, 'unigoal', goal1, relevant)
     for method in relevant:
-        if verbose >= 3: 
-            print(f'depth {depth} trying method {method.__name__}: ', end='')
+        if trace:
+            trace('try', depth, 'unigoal', method)
         subgoals = method(state,arg,val)
+        stats.method_calls += 1
         # Can't just say "if subgoals:", because that's wrong if subgoals == []
         if subgoals != False and subgoals != None:
-            if verbose >= 3:
-                print('applicable')
-                print(f'depth {depth} subgoals: {subgoals}')
-            if verify_goals:
-                verification = [('_verify_g', method.__name__, \
-                                 state_var_name, arg, val, depth)]
+            stats.refinements += 1
+            if trace:
+                trace('applicable', depth, 'unigoal', method, subgoals)
+            if planner.verify_goals:
+                rest = (('_verify_g', method.__name__, \
+                         state_var_name, arg, val, depth), todo)
             else:
-                verification = []
-            todo_list = subgoals + verification + todo_list
-            result = seek_plan(state, todo_list, plan, depth+1)
-            if result != False and result != None:
-                return result
+                rest = todo
+            node = (state, _to_linked(subgoals, rest), plan, depth+1)
+            if learner is None:
+                yield node
+            else:
+                yield from learner._try(planner, method, node)
         else:
-            if verbose >= 3:
-                print(f'not applicable')        
-    if verbose >= 3:
-        print(f'depth {depth} could not achieve goal {goal1}')        
-    return False
+            stats.failed_refinements += 1
+            if trace:
+                trace('not_applicable', depth, 'unigoal', method)
+    if trace:
+        trace('failed', depth, 'unigoal', goal1)
 
 
-def _refine_multigoal_and_continue(state, goal1, todo_list, plan, depth):
+def _refine_multigoal(planner, state, goal1, todo, plan, depth, relevant):
     """
     If goal1 is a multigoal, then iterate through the list of multigoal
-    methods to find one that's applicable, apply it to get additional
-    todo_list items, and call seek_plan recursively on
-          [the additional items] + [verify_mg] + todo_list,
+    methods, and for each one that's applicable, generate the search node
+    whose to-do list is
+          [the additional items] + [verify_mg] + todo,
 
     where [verify_mg] verifies whether the method actually achieved goal1.
-    If the call to seek_plan fails, go on to the next method in the list.
     """
-    if verbose >= 3:
-        print(f'depth {depth} multigoal {goal1}: ', end='')
-    relevant = current_domain._multigoal_method_list
-    if verbose >= 3:
-        print(f'methods {[m.__name__ for m in relevant]}')
+    (trace, stats, learner) = (planner.trace, planner.stats, planner.method_stats)
+    if learner is not None:
+        relevant = learner._order(relevant)
+    if trace:
+        trace('refine', depth, 'multigoal', goal1, relevant)
     for method in relevant:
-        if verbose >= 3: 
-            print(f'depth {depth} trying method {method.__name__}: ', end='')
+        if trace:
+            trace('try', depth, 'multigoal', method)
         subgoals = method(state,goal1)
+        stats.method_calls += 1
         # Can't just say "if subgoals:", because that's wrong if subgoals == []
         if subgoals != False and subgoals != None:
-            if verbose >= 3:
-                print('applicable')
-                print(f'depth {depth} subgoals: {subgoals}')
-            if verify_goals:
-                verification = [('_verify_mg', method.__name__, goal1, depth)]
+            stats.refinements += 1
+            if trace:
+                trace('applicable', depth, 'multigoal', method, subgoals)
+            if planner.verify_goals:
+                rest = (('_verify_mg', method.__name__, goal1, depth), todo)
             else:
-                verification = []
-            todo_list = subgoals + verification + todo_list
-            result = seek_plan(state, todo_list, plan, depth+1)
-            if result != False and result != None:
-                return result
+                rest = todo
+            node = (state, _to_linked(subgoals, rest), plan, depth+1)
+            if learner is None:
+                yield node
+            else:
+                yield from learner._try(planner, method, node)
         else:
-            if verbose >= 3:
-                print(f'not applicable')
-    if verbose >= 3:
-        print(f'depth {depth} could not achieve multigoal {goal1}')        
+            stats.failed_refinements += 1
+            if trace:
+                trace('not_applicable', depth, 'multigoal', method)
+    if trace:
+        trace('failed', depth, 'multigoal', goal1)
+
+
+def _successors(planner, state, todo, plan, depth):
+    """
+    Return a generator for the search nodes that can follow the node
+    (state, todo, plan, depth), in the order in which the planner should
+    try them. Each search node is a tuple (state, todo, plan, depth), where
+    todo and plan are linked lists. Both of the search engines below use
+    this function, so they make the same choices in the same order.
+
+    The first item of todo is classified with a single lookup in the dispatch
+    table of the planner's domain (see Domain._dispatch_table).
+    """
+    (item1, rest) = todo
+    ttype = type(item1)
+    entry = planner._dispatch.get(item1[0] if ttype is tuple or ttype is list else ttype)
+    if entry != None:
+        (handler, x) = entry
+        return handler(planner, state, item1, rest, plan, depth, x)
+    raise Exception(    \
+        f"depth {depth}: {item1} isn't an action, task, unigoal, or multigoal\n")
+
+
+# The recursive search engine calls _seek_plan on each search node produced
+# by the generators above (see _seek_plan). The names below are kept from
+# earlier versions of GTPyhop.
+
+def _seek_first(planner, successors):
+    """
+    Call _seek_plan on each search node in 'successors' until one of the
+    calls succeeds. Return its plan, or False if all of them fail.
+    """
+    for (state, todo, plan, depth) in successors:
+        result = _seek_plan(planner, state, todo, plan, depth)
+        if result != False:
+            return result
+        planner.stats.backtracks += 1
     return False
 
 
+# The following functions are kept for compatibility with earlier versions
+# of GTPyhop. If they're called during a search, they use its Planner.
+
+def _apply_action_and_continue(state, task1, todo, plan, depth):
+    """Apply the action task1, then call _seek_plan recursively on todo."""
+    planner = _current_planner.get() or Planner()
+    action = planner.domain._action_dict[task1[0]]
+    return _seek_first(planner, _apply_action(planner, state, task1, todo, plan, depth, action))
+
+
+def _refine_task_and_continue(state, task1, todo, plan, depth):
+    """Refine task1, trying each relevant method until _seek_plan succeeds."""
+    planner = _current_planner.get() or Planner()
+    relevant = planner.domain._task_method_dict[task1[0]]
+    return _seek_first(planner, _refine_task(planner, state, task1, todo, plan, depth, relevant))
+
+
+def _refine_unigoal_and_continue(state, goal1, todo, plan, depth):
+    """Refine goal1, trying each relevant method until _seek_plan succeeds."""
+    planner = _current_planner.get() or Planner()
+    relevant = planner.domain._unigoal_method_dict[goal1[0]]
+    return _seek_first(planner, _refine_unigoal(planner, state, goal1, todo, plan, depth, relevant))
+
+
+def _refine_multigoal_and_continue(state, goal1, todo, plan, depth):
+    """Refine goal1, trying each multigoal method until _seek_plan succeeds."""
+    planner = _current_planner.get() or Planner()
+    relevant = planner.domain._multigoal_method_list
+    return _seek_first(planner, _refine_multigoal(planner, state, goal1, todo, plan, depth, relevant))
+
+
 ############################################################
 # The planning algorithm
 
 
-def find_plan(state, todo_list):
+search_engine = 'recursive'
+"""
+search_engine is the name of the search engine that find_plan uses when its
+'engine' argument isn't given. Both engines return the same plans, and they
+backtrack in the same order:
+ - 'recursive': seek_plan calls itself once for each step of the plan, so
+   the plan's length is limited by Python's recursion limit.
+ - 'iterative': seek_plan_iteratively keeps its choice points on an explicit
+   stack, so the plan's length is limited only by the available memory.
+"""
+
+
+# The Planner whose search is running in the current thread or asyncio task,
+# or None. The search engines pass their Planner to each other explicitly;
+# this is for the code that they call, such as _m_verify_g and State.copy.
+_current_planner = contextvars.ContextVar('gtpyhop_planner', default=None)
+
+
+class Planner():
+    """
+    p = Planner(domain, **options) creates a planning context: an object that
+    carries a domain, the options for searching it, and the statistics of
+    the search through the search, so that the search doesn't depend on the
+    global variables current_domain, verbose, verify_goals, and tracer. The
+    arguments are:
+     - 'domain' is the Domain to plan in. It defaults to current_domain.
+     - 'engine', 'tracer', 'transposition_table', 'max_nodes', 'max_depth',
+       'time_limit', and 'cpu_time_limit' are as in find_plan.
+     - 'verbose', 'verify_goals', and 'goal_ordering' default to the values
+       of the global variables of the same names.
+     - 'workers', 'parallel_depth', 'cost', 'lower_bound', 'max_plan_length',
+       'iterative_deepening', and 'method_stats' are as in find_plan.
+
+    p.find_plan(state, todo_list, return_result=False) and
+    p.iter_plans(state, todo_list, limit=None) do the same things as
+    find_plan and iter_plans. Afterwards, p.stats is a SearchStats object for
+    the search.
+
+    Several Planners may search at the same time in different threads or
+    asyncio tasks, but a Planner must not be used for two searches at once.
+    To stop a search that's running in another thread, set p.cancel_event
+    to a threading.Event before the search, and set the Event; the search
+    then fails with the status 'cancelled'.
+
+    If p has more than one worker, its first search starts the worker
+    processes, and its later searches reuse them. p.close() stops them; so
+    does leaving a 'with' statement, as in
+        with Planner(domain, workers=8) as p:
+            plans = [p.find_plan(state, todo_list) for state in states]
+    find_plan creates a new Planner each time it's called, so it's safe to
+    call it concurrently if each call has its own 'domain' argument, or if
+    nothing changes current_domain in the meantime.
+    """
+
+    def __init__(self, domain=None, engine=None, tracer=None, \
+                 transposition_table=None, max_nodes=None, max_depth=None, \
+                 time_limit=None, cpu_time_limit=None, verbose=None, \
+                 verify_goals=None, workers=None, parallel_depth=1, cost=None, \
+                 lower_bound=None, max_plan_length=None, iterative_deepening=None, \
+                 goal_ordering=None, method_stats=None):
+        # some of the arguments hide the global variables that are their defaults
+        defaults = globals()
+        self.domain = current_domain if domain == None else domain
+        self.engine = search_engine if engine == None else engine
+        if self.engine not in _search_engines:
+            raise Exception(f"Planner: unknown search engine {self.engine!r}")
+        self.tracer = defaults['tracer'] if tracer == None else tracer
+        self.transposition_table = transposition_table
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.cpu_time_limit = cpu_time_limit
+        self.verbose = defaults['verbose'] if verbose == None else verbose
+        self.verify_goals = defaults['verify_goals'] if verify_goals == None \
+                            else verify_goals
+        self.goal_ordering = defaults['goal_ordering'] if goal_ordering == None \
+                             else goal_ordering
+        if type(self.goal_ordering) is str and \
+                self.goal_ordering not in goal_orderings:
+            raise Exception(f"Planner: unknown goal ordering {self.goal_ordering!r}")
+        self.workers = workers
+        self.parallel_depth = parallel_depth
+        self.cost = cost
+        self.lower_bound = lower_bound
+        self.max_plan_length = max_plan_length
+        self.iterative_deepening = iterative_deepening
+        self.method_stats = method_stats
+        # an Event (e.g., a threading.Event) that another thread may set to
+        # stop the search; run_lazy_lookahead_async uses it
+        self.cancel_event = None
+        # the worker processes for parallel searches (see _worker_pool)
+        self._pool = None
+        if iterative_deepening not in (None, 'depth', 'length'):
+            raise Exception("Planner: iterative_deepening must be None, " + \
+                            f"'depth', or 'length', not {iterative_deepening!r}")
+        special = [x for x in (cost, iterative_deepening) if x != None]
+        if workers != None and workers > 1:
+            special.append(workers)
+        if len(special) > 1:
+            raise Exception("Planner: a search can use only one of a cost " + \
+                            "function, iterative deepening, and workers")
+        if method_stats != None and workers != None and workers > 1:
+            raise Exception("Planner: a parallel search can't use method_stats")
+        self._reset()
+
+    def __repr__(self):
+        domain_name = self.domain.__name__ if self.domain else None
+        return f"<Planner {domain_name}, engine={self.engine!r}>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stop the worker processes that the planner's parallel searches use,
+        if it has started them. If the planner searches in parallel again,
+        it starts new ones.
+        """
+        if self._pool is not None:
+            (executor, cancel_event) = self._pool
+            self._pool = None
+            cancel_event.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def find_plan(self, state, todo_list, return_result=False):
+        """
+        Search for a plan for todo_list, starting at state. Return the plan
+        or False, or return a PlanResult if return_result is True.
+        """
+        verbose = self.verbose
+        if verbose >= 1: 
+            todo_string = '[' + ', '.join([_item_to_string(x) for x in todo_list]) + ']'
+            _print(f'FP> find_plan, verbose={verbose}:')
+            _print(f'    state = {state.__name__}\n    todo_list = {todo_string}')
+        if self.cost != None:
+            engine = _seek_best_plan
+        elif self.iterative_deepening != None:
+            engine = _seek_plan_deepening
+        elif self.workers != None and self.workers > 1:
+            engine = _seek_plan_in_parallel
+        else:
+            engine = _search_engines[self.engine]
+        result = self._search(engine, state, todo_list, [], 0)
+        if result == False and self.best_plan != False:
+            # a branch-and-bound search ran out of budget after finding a plan
+            result = _plan_to_list(self.best_plan)
+        if verbose >= 1:
+            _print('FP> result =',result,'\n')
+            if self.cost != None and result != False:
+                _print(f'FP> cost = {self.best_cost}\n')
+            if self.status != None:
+                _print(f'FP> stopped early: {self.status} after {self.stats.nodes} nodes\n')
+        if return_result:
+            return self._result(result)
+        return result
+
+    def iter_plans(self, state, todo_list, limit=None):
+        """
+        A generator for the plans for todo_list, starting at state, in the
+        order in which the search finds them. If limit isn't None, it stops
+        after that many plans.
+        """
+        self._reset()
+        solutions = _iter_solutions(self, state, _to_linked(todo_list), None, 0)
+        count = 0
+        while limit == None or count < limit:
+            # the search runs only while the generator is running, so the
+            # planner is current only then
+            token = _current_planner.set(self)
+            try:
+                plan = next(solutions, False)
+            except _BudgetExceeded as e:
+                self.status = e.status
+                return
+            finally:
+                _current_planner.reset(token)
+            if plan is False:
+                return
+            count += 1
+            yield _plan_to_list(plan)
+
+    def _reset(self):
+        """Get ready for a new search."""
+        self.trace = self.tracer
+        if self.trace == None and self.verbose >= 2:
+            self.trace = self._print_trace
+        self.stats = SearchStats()
+        self.cutoffs = 0            # nodes cut off by max_depth or max_plan_length
+        self.solutions = 0          # number of plans found
+        self.status = None          # set if the search ran out of budget
+        self.deepest = -1
+        self.deepest_plan = None
+        self.best_plan = False      # the incumbent of a branch-and-bound search
+        self.best_cost = None
+        self._trackers = {}         # see _multigoal_tracker
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+        self.deadline = None if self.time_limit is None \
+                        else self.start_time + self.time_limit
+        self.cpu_deadline = None if self.cpu_time_limit is None \
+                            else self.start_cpu_time + self.cpu_time_limit
+        self._dispatch = self.domain and \
+                         (self.domain._dispatch or self.domain._dispatch_table())
+        self._cancel = _cancel_event if self.cancel_event is None else self.cancel_event
+
+    def __getstate__(self):
+        # a copy of the planner doesn't need the things that _reset rebuilds,
+        # and some of them can't be pickled
+        planner_vars = vars(self).copy()
+        for name in ('_dispatch', 'trace', 'deepest_plan', 'best_plan', '_cancel', \
+                     'cancel_event', '_trackers', '_pool'):
+            planner_vars[name] = None
+        return planner_vars
+
+    def _multigoal_tracker(self, multigoal):
+        """
+        Return the _MultigoalTracker for multigoal (the object, not just an
+        equal one), creating it if this search hasn't used it yet.
+        """
+        if self._trackers is None:
+            self._trackers = {}
+        entry = self._trackers.get(id(multigoal))
+        if entry is None:
+            # keeping multigoal keeps its id from being reused
+            entry = self._trackers[id(multigoal)] = \
+                (multigoal, _MultigoalTracker(multigoal))
+        return entry[1]
+
+    def _print_trace(self, event, depth, *args):
+        """Like print_trace, but for this planner's verbose value."""
+        _print_trace(self.verbose, event, depth, args)
+
+    def _search(self, engine, state, todo_list, plan, depth):
+        """
+        Run the search engine 'engine' on an ordinary to-do list and partial
+        plan, and return the plan as an ordinary list, or False. If the
+        search runs out of budget, it returns False and sets self.status.
+        """
+        self._reset()
+        token = _current_planner.set(self)
+        try:
+            result = engine(self, state, _to_linked(todo_list), \
+                            _linked_plan(plan), depth)
+        except _BudgetExceeded as e:
+            self.status = e.status
+            result = False
+        finally:
+            _current_planner.reset(token)
+        if result != False:
+            result = _plan_to_list(result)
+        return result
+
+    def _visit(self, depth, todo, plan):
+        """
+        Count a node at depth 'depth' with the given (linked) to-do list and
+        partial plan. Raise _BudgetExceeded if the search has run out of
+        nodes or time. Return False if the node is too deep to expand, and
+        True otherwise.
+        """
+        stats = self.stats
+        if self.max_nodes is not None and stats.nodes >= self.max_nodes:
+            raise _BudgetExceeded('node_limit')
+        stats.nodes += 1
+        if depth > stats.max_depth:
+            stats.max_depth = depth
+        if self._cancel is not None and stats.nodes % 256 == 0 and self._cancel.is_set():
+            raise _BudgetExceeded('cancelled')
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise _BudgetExceeded('time_limit')
+        if self.cpu_deadline is not None and time.process_time() > self.cpu_deadline:
+            raise _BudgetExceeded('cpu_time_limit')
+        if self.max_plan_length is not None and plan is not None and \
+                plan[2] > self.max_plan_length:
+            self.cutoffs += 1
+            return False
+        # a node whose partial plan is too long doesn't count as the deepest
+        if depth > self.deepest:
+            (self.deepest, self.deepest_plan) = (depth, plan)
+        if self.max_depth is not None and depth >= self.max_depth and todo is not None:
+            self.cutoffs += 1
+            return False
+        return True
+
+    def _worker_pool(self):
+        """
+        Return a pair (executor, cancel_event) for a parallel search, where
+        executor is a concurrent.futures.ProcessPoolExecutor with
+        self.workers worker processes, and the workers stop searching when
+        cancel_event is set. Start the workers if they aren't running.
+        """
+        if self._pool is None:
+            # imported here, so that programs that don't search in parallel
+            # don't pay for importing them
+            import concurrent.futures, multiprocessing
+            cancel_event = multiprocessing.Event()
+            executor = concurrent.futures.ProcessPoolExecutor(self.workers, \
+                initializer=_init_parallel_worker, initargs=(cancel_event,))
+            self._pool = (executor, cancel_event)
+        return self._pool
+
+    def _worker_copy(self):
+        """
+        Return a copy of the planner for a worker process of a parallel
+        search or of find_plans to use. It doesn't trace or print anything,
+        its domain is a snapshot of the planner's domain (see
+        Domain.snapshot), and if the planner has a TranspositionTable, the
+        copy has an empty one of the same size.
+        """
+        worker = copy.copy(self)
+        (worker.tracer, worker.verbose, worker.workers) = (None, 0, None)
+        if worker.domain != None:
+            worker.domain = worker.domain.snapshot()
+        if self.transposition_table is not None:
+            worker.transposition_table = \
+                TranspositionTable(self.transposition_table.max_size)
+        return worker
+
+    def _merge(self, stats, status, cutoffs, deepest, deepest_plan):
+        """
+        Add the outcome of a worker's search (see _search_subtree) to the
+        outcome of the planner's search.
+        """
+        self.stats._add(stats)
+        if self.status is None:
+            self.status = status
+        self.cutoffs += cutoffs
+        if deepest > self.deepest:
+            (self.deepest, self.deepest_plan) = (deepest, _linked_plan(deepest_plan))
+
+    def _result(self, plan):
+        """Return a PlanResult for a search that returned 'plan'."""
+        if plan != False and (self.cost == None or self.status == None):
+            status = 'success'
+        elif self.status is not None:
+            status = self.status
+        elif self.cutoffs:
+            status = 'depth_limit'
+        else:
+            status = 'failure'
+        if plan != False:
+            partial_plan = plan
+        else:
+            partial_plan = _plan_to_list(self.deepest_plan)
+        plan_cost = self.best_cost if self.cost != None else None
+        return PlanResult(status, plan, partial_plan, self.stats, \
+                          time.perf_counter() - self.start_time, \
+                          time.process_time() - self.start_cpu_time, plan_cost)
+
+
+def find_plan(state, todo_list, engine=None, tracer=None, transposition_table=None, \
+              max_nodes=None, max_depth=None, time_limit=None, cpu_time_limit=None, \
+              return_result=False, domain=None, workers=None, parallel_depth=1, \
+              cost=None, lower_bound=None, max_plan_length=None, \
+              iterative_deepening=None, method_stats=None):
     """
     find_plan tries to find a plan that accomplishes the items in todo_list,
     starting from the given state, using whatever methods and actions you
     declared previously. If successful, it returns the plan. Otherwise it
     returns False. Arguments:
      - 'state' is a state;
-     - 'todo_list' is a list of goals, tasks, and actions.
+     - 'todo_list' is a list of goals, tasks, and actions;
+     - 'engine' (optional) is 'recursive' or 'iterative'. It defaults to the
+       value of search_engine.
+     - 'tracer' (optional) is a function to call on each search event. It
+       defaults to the value of the global variable tracer.
+     - 'transposition_table' (optional) is a TranspositionTable in which to
+       record the search nodes that fail, so that the search can prune them
+       if it reaches them again.
+     - 'max_nodes', 'time_limit', and 'cpu_time_limit' (optional) are budgets
+       for the number of search nodes, wall-clock seconds, and CPU seconds.
+       If the search exceeds one of them, it stops and fails.
+     - 'max_depth' (optional) is a budget for the search depth: the search
+       won't refine anything at depth max_depth or deeper, but it continues
+       to search the rest of the search space.
+     - 'max_plan_length' (optional) is a budget for the plan's length: the
+       search backtracks from any node whose partial plan is longer.
+     - 'iterative_deepening' (optional) is 'depth' or 'length'. If it is
+       given, find_plan searches repeatedly with max_depth (or
+       max_plan_length) = 1, 2, 3, ..., until it finds a plan, or until a
+       search is cut off nowhere (so there's no plan), or until it reaches
+       the value of the max_depth (or max_plan_length) argument if there is
+       one. With 'length', the plan is one of the shortest plans. The
+       searches share a TranspositionTable (a new one if the
+       'transposition_table' argument isn't given), in which they record
+       only the nodes that fail without any cutoffs, so each search can
+       prune the failures that the earlier ones found.
+     - 'method_stats' (optional) is a MethodStats object. If it is given,
+       the search tries each item's relevant methods in the order that it
+       recommends, and records in it how well each method worked. It can't
+       be used with 'workers'.
+     - 'return_result' (optional): if it is True, then find_plan returns a
+       PlanResult, which tells how the search ended and includes the best
+       partial plan it found, instead of returning the plan or False.
+     - 'domain' (optional) is the domain to use. It defaults to the value of
+       current_domain.
+     - 'workers' (optional): if it is greater than 1, find_plan searches
+       different parts of the search space at the same time in that many
+       worker processes (see _seek_plan_in_parallel). 'parallel_depth'
+       (default 1) is the number of levels of alternatives to divide among
+       the workers.
+     - 'cost' (optional) is a function cost(state, action, newstate) that
+       returns the cost of using 'action' (a tuple such as ('pickup', 'a'))
+       to go from 'state' to 'newstate'. If it is given, find_plan does a
+       branch-and-bound search for the cheapest plan: after finding a plan,
+       it keeps searching, but it backtracks from each node whose partial
+       plan costs at least as much as the cheapest plan found so far. To
+       find the shortest plan, use cost=unit_cost.
+     - 'lower_bound' (optional) is a function lower_bound(state, todo_list)
+       that returns a lower bound on the cost of accomplishing todo_list in
+       state. If it is given, the branch-and-bound search also backtracks
+       from each node whose partial plan's cost plus the lower bound is at
+       least as much as the cheapest plan found so far. If the bound is
+       admissible (i.e., never too high), the plan is the cheapest one.
+
+    find_plan is a shorthand for creating a Planner and calling its
+    find_plan method. To do several parallel searches with the same worker
+    processes, use a Planner instead.
     """
-    if verbose >= 1: 
-        todo_string = '[' + ', '.join([_item_to_string(x) for x in todo_list]) + ']'
-        print(f'FP> find_plan, verbose={verbose}:')
-        print(f'    state = {state.__name__}\n    todo_list = {todo_string}')
-    result = seek_plan(state, todo_list, [], 0)
-    if verbose >= 1: print('FP> result =',result,'\n')
-    return result
+    planner = Planner(domain, engine, tracer, transposition_table, max_nodes, \
+                      max_depth, time_limit, cpu_time_limit, \
+                      workers=workers, parallel_depth=parallel_depth, cost=cost, \
+                      lower_bound=lower_bound, max_plan_length=max_plan_length, \
+                      iterative_deepening=iterative_deepening, \
+                      method_stats=method_stats)
+    with planner:
+        return planner.find_plan(state, todo_list, return_result)
+
+
+def unit_cost(state, action, newstate):
+    """
+    A cost function for find_plan that gives every action a cost of 1, so
+    that the cheapest plan is the shortest one.
+    """
+    return 1
+
+
+def iter_plans(state, todo_list, limit=None, domain=None, tracer=None, \
+               transposition_table=None, max_nodes=None, max_depth=None, \
+               time_limit=None, cpu_time_limit=None):
+    """
+    iter_plans is a generator for the plans that accomplish the items in
+    todo_list, starting from the given state. It yields them one at a time,
+    in the order in which find_plan's backtracking search reaches them, so
+    the first one is the plan that find_plan would return. It searches for
+    each plan only when it's asked for the plan, continuing the search from
+    where it stopped. Arguments:
+     - 'state' and 'todo_list' are as in find_plan;
+     - 'limit' (optional) is the maximum number of plans to yield;
+     - the other arguments are as in find_plan. The budgets apply to the
+       whole sequence of plans, and if one of them is exceeded, iter_plans
+       stops yielding plans.
+    For example, to find the shortest of the first 10 plans:
+        min(iter_plans(state, todo_list, limit=10), key=len)
+    """
+    planner = Planner(domain, None, tracer, transposition_table, max_nodes, \
+                      max_depth, time_limit, cpu_time_limit)
+    return planner.iter_plans(state, todo_list, limit)
 
 
 def pyhop(state, todo_list):
     if verbose > 0:
-        print("""
+        _print("""
         >> The function 'pyhop' exists to provide backward compatibility
         >> with Pyhop. In the future, please use find_plan instead.""")
     return find_plan(state, todo_list)
@@ -822,35 +3563,425 @@ def pyhop(state, todo_list):
 
 def seek_plan(state, todo_list, plan, depth):
     """
-    Workhorse for find_plan. Arguments:
+    Workhorse for find_plan's recursive search engine. Arguments:
      - state is the current state
      - todo_list is the current list of goals, tasks, and actions
      - plan is the current partial plan
      - depth is the recursion depth, for use in debugging
     """
-    if verbose >= 2: 
-        todo_string = '[' + ', '.join([_item_to_string(x) for x in todo_list]) + ']'
-        print(f'depth {depth} todo_list ' + todo_string)
-    if todo_list == []:
-        if verbose >= 3:
-            print(f'depth {depth} no more tasks or goals, return plan')
+    return Planner()._search(_seek_plan, state, todo_list, plan, depth)
+
+
+def _seek_plan(planner, state, todo, plan, depth):
+    """
+    seek_plan's recursive search, on a to-do list and partial plan that are
+    linked lists. It returns the solution plan as a linked list, or False.
+    """
+    trace = planner.trace
+    if trace:
+        trace('node', depth, todo)
+    if not planner._visit(depth, todo, plan):
+        return False
+    if todo is None:
+        if trace:
+            trace('solved', depth)
+        planner.solutions += 1
         return plan
-    item1 = todo_list[0]
-    ttype = get_type(item1)
-    if ttype in {'Multigoal'}:
-        return _refine_multigoal_and_continue(state, item1, todo_list[1:], plan, depth)
-    elif ttype in {'list','tuple'}:
-        if item1[0] in current_domain._action_dict:
-            return _apply_action_and_continue(state, item1, todo_list[1:], plan, depth)
-        elif item1[0] in current_domain._task_method_dict:
-            return _refine_task_and_continue(state, item1, todo_list[1:], plan, depth)
-        elif item1[0] in current_domain._unigoal_method_dict:
-            return _refine_unigoal_and_continue(state, item1, todo_list[1:], plan, depth)
-    raise Exception(    \
-        f"depth {depth}: {item1} isn't an action, task, unigoal, or multigoal\n")
+    table = planner.transposition_table
+    if table is not None:
+        key = table._key(state, todo)
+        if table._known_failure(key):
+            if trace:
+                trace('pruned', depth)
+            return False
+        cutoffs = planner.cutoffs
+    # This is _seek_first's loop, written out so that each level of the
+    # search uses only one Python stack frame.
+    for (state1, todo1, plan1, depth1) in _successors(planner, state, todo, plan, depth):
+        result = _seek_plan(planner, state1, todo1, plan1, depth1)
+        if result != False:
+            return result
+        planner.stats.backtracks += 1
+    # a node whose subtree was cut off by max_depth might not really fail
+    if table is not None and planner.cutoffs == cutoffs:
+        table._record_failure(key)
     return False
 
 
+def seek_plan_iteratively(state, todo_list, plan, depth):
+    """
+    Workhorse for find_plan's iterative search engine. It takes the same
+    arguments as seek_plan and returns the same result, but instead of
+    calling itself recursively, it keeps a stack of choice points.
+    """
+    return Planner()._search(_seek_plan_iteratively, state, todo_list, plan, depth)
+
+
+def _seek_plan_iteratively(planner, state, todo, plan, depth):
+    """
+    seek_plan_iteratively's search, on a to-do list and partial plan that are
+    linked lists. It returns the first plan that _iter_solutions finds, as a
+    linked list, or False.
+    """
+    return next(_iter_solutions(planner, state, todo, plan, depth), False)
+
+
+def _iter_solutions(planner, state, todo, plan, depth):
+    """
+    A generator for the plans below the node (state, todo, plan, depth), as
+    linked lists, in the order in which a backtracking search finds them.
+    Each choice point on its stack is a triple (successors, key, marker),
+    where successors is a generator for the search nodes that haven't been
+    tried yet, key is the TranspositionTable key of the node that the choice
+    point belongs to (or None if there's no table), and marker is the number
+    of depth cutoffs plus the number of plans found before the node was
+    expanded. When successors is exhausted, the search backtracks to the
+    choice point below it; if marker hasn't changed, the node has failed.
+    """
+    (trace, table, stats) = (planner.trace, planner.transposition_table, planner.stats)
+    found = 0
+    key = None
+    choice_points = [(iter([(state, todo, plan, depth)]), key, 0)]
+    while choice_points:
+        (successors, key, marker) = choice_points[-1]
+        node = next(successors, None)
+        if node is None:
+            choice_points.pop()
+            # a node whose subtree was cut off by max_depth might not really
+            # fail, and a node whose subtree contained a plan didn't fail
+            if key is not None and planner.cutoffs + found == marker:
+                table._record_failure(key)
+            if len(choice_points) > 1:
+                stats.backtracks += 1
+            continue
+        (state, todo, plan, depth) = node
+        if trace:
+            trace('node', depth, todo)
+        if not planner._visit(depth, todo, plan):
+            if len(choice_points) > 1:
+                stats.backtracks += 1
+            continue
+        if todo is None:
+            if trace:
+                trace('solved', depth)
+            found += 1
+            planner.solutions += 1
+            yield plan
+            continue
+        if table is not None:
+            key = table._key(state, todo)
+            if table._known_failure(key):
+                if trace:
+                    trace('pruned', depth)
+                if len(choice_points) > 1:
+                    stats.backtracks += 1
+                continue
+        choice_points.append((_successors(planner, state, todo, plan, depth), \
+                              key, planner.cutoffs + found))
+
+
+def _seek_plan_deepening(planner, state, todo, plan, depth):
+    """
+    The search engine that find_plan uses for iterative deepening. It calls
+    the search engine planner.engine repeatedly, with larger and larger
+    values of planner.max_depth or planner.max_plan_length (depending on
+    planner.iterative_deepening), and returns the first plan it finds, or
+    False. If the planner has no TranspositionTable, it gives it one.
+    """
+    engine = _search_engines[planner.engine]
+    name = 'max_depth' if planner.iterative_deepening == 'depth' else 'max_plan_length'
+    limit = getattr(planner, name)
+    if planner.transposition_table is None:
+        planner.transposition_table = TranspositionTable()
+    bound = 1 if name == 'max_depth' else 0
+    try:
+        while limit is None or bound <= limit:
+            setattr(planner, name, bound)
+            if planner.trace:
+                planner.trace('deepen', depth, planner.iterative_deepening, bound)
+            cutoffs = planner.cutoffs
+            result = engine(planner, state, todo, plan, depth)
+            if result != False or planner.cutoffs == cutoffs:
+                return result
+            bound += 1
+        return False
+    finally:
+        setattr(planner, name, limit)
+
+
+def _seek_best_plan(planner, state, todo, plan, depth):
+    """
+    The search engine that find_plan uses if it has a cost function. It's a
+    depth-first branch-and-bound search on a to-do list and partial plan
+    that are linked lists. It goes through the search space in the same
+    order as _iter_solutions, and each time it finds a plan that's cheaper
+    than the best one so far (the incumbent), it stores the plan and its
+    cost in planner.best_plan and planner.best_cost. It backtracks from
+    every node whose cost bound (the cost of its partial plan, plus
+    planner.lower_bound of its state and to-do list, if there is one) isn't
+    less than the incumbent's cost. It returns the last incumbent, or False.
+
+    Each choice point on the stack is a tuple
+        (successors, key, marker, state, plan, cost)
+    where successors, key, and marker are as in _iter_solutions, except that
+    marker also counts the nodes that were bounded; and state, plan, and
+    cost are the state, partial plan, and cost of the choice point's node.
+    """
+    (trace, table, stats) = (planner.trace, planner.transposition_table, planner.stats)
+    (cost, lower_bound) = (planner.cost, planner.lower_bound)
+    inconclusive = 0            # number of plans found and nodes bounded
+    key = None
+    choice_points = [(iter([(state, todo, plan, depth)]), key, 0, state, plan, 0)]
+    while choice_points:
+        (successors, key, marker, parent, parent_plan, g) = choice_points[-1]
+        node = next(successors, None)
+        if node is None:
+            choice_points.pop()
+            # a node whose subtree was cut off or bounded might not really
+            # fail, and a node whose subtree contained a plan didn't fail
+            if key is not None and planner.cutoffs + inconclusive == marker:
+                table._record_failure(key)
+            if len(choice_points) > 1:
+                stats.backtracks += 1
+            continue
+        (state, todo, plan, depth) = node
+        if plan is not parent_plan:
+            g = g + cost(parent, plan[0], state)
+        if trace:
+            trace('node', depth, todo)
+        if not planner._visit(depth, todo, plan):
+            if len(choice_points) > 1:
+                stats.backtracks += 1
+            continue
+        if planner.best_cost is not None:
+            bound = g
+            if lower_bound is not None and todo is not None:
+                bound += lower_bound(state, _from_linked(todo))
+            if bound >= planner.best_cost:
+                if trace:
+                    trace('bounded', depth, bound, planner.best_cost)
+                inconclusive += 1
+                if len(choice_points) > 1:
+                    stats.backtracks += 1
+                continue
+        if todo is None:
+            if trace:
+                trace('solved', depth)
+            (planner.best_plan, planner.best_cost) = (plan, g)
+            planner.solutions += 1
+            inconclusive += 1
+            continue
+        if table is not None:
+            key = table._key(state, todo)
+            if table._known_failure(key):
+                if trace:
+                    trace('pruned', depth)
+                if len(choice_points) > 1:
+                    stats.backtracks += 1
+                continue
+        choice_points.append((_successors(planner, state, todo, plan, depth), \
+                              key, planner.cutoffs + inconclusive, state, plan, g))
+    return planner.best_plan
+
+
+_search_engines = {'recursive': _seek_plan, 'iterative': _seek_plan_iteratively}
+
+
+################################################################################
+# Searching in parallel
+
+
+# In a worker process of a parallel search, the multiprocessing Event that
+# tells the worker to stop searching. Otherwise it's None.
+_cancel_event = None
+
+
+def _init_parallel_worker(cancel_event):
+    """Initialize a worker process for a parallel search."""
+    global _cancel_event
+    _cancel_event = cancel_event
+
+
+def _search_subtree(planner, state, todo_list, plan, depth):
+    """
+    In a worker process, search below one of the nodes of a parallel search,
+    using the planner's search engine. Return a tuple
+        (plan, stats, status, cutoffs, deepest, deepest_plan)
+    where plan is the plan or False, and the other items are the outcome of
+    the search, for Planner._merge.
+    """
+    result = planner._search(_search_engines[planner.engine], state, \
+                             todo_list, plan, depth)
+    return (result, planner.stats, planner.status, planner.cutoffs, \
+            planner.deepest, _plan_to_list(planner.deepest_plan))
+
+
+def _parallel_frontier(planner, state, todo, plan, depth):
+    """
+    Expand the search tree below the node (state, todo, plan, depth) until
+    it has branched planner.parallel_depth times, and return a list of the
+    search nodes at which to start the parallel searches, in the order in
+    which the sequential search would reach them. A level of the tree that
+    has only one node doesn't count as branching.
+    """
+    trace = planner.trace
+    nodes = [(state, todo, plan, depth)]
+    levels = planner.parallel_depth
+    while levels > 0:
+        expanded = []
+        for node in nodes:
+            (state, todo, plan, depth) = node
+            if todo is None:
+                expanded.append(node)
+                continue
+            if trace:
+                trace('node', depth, todo)
+            if planner._visit(depth, todo, plan):
+                expanded.extend(_successors(planner, state, todo, plan, depth))
+        nodes = expanded
+        if all([todo is None for (state, todo, plan, depth) in nodes]):
+            break
+        if len(nodes) > 1:
+            levels -= 1
+    return nodes
+
+
+def _seek_plan_in_parallel(planner, state, todo, plan, depth):
+    """
+    The search engine that find_plan uses if it has more than one worker. It
+    expands the top of the search tree itself (see _parallel_frontier), and
+    gives each node at the bottom of that part of the tree to a worker
+    process, which searches below it using planner.engine. Of the plans that
+    the workers find, it returns the one below the leftmost node, which is
+    the plan that the sequential search would find. As soon as it knows
+    which plan that is, it stops the other workers. The worker processes
+    belong to the planner (see Planner._worker_pool), so a planner's
+    searches all use the same ones.
+
+    The workers' nodes and time are limited by the planner's budgets, each
+    separately; in addition, the time limit applies to the whole search.
+    If a worker runs out of budget, the search stops with that status, even
+    if a worker to its right has found a plan, since the plan might not be
+    the one that the sequential search would find. The workers don't trace
+    anything.
+    """
+    import concurrent.futures
+    frontier = _parallel_frontier(planner, state, todo, plan, depth)
+    if frontier and frontier[0][1] is None:
+        if planner.trace:
+            planner.trace('solved', frontier[0][3])
+        return frontier[0][2]
+    if not frontier:
+        return False
+    worker = planner._worker_copy()
+    (executor, cancel_event) = planner._worker_pool()
+    cancel_event.clear()
+    futures = []
+    try:
+        futures = [executor.submit(_search_subtree, worker, state, \
+                                   _from_linked(todo), _plan_to_list(plan), depth) \
+                   for (state, todo, plan, depth) in frontier]
+        for future in futures:
+            timeout = None
+            if planner.deadline is not None:
+                timeout = max(0, planner.deadline - time.perf_counter())
+            try:
+                (result, *outcome) = future.result(timeout)
+            except concurrent.futures.TimeoutError:
+                raise _BudgetExceeded('time_limit')
+            planner._merge(*outcome)
+            if result != False:
+                return _linked_plan(result)
+            if planner.status is not None:
+                # the subtree might contain a plan that the worker didn't reach
+                raise _BudgetExceeded(planner.status)
+        return False
+    finally:
+        # stop the other workers, and wait for them so that they're ready
+        # for the planner's next search
+        for future in futures:
+            future.cancel()
+        cancel_event.set()
+        concurrent.futures.wait(futures)
+
+
+################################################################################
+# Planning for many problems
+
+
+# In a worker process of find_plans, the Planner to use for every problem.
+# It's sent to the worker once, when the worker starts.
+_batch_planner = None
+
+
+def _init_batch_worker(planner):
+    """Initialize a worker process for find_plans."""
+    global _batch_planner
+    _batch_planner = planner
+
+
+def _find_plan_in_worker(index, state, todo_list):
+    """Plan for find_plans' problem number 'index' in a worker process."""
+    return (index, _batch_planner.find_plan(state, todo_list, return_result=True))
+
+
+def find_plans(problems, workers=None, domain=None, engine=None, max_nodes=None, \
+               max_depth=None, time_limit=None, cpu_time_limit=None):
+    """
+    find_plans is a generator that plans for many problems in the same
+    domain, using a pool of worker processes. Arguments:
+     - 'problems' is a list or iterator of pairs (state, todo_list);
+     - 'workers' (optional) is the number of worker processes. It defaults
+       to the number of CPUs. If it is 1, find_plans plans for the problems
+       one at a time in the current process.
+     - 'domain' (optional) is the domain to use. It defaults to the value
+       of current_domain.
+     - 'engine', 'max_nodes', 'max_depth', 'time_limit', and
+       'cpu_time_limit' (optional) are as in find_plan. The budgets apply to
+       each problem separately.
+
+    For each problem, find_plans yields a pair (i, result), where i is the
+    problem's position in 'problems' and result is a PlanResult (see
+    find_plan). It yields them in the order in which the searches finish,
+    which may differ from the order of the problems. For example:
+        for (i, result) in find_plans(problems, workers=8, time_limit=300):
+            print(i, result.status, result.plan)
+
+    Each worker gets the domain once, when it starts. find_plans doesn't
+    print anything, regardless of the value of verbose, and it takes the
+    problems from 'problems' only as fast as the workers can use them.
+    """
+    planner = Planner(domain, engine, None, None, max_nodes, max_depth, \
+                      time_limit, cpu_time_limit, verbose=0)
+    if workers == None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for (i, (state, todo_list)) in enumerate(problems):
+            yield (i, planner.find_plan(state, todo_list, return_result=True))
+        return
+    # imported here, so that programs that don't use it don't pay for it
+    import concurrent.futures
+    executor = concurrent.futures.ProcessPoolExecutor(workers, \
+        initializer=_init_batch_worker, initargs=(planner._worker_copy(),))
+    try:
+        pending = set()
+        for (i, (state, todo_list)) in enumerate(problems):
+            pending.add(executor.submit(_find_plan_in_worker, i, state, todo_list))
+            # keep the workers busy, without reading all of the problems at once
+            if len(pending) >= 2*workers:
+                (done, pending) = concurrent.futures.wait(pending, \
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            (done, pending) = concurrent.futures.wait(pending, \
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 def _item_to_string(item):
     """Return a string representation of a task or goal."""
     ttype = get_type(item)
@@ -866,7 +3997,7 @@ def _item_to_string(item):
 # An actor
 
 
-def run_lazy_lookahead(state, todo_list, max_tries=10):
+def run_lazy_lookahead(state, todo_list, max_tries=10, repair=False, replan_log=None):
     """
     An adaptation of the run_lazy_lookahead algorithm from Ghallab et al.
     (2016), Automated Planning and Acting. It works roughly like this:
@@ -880,24 +4011,59 @@ def run_lazy_lookahead(state, todo_list, max_tries=10):
       - 'state' is a state;
       - 'todo_list' is a list of tasks, goals, and multigoals;
       - max_tries is a bound on how many times to execute the outer loop.
-      
+      - repair (optional): if it is True, then instead of planning for
+        todo_list from scratch each time, run_lazy_lookahead repairs the
+        previous plan (see below).
+      - replan_log (optional) is a list. For each time run_lazy_lookahead
+        plans, it appends a dictionary whose items are 'try' (the number of
+        the try), 'mode' ('plan', 'repair', or 'replan'), 'depth' (for
+        'repair', the depth of the search node where the repair started),
+        'latency' (the planning time in seconds), and 'plan_length'.
+
+    With repair=True, run_lazy_lookahead remembers the search nodes on the
+    path to the plan that it's executing. If the plan doesn't end with the
+    goals accomplished (e.g., a command fails), it re-enters the search at
+    the deepest of those nodes that come after the commands that have been
+    executed, i.e., the ones whose remaining to-do lists contain exactly
+    the rest of the plan's actions, and searches from there in the current
+    state. If that fails, it tries the next deepest node, and so on. The
+    verification tasks in the remaining to-do list are replaced by the
+    goals they verify, since a command may have undone them. If none of the
+    nodes work, it plans for todo_list from scratch ('replan'). It also
+    plans from scratch if a repaired plan's first command fails the same
+    way as the command that the repair was for, since repairing again would
+    just give a plan that starts with the same command.
+
     Note: whenever run_lazy_lookahead encounters an action for which there is
     no corresponding command definition, it uses the action definition instead.
     """
     
     if verbose >= 1: 
-        print(f"RLL> run_lazy_lookahead, verbose = {verbose}, max_tries = {max_tries}")
-        print(f"RLL> initial state: {state.__name__}")
-        print('RLL> To do:', todo_list)
-
+        _print(f"RLL> run_lazy_lookahead, verbose = {verbose}, max_tries = {max_tries}")
+        _print(f"RLL> initial state: {state.__name__}")
+        _print('RLL> To do:', todo_list)
+
+    path = None         # with repair, the search nodes on the path to the plan
+    executed = 0        # the number of the plan's commands that succeeded
+    failed = None       # the last action whose command failed
+    repeated = False    # whether it failed as the first command of a plan, again
     for tries in range(1,max_tries+1):
         if verbose >= 1: 
-            ordinals = {1:'st',2:'nd',3:'rd'}
-            if ordinals.get(tries):
-                print(f"RLL> {tries}{ordinals.get(tries)} call to find_plan:\n")
-            else:
-                print(f"RLL> {tries}th call to find_plan:\n")
-        plan = find_plan(state, todo_list)
+            _print(f"RLL> {tries}{_ordinal(tries)} call to find_plan:\n")
+        start_time = time.perf_counter()
+        if not repair:
+            (plan, mode, depth) = (find_plan(state, todo_list), 'plan', None)
+        else:
+            (plan, mode, depth, path) = _repair_plan(state, todo_list, path, \
+                                                     executed, repeated)
+        latency = time.perf_counter() - start_time
+        if replan_log is not None:
+            replan_log.append({'try': tries, 'mode': mode, 'depth': depth, \
+                               'latency': latency, \
+                               'plan_length': len(plan) if plan != False else None})
+        if repair and verbose >= 1:
+            where = f' at depth {depth}' if mode == 'repair' else ''
+            _print(f'RLL> {mode}{where} took {latency*1000:.3f} ms')
         if plan == False or plan == None:
             if verbose >= 1:
                 raise Exception(
@@ -905,60 +4071,406 @@ def run_lazy_lookahead(state, todo_list, max_tries=10):
             return state
         if plan == []:
             if verbose >= 1: 
-                print(f'RLL> Empty plan => success',
+                _print(f'RLL> Empty plan => success',
                       f'after {tries} calls to find_plan.')
             if verbose >= 2: state.display(heading='> final state')
             return state
+        executed = 0
+        repeated = False
         for action in plan:
             command_name = 'c_' + action[0]
             command_func = current_domain._command_dict.get(command_name)
             if command_func == None:
                 if verbose >= 1: 
-                    print(f'RLL> {command_name} not defined, using {action[0]} instead\n')
+                    _print(f'RLL> {command_name} not defined, using {action[0]} instead\n')
                 command_func = current_domain._action_dict.get(action[0])
                 
             if verbose >= 1:
-                print('RLL> Command:', [command_name] + list(action[1:]))
+                _print('RLL> Command:', [command_name] + list(action[1:]))
             new_state = _apply_command_and_continue(state, command_func, action[1:])
             if new_state == False:
                 if verbose >= 1: 
-                    print(f'RLL> WARNING: command {command_name} failed; will call find_plan.')
-                    break
+                    _print(f'RLL> WARNING: command {command_name} failed; will call find_plan.')
+                repeated = (executed == 0 and action == failed)
+                failed = action
+                break
             else:
                 if verbose >= 2: 
                     new_state.display()
                 state = new_state
+                executed += 1
         # if state != False then we're here because the plan ended
         if verbose >= 1 and state:
-            print(f'RLL> Plan ended; will call find_plan again.')
+            _print(f'RLL> Plan ended; will call find_plan again.')
+        if executed == len(plan):
+            failed = None
         
-    if verbose >= 1: print('RLL> Too many tries, giving up.')
+    if verbose >= 1: _print('RLL> Too many tries, giving up.')
     if verbose >= 2: state.display(heading='RLL> final state')
     return state
 
 
+def _repair_plan(state, todo_list, path, executed, from_scratch=False):
+    """
+    Plan for run_lazy_lookahead's repair mode. 'path' is the list of search
+    nodes that _PathRecorder recorded for the previous plan (or None if
+    there's no previous plan), and 'executed' is the number of its actions
+    whose commands succeeded. If from_scratch is True, don't try to repair
+    the previous plan. Return (plan, mode, depth, new_path), where mode and
+    depth are as in run_lazy_lookahead's replan_log. The searches use the
+    value of verbose, as find_plan does.
+    """
+    if path is not None and not from_scratch:
+        # the nodes whose partial plans are the executed actions, deepest first
+        for depth in reversed(range(len(path))):
+            (todo, _, plan_length) = path[depth]
+            if plan_length != executed:
+                continue
+            todo_list = [_unverify(item) for item in _from_linked(todo)]
+            recorder = _PathRecorder(state)
+            plan = Planner(tracer=recorder).find_plan(state, todo_list)
+            if plan != False:
+                return (plan, 'repair', depth, recorder.path)
+    recorder = _PathRecorder(state)
+    plan = Planner(tracer=recorder).find_plan(state, todo_list)
+    return (plan, 'plan' if path is None else 'replan', None, recorder.path)
+
+
+def _unverify(item):
+    """
+    If item is a verification task, return the goal it verifies; otherwise
+    return item.
+    """
+    if type(item) is tuple and item:
+        if item[0] == '_verify_g':
+            return item[2:5]
+        if item[0] == '_verify_mg':
+            return item[2]
+    return item
+
+
+class _PathRecorder():
+    """
+    A tracer (see the 'tracer' variable) that keeps track of the search nodes
+    on the path from the root of the search tree to the current node, for
+    run_lazy_lookahead's repair mode. After a successful search, r.path is
+    a list of triples (todo, state, plan_length) for the nodes on the path to
+    the plan, where r.path[d] is the node at depth d. It passes the events
+    to the 'tracer' variable's function, or to print_trace if verbose >= 2.
+    """
+
+    def __init__(self, state):
+        self.state = state      # the state at the root of the search tree
+        self.path = []
+        self.applied = None     # (depth, state) of the last action applied
+        self.forward = tracer or (print_trace if verbose >= 2 else None)
+
+    def __call__(self, event, depth, *args):
+        if event == 'node':
+            del self.path[depth:]
+            if depth == 0:
+                (state, plan_length) = (self.state, 0)
+            else:
+                (_, state, plan_length) = self.path[depth-1]
+                if self.applied is not None and self.applied[0] == depth-1:
+                    (state, plan_length) = (self.applied[1], plan_length + 1)
+            self.applied = None
+            self.path.append((args[0], state, plan_length))
+        elif event == 'applied':
+            self.applied = (depth, args[1])
+        if self.forward:
+            self.forward(event, depth, *args)
+
+
 def _apply_command_and_continue(state, command, args):
     """
     _apply_command_and_continue applies 'command' by retrieving its
     function definition and calling it on the arguments.
     """
     if verbose >= 3:
-        print(f"_apply_command_and_continue {command.__name__}, args = {args}")
+        _print(f"_apply_command_and_continue {command.__name__}, args = {args}")
     next_state = command(state.copy(),*args)
     if next_state:
         if verbose >= 3:
-            print('applied')
+            _print('applied')
             next_state.display()
         return next_state
     else:
         if verbose >= 3:
-            print('not applicable')
+            _print('not applicable')
         return False
 
 
+################################################################################
+# An asynchronous actor
+
+
+async def run_lazy_lookahead_async(state, todo_list, max_tries=10, execute=None, \
+                                   speculate=True, domain=None, replan_log=None):
+    """
+    An asyncio version of run_lazy_lookahead, for use when commands take a
+    while to finish, e.g., because they wait for a robot or a satellite to
+    move. Call it with 'await' inside a coroutine, or with asyncio.run:
+        new_state = asyncio.run(run_lazy_lookahead_async(state, todo_list))
+    The arguments 'state', 'todo_list', and 'max_tries' are as in
+    run_lazy_lookahead. The others are:
+      - 'execute' (optional) is a coroutine function that executes an
+        action: 'await execute(state, action)' should return the new state,
+        or False if the action's command failed. If it's None,
+        run_lazy_lookahead_async calls the domain's commands in the same way
+        as run_lazy_lookahead. A command may be either an ordinary function
+        or a coroutine function (async def c_...), and in the latter case
+        run_lazy_lookahead_async awaits it. For testing, 'execute' may be a
+        SimulatedExecutor.
+      - 'speculate' (optional): if it's True, then while each command is
+        running, run_lazy_lookahead_async calls find_plan (quietly, in
+        another thread) for the state that the command's action predicts
+        the command will produce. If the command does produce that state,
+        and then the next command fails or the plan ends, the call to
+        find_plan for the current state has already been done (or at least
+        started). A speculative call is stopped as soon as it's known that
+        it won't be needed.
+      - 'domain' (optional) is the domain to use; it defaults to the value
+        current_domain has when run_lazy_lookahead_async is called, so
+        changing current_domain afterward doesn't affect it.
+      - 'replan_log' (optional) is a list. For each plan that
+        run_lazy_lookahead_async uses, it appends a dictionary whose items
+        are 'try', 'mode' ('plan', or 'speculation' if it was found by a
+        speculative call), 'latency' (the time it waited for the plan, in
+        seconds), and 'plan_length'.
+
+    find_plan runs in a separate thread, so other asyncio tasks keep running
+    while it plans. Thus several actors can act at the same time, e.g.:
+        await asyncio.gather(run_lazy_lookahead_async(s1, todo1),
+                             run_lazy_lookahead_async(s2, todo2))
+    and each of them spends the time its commands take doing other actors'
+    commands and planning, rather than waiting. The commands of a single
+    plan are still executed one at a time, in order, since each one starts
+    in the state that the previous one produced.
+    """
+    import asyncio      # only the asynchronous actor needs asyncio
+    domain = current_domain if domain == None else domain
+    if execute == None:
+        execute = _command_executor(domain)
+
+    if verbose >= 1: 
+        _print(f"RLL> run_lazy_lookahead_async, verbose = {verbose}, max_tries = {max_tries}")
+        _print(f"RLL> initial state: {state.__name__}")
+        _print('RLL> To do:', todo_list)
+
+    # The speculative calls to find_plan (see _speculate): next_plan is the
+    # one for the current state, and in_flight is the one for the state that
+    # the command being executed should produce.
+    (next_plan, in_flight) = (None, None)
+    try:
+        for tries in range(1,max_tries+1):
+            start_time = time.perf_counter()
+            if next_plan != None and next_plan[0] == state:
+                if verbose >= 1:
+                    _print(f"RLL> {tries}{_ordinal(tries)} call to find_plan " + \
+                          "was done while executing:\n")
+                (plan, mode) = (await next_plan[1], 'speculation')
+                if verbose >= 1:
+                    _print('FP> result =',plan,'\n')
+            else:
+                if next_plan != None:
+                    _cancel_speculation(next_plan)      # its state was wrong
+                if verbose >= 1:
+                    _print(f"RLL> {tries}{_ordinal(tries)} call to find_plan:\n")
+                planner = Planner(domain=domain)
+                plan = await asyncio.to_thread(planner.find_plan, state, todo_list)
+                mode = 'plan'
+            next_plan = None
+            if replan_log is not None:
+                replan_log.append({'try': tries, 'mode': mode, \
+                                   'latency': time.perf_counter() - start_time, \
+                                   'plan_length': None if plan == False or plan == None \
+                                                  else len(plan)})
+            if plan == False or plan == None:
+                if verbose >= 1:
+                    raise Exception(
+                            f"run_lazy_lookahead_async: find_plan has failed")
+                return state
+            if plan == []:
+                if verbose >= 1: 
+                    _print(f'RLL> Empty plan => success',
+                          f'after {tries} calls to find_plan.')
+                if verbose >= 2: state.display(heading='> final state')
+                return state
+            for action in plan:
+                if speculate and tries < max_tries:
+                    in_flight = _speculate(domain, state, action, todo_list)
+                if verbose >= 1:
+                    _print('RLL> Command:', ['c_' + action[0]] + list(action[1:]))
+                new_state = await execute(state, action)
+                if new_state == False:
+                    if verbose >= 1: 
+                        _print(f'RLL> WARNING: command c_{action[0]} failed; will call find_plan.')
+                    # the state is still the one that next_plan is for
+                    if in_flight != None:
+                        _cancel_speculation(in_flight)
+                    in_flight = None
+                    break
+                else:
+                    if verbose >= 2: 
+                        new_state.display()
+                    state = new_state
+                    if next_plan != None:
+                        _cancel_speculation(next_plan)
+                    (next_plan, in_flight) = (in_flight, None)
+            # if state != False then we're here because the plan ended
+            if verbose >= 1 and state:
+                _print(f'RLL> Plan ended; will call find_plan again.')
+    finally:
+        # find_plan keeps running in its thread unless it's told to stop
+        for speculation in (next_plan, in_flight):
+            if speculation != None:
+                _cancel_speculation(speculation)
+
+    if verbose >= 1: _print('RLL> Too many tries, giving up.')
+    if verbose >= 2: state.display(heading='RLL> final state')
+    return state
+
+
+def _speculate(domain, state, action, todo_list):
+    """
+    For run_lazy_lookahead_async, start a speculative call to find_plan, in
+    another thread, for the state that 'action' predicts its command will
+    produce in 'state'. Return a triple (predicted_state, future,
+    cancel_event), where future is an asyncio future for find_plan's
+    result, or None if action isn't applicable in state.
+    """
+    import asyncio
+    predicted_state = _predict_state(domain, state, [action])
+    if not predicted_state:
+        return None
+    planner = Planner(domain=domain, verbose=0)
+    planner.cancel_event = threading.Event()
+    future = asyncio.ensure_future(asyncio.to_thread(planner.find_plan, \
+                                                     predicted_state, todo_list))
+    return (predicted_state, future, planner.cancel_event)
+
+
+def _cancel_speculation(next_plan):
+    """
+    Stop a speculative call to find_plan (see run_lazy_lookahead_async).
+    Cancelling the future doesn't stop the thread in which find_plan is
+    running, so this also sets the Planner's cancel_event.
+    """
+    (_, future, cancel_event) = next_plan
+    cancel_event.set()
+    future.cancel()
+
+
+def _ordinal(n):
+    """Return the suffix of the ordinal number for n, e.g., 'st' for 1."""
+    return {1:'st',2:'nd',3:'rd'}.get(n, 'th')
+
+
+def _command_executor(domain):
+    """
+    Return a coroutine function that executes an action in the same way as
+    run_lazy_lookahead does: by calling the action's command in 'domain',
+    or the action itself if the domain has no such command. If the command
+    returns an awaitable object (e.g., if it's a coroutine function), the
+    coroutine function awaits it.
+    """
+    async def execute(state, action):
+        command_name = 'c_' + action[0]
+        command_func = domain._command_dict.get(command_name)
+        if command_func == None:
+            if verbose >= 1: 
+                _print(f'RLL> {command_name} not defined, using {action[0]} instead\n')
+            command_func = domain._action_dict.get(action[0])
+        if verbose >= 3:
+            _print(f"_command_executor {command_func.__name__}, args = {action[1:]}")
+        next_state = command_func(state.copy(), *action[1:])
+        if isinstance(next_state, collections.abc.Awaitable):
+            next_state = await next_state
+        if next_state:
+            if verbose >= 3:
+                _print('applied')
+                next_state.display()
+            return next_state
+        else:
+            if verbose >= 3:
+                _print('not applicable')
+            return False
+    return execute
+
+
+def _predict_state(domain, state, plan):
+    """
+    Return the state that the actions in 'plan' produce when applied in
+    sequence, starting at 'state', or False if one of them isn't applicable.
+    """
+    for action in plan:
+        action_func = domain._action_dict.get(action[0])
+        if action_func == None:
+            return False
+        state = action_func(state.copy(), *action[1:])
+        if not state:
+            return False
+    return state
+
+
+class SimulatedExecutor():
+    """
+    e = SimulatedExecutor(domain, latency=0, failure_rate=0, seed=None)
+    creates a stand-in for a real execution platform, for testing
+    run_lazy_lookahead_async without one. Passing it as the 'execute'
+    argument makes each call 'await e(state, action)' do this:
+      - wait (using asyncio.sleep) for the action's latency. 'latency' is
+        either a number of seconds for every action, or a dictionary that
+        maps action names to numbers of seconds, in which case actions whose
+        names it doesn't contain take no time;
+      - with probability failure_rate, fail (i.e., return False). 'seed' is
+        a seed for the random number generator that decides this;
+      - otherwise, apply the action (not its command) in domain, which
+        defaults to current_domain, and return the new state, or False if
+        the action isn't applicable.
+    Afterward, e.executed and e.failed are the numbers of actions that the
+    executor applied and that failed, and e.busy_time is the total latency.
+    """
+
+    def __init__(self, domain=None, latency=0, failure_rate=0, seed=None):
+        import random
+        self.domain = current_domain if domain == None else domain
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self.executed = 0
+        self.failed = 0
+        self.busy_time = 0
+
+    def __repr__(self):
+        domain_name = self.domain.__name__ if self.domain else None
+        return f"<SimulatedExecutor {domain_name}, executed={self.executed}, " + \
+               f"failed={self.failed}>"
+
+    async def __call__(self, state, action):
+        import asyncio
+        if isinstance(self.latency, dict):
+            latency = self.latency.get(action[0], 0)
+        else:
+            latency = self.latency
+        await asyncio.sleep(latency)
+        self.busy_time += latency
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            self.failed += 1
+            return False
+        new_state = _predict_state(self.domain, state, [action])
+        if new_state:
+            self.executed += 1
+        else:
+            self.failed += 1
+        return new_state
+
+
 ###############################################################################
 # Print brief information about how to interpret the program's output
 
-print(f"\nImported GTPyhop version 1.0.")
-print(f"Messages from find_plan will be prefaced with 'FP>'.")
-print(f"Messages from run_lazy_lookahead will be prefaced with 'RLL>'.")
+if not quiet:
+    _print(f"\nImported GTPyhop version 1.0.")
+    _print(f"Messages from find_plan will be prefaced with 'FP>'.")
+    _print(f"Messages from run_lazy_lookahead will be prefaced with 'RLL>'.")